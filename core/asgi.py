@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+# Django advises against persistent connections under ASGI: async requests
+# run their queries on executor threads, each of which would hold its own
+# connection open for DB_CONN_MAX_AGE. Close them per request by default;
+# DB_POOL=True is the way to reuse connections here.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
 application = get_asgi_application()
@@ -0,0 +1,110 @@
+"""
+Read-through cache for per-customer data (customer rows and credit scores)
+and per-loan detail responses.
+
+Entries live in the default Django cache (Redis) with the configured TTL;
+Redis itself is capped with maxmemory and evicts least recently used keys.
+Cache failures never fail a request: the loader is used instead and the
+error is counted.
+"""
+import time
+from datetime import datetime
+from django.core.cache import cache
+from django.db import transaction
+from . import metrics
+
+
+def customer_key(customer_id):
+    return f'customer:{customer_id}'
+
+
+def credit_key(customer_id, year=None):
+    return f'credit:{customer_id}:{year or datetime.now().year}'
+
+
+def loan_key(loan_id):
+    return f'loan:{loan_id}'
+
+
+def read_through(namespace, key, loader, timeout=None):
+    """
+    Return the cached value for key, or call loader(), cache and return
+    its result. Exceptions raised by the loader are not cached.
+    """
+    start = time.perf_counter()
+    try:
+        value = cache.get(key)
+    except Exception:
+        metrics.incr(f'cache.{namespace}.errors')
+        return loader()
+    finally:
+        metrics.observe(f'cache.{namespace}.get', time.perf_counter() - start)
+
+    if value is not None:
+        metrics.incr(f'cache.{namespace}.hits')
+        metrics.record_cache(True)
+        return value
+
+    metrics.incr(f'cache.{namespace}.misses')
+    metrics.record_cache(False)
+    value = loader()
+    try:
+        if timeout is None:
+            cache.set(key, value)
+        else:
+            cache.set(key, value, timeout)
+    except Exception:
+        metrics.incr(f'cache.{namespace}.errors')
+    return value
+
+
+def _delete_keys(keys):
+    try:
+        cache.delete_many(keys)
+    except Exception:
+        metrics.incr('cache.invalidate.errors')
+
+
+def _invalidate(keys):
+    # Deleted now and again once the surrounding transaction commits, so a
+    # reader cannot re-cache the pre-commit state in between
+    if not keys:
+        return
+    _delete_keys(keys)
+    transaction.on_commit(lambda: _delete_keys(keys))
+
+
+def invalidate_customers(customer_ids):
+    """Drop cached customer rows and credit scores."""
+    keys = []
+    for customer_id in customer_ids:
+        keys.append(customer_key(customer_id))
+        keys.append(credit_key(customer_id))
+    _invalidate(keys)
+
+
+def invalidate_loans(loan_ids):
+    """Drop cached loan detail responses."""
+    _invalidate([loan_key(loan_id) for loan_id in loan_ids])
+
+
+def cache_stats():
+    """Hit ratio and lookup latency per cache namespace."""
+    snapshot = metrics.snapshot()
+    counters, timers = snapshot['counters'], snapshot['timers']
+    namespaces = {
+        name.split('.')[1] for name in counters if name.startswith('cache.')
+    }
+    stats = {}
+    for namespace in sorted(namespaces):
+        hits = counters.get(f'cache.{namespace}.hits', 0)
+        misses = counters.get(f'cache.{namespace}.misses', 0)
+        lookups = hits + misses
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'errors': counters.get(f'cache.{namespace}.errors', 0),
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'latency': timers.get(f'cache.{namespace}.get'),
+        }
+    return stats
@@ -0,0 +1,26 @@
+"""
+Connection reuse statistics for the configured databases.
+
+With DB_POOL enabled each process holds a psycopg connection pool and the
+pool's own counters (size, idle connections, queued requests, time spent
+waiting for a connection) are reported. Otherwise connections are
+persistent per thread and only the reuse settings are reported.
+"""
+from django.db import connections
+
+
+def pool_stats():
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        settings = connection.settings_dict
+        pool = connection.pool if connection.vendor == 'postgresql' else None
+        if pool is not None:
+            stats[alias] = {'pooled': True, **pool.get_stats()}
+        else:
+            stats[alias] = {
+                'pooled': False,
+                'conn_max_age': settings['CONN_MAX_AGE'],
+                'conn_health_checks': settings['CONN_HEALTH_CHECKS'],
+            }
+    return stats
@@ -0,0 +1,118 @@
+"""
+Idempotency-Key support for unsafe API endpoints.
+
+The first request with a given key runs normally and its response is stored
+in the cache for IDEMPOTENCY_KEY_TTL seconds. Retries with the same key and
+body get the stored response, headers included, back without re-running
+the view; a retry
+that arrives while the first request is still running gets 409, and reusing
+a key with a different path or body gets 422.
+"""
+import hashlib
+import logging
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+def _store_error(action, cache_key):
+    logger.warning("Idempotency store %s failed for %s", action, cache_key, exc_info=True)
+    metrics.incr('idempotency.errors')
+
+
+def _get(cache_key):
+    try:
+        return cache.get(cache_key)
+    except Exception:
+        _store_error('get', cache_key)
+        return None
+
+
+def _set(cache_key, value):
+    try:
+        cache.set(cache_key, value, settings.IDEMPOTENCY_KEY_TTL)
+    except Exception:
+        _store_error('set', cache_key)
+
+
+def _delete(cache_key):
+    try:
+        cache.delete(cache_key)
+    except Exception:
+        _store_error('delete', cache_key)
+
+
+def idempotent(scope):
+    """Decorate an APIView handler so it honours the Idempotency-Key header."""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.META.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return handler(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            cache_key = f'idempotency:{scope}:{key}'
+            fingerprint = hashlib.sha256(request.path.encode() + b'\n' + request.body).hexdigest()
+            in_progress = {'fingerprint': fingerprint, 'in_progress': True}
+
+            try:
+                claimed = cache.add(cache_key, in_progress, settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            except Exception:
+                # Without a store we cannot deduplicate; serve the request normally
+                _store_error('add', cache_key)
+                return handler(self, request, *args, **kwargs)
+
+            if not claimed:
+                stored = _get(cache_key)
+                if stored is None:
+                    return handler(self, request, *args, **kwargs)
+                if stored['fingerprint'] != fingerprint:
+                    return Response(
+                        {"error": "Idempotency-Key was already used with a different request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if stored.get('in_progress'):
+                    return Response(
+                        {"error": "A request with this Idempotency-Key is still being processed"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                metrics.incr(f'idempotency.{scope}.replays')
+                return Response(
+                    stored['data'], status=stored['status'],
+                    headers={**stored.get('headers', {}), 'Idempotent-Replayed': 'true'},
+                )
+
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except Exception:
+                _delete(cache_key)
+                raise
+
+            # Server errors are not stored so the client can retry them. A
+            # store failure here must not turn a committed write into a 500
+            if response.status_code >= 500:
+                _delete(cache_key)
+            else:
+                _set(cache_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                    # Headers the view set, e.g. Location on a 202; Content-Type is renegotiated
+                    'headers': {k: v for k, v in response.items() if k.lower() != 'content-type'},
+                })
+            return response
+        return wrapper
+    return decorator
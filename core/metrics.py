@@ -0,0 +1,166 @@
+"""
+Lightweight in-process counters and timers.
+
+Values are kept per process (each web or worker process has its own) and
+are meant for tuning and dashboards, not exact accounting.
+
+Work done on behalf of a single request (SQL queries, cache lookups) is
+additionally attributed to that request through a context variable, which
+follows the request into sync_to_async threads.
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timers = defaultdict(lambda: {'count': 0, 'total': 0.0, 'max': 0.0})
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name, seconds):
+    with _lock:
+        timer = _timers[name]
+        timer['count'] += 1
+        timer['total'] += seconds
+        timer['max'] = max(timer['max'], seconds)
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timers': {
+                name: {
+                    'count': timer['count'],
+                    'total_ms': round(timer['total'] * 1000, 3),
+                    'avg_ms': round(timer['total'] * 1000 / timer['count'], 3) if timer['count'] else 0,
+                    'max_ms': round(timer['max'] * 1000, 3),
+                }
+                for name, timer in _timers.items()
+            },
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_time: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+
+_current_request = ContextVar('request_stats', default=None)
+
+
+def start_request():
+    """Begin attributing queries and cache lookups to a new RequestStats."""
+    stats = RequestStats()
+    return stats, _current_request.set(stats)
+
+
+def end_request(token):
+    _current_request.reset(token)
+
+
+def record_query(seconds):
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += seconds
+
+
+def record_cache(hit):
+    stats = _current_request.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def _metric_name(name):
+    return 'credit_' + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text():
+    """
+    Render the current values in the Prometheus text exposition format.
+
+    Per-view request metrics (recorded as view.<name>.<kind>) become
+    labelled series; every other counter and timer is exported under its
+    own sanitized name.
+    """
+    with _lock:
+        counters = dict(_counters)
+        timers = {name: dict(timer) for name, timer in _timers.items()}
+
+    families = {}
+
+    def add(family, kind, labels, value, suffix=''):
+        samples = families.setdefault(family, (kind, []))[1]
+        label_text = ','.join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+        samples.append(f'{family}{suffix}{{{label_text}}} {value}' if label_text else f'{family}{suffix} {value}')
+
+    view_counters = {
+        'queries': ('credit_db_queries_total', {}),
+        'cache_hits': ('credit_cache_lookups_total', {'result': 'hit'}),
+        'cache_misses': ('credit_cache_lookups_total', {'result': 'miss'}),
+        'budget_exceeded': ('credit_query_budget_exceeded_total', {}),
+    }
+    view_timers = {
+        'handler': 'credit_http_request_duration_seconds',
+        'db': 'credit_db_query_duration_seconds',
+    }
+
+    for name, value in sorted(counters.items()):
+        parts = name.split('.')
+        if parts[0] == 'view' and len(parts) == 4 and parts[2] == 'responses':
+            add('credit_http_requests_total', 'counter', {'view': parts[1], 'status': parts[3]}, value)
+        elif parts[0] == 'view' and len(parts) == 3 and parts[2] in view_counters:
+            family, labels = view_counters[parts[2]]
+            add(family, 'counter', {'view': parts[1], **labels}, value)
+        else:
+            add(_metric_name(name) + '_total', 'counter', {}, value)
+
+    for name, timer in sorted(timers.items()):
+        parts = name.split('.')
+        if parts[0] == 'view' and len(parts) == 3 and parts[2] in view_timers:
+            family, labels = view_timers[parts[2]], {'view': parts[1]}
+        else:
+            family, labels = _metric_name(name) + '_seconds', {}
+        add(family, 'summary', labels, round(timer['total'], 6), '_sum')
+        add(family, 'summary', labels, timer['count'], '_count')
+
+    lines = []
+    for family, (kind, samples) in families.items():
+        lines.append(f'# TYPE {family} {kind}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,109 @@
+"""
+Per-request instrumentation.
+
+RequestMetricsMiddleware times each request and, through a database
+execute wrapper, counts the SQL queries it runs and the time spent in
+them, together with read-through cache hits and misses. The numbers are
+returned to the client in a Server-Timing header and aggregated per view
+(by URL name) for the /metrics endpoint.
+
+Views can be given a query budget in settings.QUERY_BUDGETS
+({url_name: max_queries}). A request over budget is logged and counted;
+with QUERY_BUDGET_RAISE enabled (the default under tests) it raises
+QueryBudgetExceeded instead, failing the test that made the request.
+"""
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def _record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(time.perf_counter() - start)
+
+
+def install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name or match.view_name) if match else 'unresolved'
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder, dispatch_uid='core.middleware.install_query_recorder')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        self._install()
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        self._install()
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    def _install(self):
+        # Connections opened before the middleware was loaded never sent
+        # connection_created to install_query_recorder.
+        for alias in connections:
+            install_query_recorder(connections[alias])
+
+    def _finish(self, request, response, stats, elapsed):
+        view = _view_name(request)
+        metrics.observe(f'view.{view}.handler', elapsed)
+        metrics.observe(f'view.{view}.db', stats.db_time)
+        metrics.incr(f'view.{view}.queries', stats.queries)
+        metrics.incr(f'view.{view}.cache_hits', stats.cache_hits)
+        metrics.incr(f'view.{view}.cache_misses', stats.cache_misses)
+        metrics.incr(f'view.{view}.responses.{response.status_code}')
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+            f'cache;desc="{stats.cache_hits} hits, {stats.cache_misses} misses"',
+            f'app;dur={elapsed * 1000:.2f}',
+        ])
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view)
+        if budget is not None and stats.queries > budget:
+            metrics.incr(f'view.{view}.budget_exceeded')
+            message = f"{view} ran {stats.queries} queries (budget {budget})"
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,139 @@
+"""
+JSON rendering through orjson.
+
+FastJSONRenderer is a drop-in JSONRenderer: same media type and format, so
+content negotiation (?format=json, Accept headers, the browsable API) works
+unchanged. When orjson is installed, compact output is produced by orjson,
+which is several times faster than the standard library encoder on the
+dict/list payloads our views return. Anything orjson cannot encode natively
+(Decimal, lazy translation strings, ...) and datetimes, which DRF writes
+with a trailing Z, go through DRF's encoder. Settings or indents orjson
+cannot reproduce, integers wider than 64 bits, and floats orjson spells
+differently (1e16 vs 1e+16, 1.5e-7 vs 1.5e-07) fall back to JSONRenderer.
+NaN and infinities are the one difference left: orjson writes them as null
+where JSONRenderer refuses them.
+
+NDJSONRenderer and CSVRenderer serve the export endpoints. Besides
+render(), they have a stream() method that encodes rows lazily, for
+StreamingHttpResponse bodies that never hold the whole result in memory.
+"""
+import csv
+import io
+import json
+import re
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_encoder = JSONEncoder()
+
+# Floats whose orjson spelling can differ from repr(): exponents, and small
+# numbers repr() writes in exponent form. Matches inside strings only cost
+# a fallback.
+_EXPONENT_FORMS = re.compile(rb'(?:^|[:,\[])\s*-?(?:\d+(?:\.\d+)?e|0\.0000)')
+
+
+def _orjson_dumps(data, option=0):
+    """orjson bytes equal to DRF's encoding of data, or None when they could differ."""
+    try:
+        ret = orjson.dumps(
+            data, default=_encoder.default,
+            option=option | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    except orjson.JSONEncodeError:
+        return None
+    if _EXPONENT_FORMS.search(ret):
+        return None
+    return ret
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent not in (None, 2):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = _orjson_dumps(data, orjson.OPT_INDENT_2 if indent else 0)
+        if ret is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Keep JSONRenderer's escaping of U+2028/U+2029 so output stays valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def _json_line(item):
+    ret = _orjson_dumps(item) if orjson is not None else None
+    if ret is not None:
+        return ret + b'\n'
+    return json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON, one object per line. stream() encodes rows
+    lazily for StreamingHttpResponse; render() handles ordinary responses
+    (a list renders one line per item, anything else a single line).
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join(_json_line(item) for item in items)
+
+    def stream(self, rows, fields, batch_size=1000):
+        """Encode (value, ...) tuples as objects keyed by fields, batch_size lines per chunk."""
+        for batch in _batched(rows, batch_size):
+            yield b''.join(_json_line(dict(zip(fields, row))) for row in batch)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV with a header row. stream() encodes rows lazily for
+    StreamingHttpResponse; render() handles a dict or a list of dicts.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        fields = list(items[0]) if items else []
+        return b''.join(self.stream(([item.get(f) for f in fields] for item in items), fields))
+
+    def stream(self, rows, fields, batch_size=1000):
+        """Encode (value, ...) tuples under a header row of fields, batch_size rows per chunk."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for batch in _batched(rows, batch_size):
+            writer.writerows(batch)
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode(self.charset)
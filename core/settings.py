@@ -10,7 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
+from celery.schedules import crontab
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,16 +48,32 @@ INSTALLED_APPS = [
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'creditdb',
-        'USER': 'credituser',
-        'PASSWORD': 'creditpass',
-        'HOST': 'db',
-        'PORT': 5432,
+        'NAME': config('POSTGRES_DB', default='creditdb'),
+        'USER': config('POSTGRES_USER', default='credituser'),
+        'PASSWORD': config('POSTGRES_PASSWORD', default='creditpass'),
+        'HOST': config('POSTGRES_HOST', default='db'),
+        'PORT': config('POSTGRES_PORT', default=5432, cast=int),
     }
 }
 
+# Either a psycopg connection pool shared by the threads of a process, or
+# persistent per-thread connections that are health-checked before reuse.
+# The two are mutually exclusive: Django requires CONN_MAX_AGE = 0 with a pool.
+if config('DB_POOL', default=False, cast=bool):
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -129,5 +148,118 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+CELERY_BEAT_SCHEDULE = {
+    'nightly-credit-score-snapshot': {
+        'task': 'loans.tasks.snapshot_credit_scores',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    # Picks up queued loan applications whose worker message was lost
+    'sweep-loan-applications': {
+        'task': 'loans.tasks.process_loan_applications',
+        'schedule': 60.0,
+    },
+}
+# Queued loan decisions run on their own queue so a burst of applications
+# does not hold up ingestion or snapshots (and vice versa)
+CELERY_TASK_ROUTES = {
+    'loans.tasks.process_loan_applications': {'queue': 'loan-applications'},
+    'loans.tasks.send_application_callback': {'queue': 'loan-applications'},
+}
+
+# Read-through cache for customer rows and credit scores. Redis is capped
+# with maxmemory/volatile-lru in docker-compose.yml, so cache entries (which
+# all carry a TTL) are evicted under memory pressure while Celery's broker
+# keys are not. CACHE_TIMEOUT is the per-entry TTL in seconds.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default='redis://redis:6379/1'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+        'KEY_PREFIX': 'credit-approval',
+    }
+}
+
+# Responses stored for Idempotency-Key retries expire after IDEMPOTENCY_KEY_TTL
+# seconds; an in-flight request holds its key for at most IDEMPOTENCY_LOCK_TIMEOUT
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Maximum SQL queries per request, by URL name. Requests over budget are
+# logged and counted in /metrics, or raise when QUERY_BUDGET_RAISE is set.
+QUERY_BUDGETS = {
+    'register-customer': 6,
+    'check-eligibility': 4,
+    'check-eligibility-batch': 4,
+    'create-loan': 13,
+    'view-loan': 1,
+    'view-customer-loans': 2,
+    'record-payment': 12,
+    'portfolio-outstanding': 2,
+    'loan-application': 1,
+    'async-check-eligibility': 4,
+    'async-create-loan': 13,
+    'async-view-loan': 1,
+}
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=False, cast=bool)
+
+# Tests use an in-process cache so entries never leak between test runs
+if sys.argv[1:2] == ['test'] or 'pytest' in sys.modules:
+    CACHES['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    QUERY_BUDGET_RAISE = True
+
+# Maximum number of applications accepted by /api/loans/check-eligibility/batch/
+LOANS_ELIGIBILITY_BATCH_MAX_SIZE = 10000
+
+# Page size for /api/loans/view-loans/<customer_id>/ (default and maximum ?limit=)
+LOANS_PAGE_SIZE = 100
+LOANS_MAX_PAGE_SIZE = 1000
+
+# create-loan locks the customer's summary row; waits longer than the
+# timeout are retried with exponential backoff (seconds) before failing
+LOANS_CREATE_LOCK_TIMEOUT_MS = 2000
+LOANS_CREATE_LOCK_RETRIES = 3
+LOANS_CREATE_LOCK_BACKOFF = 0.05
+
+# Seconds an eligibility quote from check-eligibility can be redeemed by create-loan
+LOANS_QUOTE_TTL = 300
+
+# Longest window, in months, accepted by /api/loans/portfolio/outstanding/
+LOANS_PORTFOLIO_MAX_MONTHS = 120
+
+# Queued create-loan (Prefer: respond-async): applications decided per
+# worker transaction, and the callback request timeout in seconds
+LOANS_APPLICATION_BATCH_SIZE = 500
+LOANS_APPLICATION_CALLBACK_TIMEOUT = 5
+# Hosts callback_url may point at, in ALLOWED_HOSTS syntax ('.partner.com'
+# matches subdomains). Empty disables callbacks.
+LOANS_APPLICATION_CALLBACK_HOSTS = config('LOANS_APPLICATION_CALLBACK_HOSTS', default='', cast=Csv())
+
+# /metrics, /api/metrics/cache/ and /api/metrics/db/ are served to staff
+# users, and to requests with "Authorization: Bearer <METRICS_TOKEN>" when
+# a token is set (for Prometheus scrapes)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Rows fetched per round trip by the streaming export endpoints (core/exports.py)
+EXPORT_CHUNK_SIZE = 2000
+
+# Nightly credit score snapshots (loans/snapshots.py). With
+# LOANS_ELIGIBILITY_FROM_SNAPSHOT the eligibility endpoints serve a
+# customer's score from a snapshot younger than CREDIT_SNAPSHOT_MAX_AGE
+# seconds whose inputs are unchanged.
+LOANS_ELIGIBILITY_FROM_SNAPSHOT = config('LOANS_ELIGIBILITY_FROM_SNAPSHOT', default=False, cast=bool)
+CREDIT_SNAPSHOT_MAX_AGE = 26 * 3600
+CREDIT_SNAPSHOT_KEEP_RUNS = 3
+CREDIT_SNAPSHOT_CHUNK_SIZE = 50000
+
+# Cache /api/loans/view-loan/<loan_id>/ responses per loan (invalidated when
+# the loan or its customer changes)
+LOANS_DETAIL_CACHE = config('LOANS_DETAIL_CACHE', default=True, cast=bool)
@@ -1,11 +1,15 @@
 
 from django.contrib import admin
 from django.urls import path, include
+from .views import CacheStatsView, DatabaseStatsView, prometheus_metrics
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/customers/', include('customers.urls')),
     path('api/loans/', include('loans.urls')), 
+    path('api/metrics/cache/', CacheStatsView.as_view(), name='cache-stats'),
+    path('api/metrics/db/', DatabaseStatsView.as_view(), name='db-stats'),
+    path('metrics', prometheus_metrics, name='prometheus-metrics'),
 ]
 
@@ -0,0 +1,45 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.permissions import BasePermission
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from .cache import cache_stats
+from .db import pool_stats
+from .metrics import prometheus_text
+
+
+def metrics_allowed(request):
+    """Staff users, or requests bearing METRICS_TOKEN (for scrapers), may read the metrics endpoints."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+class HasMetricsAccess(BasePermission):
+    def has_permission(self, request, view):
+        return metrics_allowed(request)
+
+
+class CacheStatsView(APIView):
+    permission_classes = [HasMetricsAccess]
+
+    def get(self, request):
+        return Response(cache_stats(), status=status.HTTP_200_OK)
+
+
+class DatabaseStatsView(APIView):
+    permission_classes = [HasMetricsAccess]
+
+    def get(self, request):
+        return Response(pool_stats(), status=status.HTTP_200_OK)
+
+
+def prometheus_metrics(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
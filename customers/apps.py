@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.core.management import call_command
 
 
@@ -11,9 +11,29 @@ def run_fix_sequences(sender, **kwargs):
         print(f"Auto sequence reset failed: {e}")
 
 
+def invalidate_customer_cache(sender, instance, **kwargs):
+    from core.cache import invalidate_customers
+
+    invalidate_customers([instance.pk])
+
+
+def invalidate_customer_loans_cache(sender, instance, created, **kwargs):
+    # Cached loan detail responses embed the customer; a new customer has no loans yet
+    if not created:
+        from core.cache import invalidate_loans
+        from loans.models import Loan
+
+        invalidate_loans(Loan.objects.filter(customer_id=instance.pk).values_list('loan_id', flat=True))
+
+
 class CustomersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customers'
 
     def ready(self):
         post_migrate.connect(run_fix_sequences, sender=self)
+
+        from .models import Customer
+        post_save.connect(invalidate_customer_cache, sender=Customer)
+        post_delete.connect(invalidate_customer_cache, sender=Customer)
+        post_save.connect(invalidate_customer_loans_cache, sender=Customer)
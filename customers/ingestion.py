@@ -0,0 +1,425 @@
+"""
+Bulk ingestion of customer and loan files (XLSX, CSV or Parquet).
+
+Files are streamed as fixed-size chunks so memory stays bounded by the chunk
+size. Each chunk is normalized column-wise with pandas and written with one
+upsert: on PostgreSQL it is streamed into a temporary staging table with
+COPY and merged with INSERT ... ON CONFLICT; other backends fall back to
+bulk_create(update_conflicts=True).
+
+Every row carries a fingerprint of its normalized source values
+(source_hash). In incremental mode rows whose fingerprint matches the
+stored one are dropped before the merge, so unchanged records are never
+rewritten. Amortization schedules are generated for every loan written,
+vectorized per chunk.
+
+Rows that would violate the tables' CHECK constraints (a blank loan amount
+or tenure, a negative salary, ...) are dropped before the merge and counted
+as rejected, so one bad cell cannot roll back the whole load.
+"""
+import io
+import logging
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.db import connection
+from core.cache import invalidate_customers, invalidate_loans
+from .models import Customer
+from loans.models import Loan
+from loans.schedules import build_schedules, save_schedules
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_FIELDS = [
+    'customer_id', 'first_name', 'last_name', 'age', 'phone_number',
+    'monthly_salary', 'approved_limit', 'current_debt',
+]
+
+LOAN_FIELDS = [
+    'loan_id', 'customer_id', 'loan_amount', 'tenure', 'interest_rate',
+    'monthly_repayment', 'emis_paid_on_time', 'start_date', 'end_date',
+]
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# Primary key column of each kind of file, after normalize_columns
+KEY_COLUMNS = {
+    'customers': 'customer_id',
+    'loans': 'loan_id',
+}
+
+# Source column (after normalize_columns) -> model field, where they differ
+LOAN_COLUMN_MAP = {
+    'monthly_payment': 'monthly_repayment',
+    'date_of_approval': 'start_date',
+}
+
+
+def _open_workbook(path):
+    from openpyxl import load_workbook
+
+    return load_workbook(path, read_only=True, data_only=True)
+
+
+def _read_excel_chunks(path, chunk_size, start, stop):
+    workbook = _open_workbook(path)
+    try:
+        sheet = workbook.active
+        header = next(sheet.iter_rows(max_row=1, values_only=True), None)
+        if header is None:
+            return
+        # Data row i (0-based) is sheet row i + 2, after the 1-based header row
+        rows = sheet.iter_rows(
+            min_row=start + 2, max_row=None if stop is None else stop + 1, values_only=True
+        )
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def _parquet_file(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet ingestion requires pyarrow to be installed")
+
+    return pq.ParquetFile(path)
+
+
+def _read_parquet_chunks(path, chunk_size, start, stop):
+    parquet = _parquet_file(path)
+
+    # Only decode the row groups that overlap [start, stop)
+    row_groups, first_row, offset = [], None, 0
+    for index in range(parquet.num_row_groups):
+        num_rows = parquet.metadata.row_group(index).num_rows
+        if offset + num_rows > start and (stop is None or offset < stop):
+            row_groups.append(index)
+            if first_row is None:
+                first_row = offset
+        offset += num_rows
+    if not row_groups:
+        return
+
+    position = first_row
+    for batch in parquet.iter_batches(batch_size=chunk_size, row_groups=row_groups):
+        df = batch.to_pandas()
+        low = max(start - position, 0)
+        high = len(df) if stop is None else min(stop - position, len(df))
+        position += len(df)
+        if low < high:
+            yield df.iloc[low:high]
+
+
+def _read_csv_chunks(path, chunk_size, start, stop):
+    yield from pd.read_csv(
+        path,
+        chunksize=chunk_size,
+        skiprows=(lambda line: 0 < line <= start) if start else None,
+        nrows=None if stop is None else stop - start,
+    )
+
+
+def _reader(path):
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return _read_csv_chunks
+    elif suffix == '.parquet':
+        return _read_parquet_chunks
+    elif suffix in ('.xlsx', '.xlsm'):
+        return _read_excel_chunks
+    raise ValueError(f"Unsupported file type for ingestion: {path}")
+
+
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, start=0, stop=None):
+    """
+    Yield data rows [start, stop) of an XLSX, CSV or Parquet file as
+    DataFrames of at most chunk_size rows. Rows are counted from 0,
+    excluding the header.
+    """
+    yield from _reader(path)(path, chunk_size, start, stop)
+
+
+def count_rows(path):
+    """Number of data rows in a file, excluding the header; may include trailing blank sheet rows."""
+    reader = _reader(path)
+    if reader is _read_csv_chunks:
+        with open(path, 'rb') as f:
+            return max(sum(1 for _ in f) - 1, 0)
+    if reader is _read_parquet_chunks:
+        return _parquet_file(path).metadata.num_rows
+    workbook = _open_workbook(path)
+    try:
+        sheet = workbook.active
+        max_row = sheet.max_row
+        if max_row is None:
+            max_row = sum(1 for _ in sheet.iter_rows(values_only=True))
+        return max(max_row - 1, 0)
+    finally:
+        workbook.close()
+
+
+def plan_shards(path, shard_size):
+    """Split a file's data rows into [start, stop) ranges of at most shard_size rows."""
+    total = count_rows(path)
+    return [(start, min(start + shard_size, total)) for start in range(0, total, shard_size)]
+
+
+def plan_keyed_shards(path, shard_size, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    plan_shards, plus the keys each shard must skip because a later shard
+    repeats them: [(start, stop, skip_keys)]. Every key is then written by
+    exactly one shard, the one holding its last row, so concurrent shards
+    never upsert the same row and the outcome matches a sequential load
+    (later rows win). Reads the file's key column once.
+    """
+    shards = plan_shards(path, shard_size)
+    keys, owners = [], []
+    for index, (start, stop) in enumerate(shards):
+        for chunk in read_chunks(path, chunk_size, start, stop):
+            column = normalize_columns(chunk)[key].dropna().astype('int64').to_numpy()
+            keys.append(column)
+            owners.append(np.full(len(column), index))
+    if not keys:
+        return [(start, stop, []) for start, stop in shards]
+
+    keys, owners = np.concatenate(keys), np.concatenate(owners)
+    last_owner = pd.Series(owners).groupby(keys).transform('max').to_numpy()
+    superseded = pd.DataFrame({'key': keys, 'owner': owners})[owners < last_owner].drop_duplicates()
+    skip = superseded.groupby('owner')['key'].apply(lambda column: sorted(column.tolist())).to_dict()
+    return [(start, stop, skip.get(index, [])) for index, (start, stop) in enumerate(shards)]
+
+
+def drop_keys(df, key, skip_keys):
+    """Rows of df whose key is not in skip_keys."""
+    df = normalize_columns(df)
+    return df[~df[key].isin(skip_keys)] if len(skip_keys) else df
+
+
+def normalize_columns(df):
+    df.columns = [col.strip().lower().replace(' ', '_') for col in df.columns]
+    return df
+
+
+def _with_defaults(df, defaults):
+    for column, value in defaults.items():
+        if column not in df.columns:
+            df[column] = value
+    return df
+
+
+def prepare_customers(df):
+    df = _with_defaults(normalize_columns(df), {
+        'first_name': '', 'last_name': '', 'age': None, 'phone_number': '',
+        'monthly_salary': 0, 'approved_limit': 0, 'current_debt': 0,
+    })
+    df = df[CUSTOMER_FIELDS].drop_duplicates('customer_id', keep='last')
+    df['customer_id'] = df['customer_id'].astype('int64')
+    df['first_name'] = df['first_name'].fillna('').astype(str)
+    df['last_name'] = df['last_name'].fillna('').astype(str)
+    df['age'] = pd.to_numeric(df['age'], errors='coerce').astype('Int64')
+    df['phone_number'] = df['phone_number'].fillna('').astype(str).str.replace(r'\.0$', '', regex=True)
+    df['monthly_salary'] = df['monthly_salary'].fillna(0).astype('int64')
+    df['approved_limit'] = df['approved_limit'].fillna(0).astype('int64')
+    df['current_debt'] = df['current_debt'].fillna(0).astype('float64')
+    return add_source_hash(df)
+
+
+def prepare_loans(df):
+    df = normalize_columns(df).rename(columns=LOAN_COLUMN_MAP)
+    df = _with_defaults(df, {
+        'loan_amount': 0, 'tenure': 0, 'interest_rate': 0,
+        'monthly_repayment': 0, 'emis_paid_on_time': 0,
+    })
+    # Later rows win for repeated loan ids, as with row-by-row upserts
+    df = df[LOAN_FIELDS].drop_duplicates('loan_id', keep='last')
+    df['loan_id'] = df['loan_id'].astype('int64')
+    df['customer_id'] = df['customer_id'].astype('int64')
+    df['loan_amount'] = df['loan_amount'].fillna(0).astype('float64')
+    df['tenure'] = df['tenure'].fillna(0).astype('int64')
+    df['interest_rate'] = df['interest_rate'].fillna(0).astype('float64')
+    df['monthly_repayment'] = df['monthly_repayment'].fillna(0).astype('float64')
+    df['emis_paid_on_time'] = df['emis_paid_on_time'].fillna(0).astype('int64')
+    df['start_date'] = pd.to_datetime(df['start_date']).dt.date
+    df['end_date'] = pd.to_datetime(df['end_date']).dt.date
+    return add_source_hash(df)
+
+
+def valid_customers(df):
+    """Mask of prepared customer rows that satisfy Customer's CHECK constraints."""
+    return (df['monthly_salary'] >= 0) & (df['approved_limit'] >= 0)
+
+
+def valid_loans(df):
+    """Mask of prepared loan rows that satisfy Loan's CHECK constraints."""
+    return (
+        (df['loan_amount'] > 0) & (df['tenure'] > 0) & (df['interest_rate'] >= 0)
+        & (df['monthly_repayment'] >= 0) & df['emis_paid_on_time'].between(0, df['tenure'])
+    )
+
+
+def drop_invalid(df, valid, key):
+    """Rows of df where valid holds, and how many were dropped; dropped keys are logged."""
+    rejected = df[key][~valid]
+    if len(rejected):
+        logger.warning(
+            "Skipping %d rows that violate table constraints (%s %s)",
+            len(rejected), key, ', '.join(map(str, rejected.head(20).tolist())),
+        )
+    return df[valid], len(rejected)
+
+
+def add_source_hash(df):
+    """Fingerprint each normalized row as 16 hex digits, computed column-wise."""
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    df['source_hash'] = hashes.map('{:016x}'.format)
+    return df
+
+
+def sum_counts(counts):
+    total = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+    for item in counts:
+        for key in total:
+            total[key] += item[key]
+    return total
+
+
+def _copy_from(cursor, sql, buffer):
+    """Run COPY ... FROM STDIN on a raw psycopg 3 or psycopg2 cursor."""
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    if is_psycopg3:
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+    else:
+        cursor.copy_expert(sql, buffer)
+
+
+def _copy_upsert(model, df, fields, incremental):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    staging = quote(f'{model._meta.db_table}_staging')
+    pk = quote(model._meta.pk.column)
+    column_names = [quote(model._meta.get_field(f).column) for f in fields]
+    columns = ', '.join(column_names)
+    updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in column_names if c != pk)
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMP TABLE {staging} AS SELECT {columns} FROM {table} WITH NO DATA')
+        _copy_from(cursor.cursor, f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+        unchanged = 0
+        if incremental:
+            cursor.execute(
+                f'DELETE FROM {staging} s USING {table} t '
+                f'WHERE t.{pk} = s.{pk} AND t."source_hash" = s."source_hash"'
+            )
+            unchanged = cursor.rowcount
+        cursor.execute(
+            f'SELECT count(*) FROM {staging} s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{pk} = s.{pk})'
+        )
+        inserted = cursor.fetchone()[0]
+
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} '
+            f'ON CONFLICT ({pk}) DO UPDATE SET {updates}'
+        )
+        written = cursor.rowcount
+        cursor.execute(f'DROP TABLE {staging}')
+    return {'inserted': inserted, 'updated': written - inserted, 'unchanged': unchanged}
+
+
+def _bulk_upsert(model, df, fields, incremental):
+    pk = model._meta.pk.name
+    existing = {
+        obj.pk: obj.source_hash
+        for obj in model.objects.only(pk, 'source_hash').in_bulk(df[pk].tolist()).values()
+    }
+    objs, unchanged = [], 0
+    for row in df.to_dict('records'):
+        if incremental and existing.get(row[pk]) == row['source_hash']:
+            unchanged += 1
+            continue
+        objs.append(model(**{f: (None if pd.isna(v) else v) for f, v in row.items()}))
+    model.objects.bulk_create(
+        objs,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=[pk],
+        update_fields=[f for f in fields if f != pk],
+    )
+    inserted = sum(1 for obj in objs if obj.pk not in existing)
+    return {'inserted': inserted, 'updated': len(objs) - inserted, 'unchanged': unchanged}
+
+
+def upsert_dataframe(model, df, fields, incremental=False):
+    """
+    Insert or update the rows of df with one merge statement. With
+    incremental=True rows whose source_hash is unchanged are skipped.
+    Returns inserted/updated/unchanged counts. Must run in a transaction.
+    """
+    if df.empty:
+        return sum_counts([])
+    if connection.vendor == 'postgresql':
+        return _copy_upsert(model, df, fields, incremental)
+    return _bulk_upsert(model, df, fields, incremental)
+
+
+def ingest_customers(df, incremental=False):
+    df = prepare_customers(df)
+    df, rejected = drop_invalid(df, valid_customers(df), 'customer_id')
+    counts = dict(upsert_dataframe(Customer, df, CUSTOMER_FIELDS + ['source_hash'], incremental), rejected=rejected)
+    customer_ids = df['customer_id'].tolist()
+    invalidate_customers(customer_ids)
+    invalidate_loans(Loan.objects.filter(customer_id__in=customer_ids).values_list('loan_id', flat=True))
+    return counts
+
+
+def ingest_loans(df, incremental=False):
+    df = prepare_loans(df)
+    df, rejected = drop_invalid(df, valid_loans(df), 'loan_id')
+    stored = pd.DataFrame(
+        Loan.objects.filter(pk__in=df['loan_id'].tolist()).values_list('loan_id', 'customer_id', 'source_hash'),
+        columns=['loan_id', 'customer_id', 'source_hash'],
+    ).set_index('loan_id')
+    changed = df
+    if incremental:
+        changed = df[df['loan_id'].map(stored['source_hash']) != df['source_hash']]
+    counts = dict(upsert_dataframe(Loan, df, LOAN_FIELDS + ['source_hash'], incremental), rejected=rejected)
+    save_schedules(build_schedules(
+        changed['loan_id'].to_numpy(), changed['loan_amount'].to_numpy(), changed['interest_rate'].to_numpy(),
+        changed['tenure'].to_numpy(), changed['emis_paid_on_time'].to_numpy(),
+    ))
+    # Loans that moved to another customer change the previous customer's
+    # credit too; callers rebuild the summaries of both (rebuild_loan_summaries)
+    invalidate_customers(set(df['customer_id'].tolist()) | set(stored['customer_id'].tolist()))
+    invalidate_loans(df['loan_id'].tolist())
+    return counts
+
+
+INGESTERS = {
+    'customers': ingest_customers,
+    'loans': ingest_loans,
+}
+
+
+def ingest_customer_file(path, chunk_size=DEFAULT_CHUNK_SIZE, incremental=False):
+    return sum_counts(ingest_customers(chunk, incremental) for chunk in read_chunks(path, chunk_size))
+
+
+def ingest_loan_file(path, chunk_size=DEFAULT_CHUNK_SIZE, incremental=False):
+    return sum_counts(ingest_loans(chunk, incremental) for chunk in read_chunks(path, chunk_size))
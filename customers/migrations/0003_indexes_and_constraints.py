@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.CheckConstraint(condition=models.Q(('monthly_salary__gte', 0)), name='customer_salary_non_negative'),
+        ),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.CheckConstraint(condition=models.Q(('approved_limit__gte', 0)), name='customer_approved_limit_non_negative'),
+        ),
+    ]
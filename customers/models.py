@@ -9,6 +9,18 @@ class Customer(models.Model):
     monthly_salary = models.IntegerField()
     approved_limit = models.IntegerField()
     current_debt = models.FloatField(default=0.0)
+    source_hash = models.CharField(
+        max_length=16, blank=True, default='', editable=False,
+        help_text="Fingerprint of the ingested source row"
+    )
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(monthly_salary__gte=0), name='customer_salary_non_negative'),
+            models.CheckConstraint(
+                condition=models.Q(approved_limit__gte=0), name='customer_approved_limit_non_negative'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -1,55 +1,148 @@
-import pandas as pd
-from celery import shared_task
-from .models import Customer
-from loans.models import Loan
-from datetime import datetime
+import uuid
+from celery import chord, shared_task
+from celery.result import AsyncResult
+from django.core.management import call_command
+from django.db import transaction
+from .ingestion import (
+    DEFAULT_CHUNK_SIZE, INGESTERS, KEY_COLUMNS, drop_keys, ingest_customer_file, ingest_loan_file,
+    plan_keyed_shards, read_chunks, sum_counts,
+)
+from loans.summary import rebuild_loan_summaries
+
+DEFAULT_SHARD_SIZE = 200000
+
+@shared_task
+def ingest_data(customer_path='/app/data/customer_data.xlsx',
+                loan_path='/app/data/loan_data.xlsx',
+                chunk_size=DEFAULT_CHUNK_SIZE,
+                incremental=False):
+    """
+    Load customer and loan files (XLSX, CSV or Parquet) chunk by chunk.
+    Either path may be None to load only the other file. With
+    incremental=True, rows unchanged since the last load are skipped.
+    """
+    customers = loans = sum_counts([])
+    with transaction.atomic():
+        if customer_path:
+            customers = ingest_customer_file(customer_path, chunk_size, incremental)
+        if loan_path:
+            loans = ingest_loan_file(loan_path, chunk_size, incremental)
+
+        # Loan summaries are derived data; rebuild them in one pass
+        summaries = 0
+        if loans['inserted'] or loans['updated']:
+            summaries = rebuild_loan_summaries()
+
+    # Ingested rows carry explicit ids; move the sequences past them once
+    # here so inserts from the API never need to touch them
+    call_command('fix_sequences')
+
+    return {"customers": customers, "loans": loans, "loan_summaries": summaries}
+
+
+@shared_task(bind=True)
+def ingest_shard(self, kind, path, start, stop, chunk_size=DEFAULT_CHUNK_SIZE, incremental=False, skip_keys=()):
+    """
+    Load rows [start, stop) of one file in its own transaction, reporting
+    progress as it goes. Rows whose key is in skip_keys are left to the
+    later shard that repeats them (see plan_keyed_shards).
+    """
+    counts = sum_counts([])
+    skipped = 0
+    with transaction.atomic():
+        for chunk in read_chunks(path, chunk_size, start, stop):
+            kept = drop_keys(chunk, KEY_COLUMNS[kind], skip_keys)
+            skipped += len(chunk) - len(kept)
+            counts = sum_counts([counts, INGESTERS[kind](kept, incremental)])
+            if self.request.id:
+                self.update_state(state='PROGRESS', meta={
+                    'kind': kind, 'path': path, 'start': start, 'stop': stop,
+                    'rows': sum(counts.values()) + skipped, 'total': stop - start, 'skipped': skipped, **counts,
+                })
+    return {'kind': kind, 'rows': sum(counts.values()) + skipped, 'total': stop - start, 'skipped': skipped, **counts}
+
+
+@shared_task
+def start_loan_shards(customer_results, loan_shards, finalize_id):
+    """Runs once every customer shard has committed, so loan rows can reference them."""
+    loan_tasks = [ingest_shard.si(*args).set(task_id=task_id) for task_id, args in loan_shards]
+    finalize = finalize_ingestion.s(customer_results).set(task_id=finalize_id)
+    if loan_tasks:
+        chord(loan_tasks)(finalize)
+    else:
+        finalize.apply_async(args=([],))
+
 
 @shared_task
-def ingest_data():
-    import pandas as pd
-    from .models import Customer
-    from loans.models import Loan
-    from datetime import datetime
-
-    # Helper to normalize column names
-    def normalize_columns(df):
-        df.columns = [col.strip().lower().replace(' ', '_') for col in df.columns]
-        return df
-
-    # Load customer data
-    customer_df = pd.read_excel('/app/data/customer_data.xlsx')
-    customer_df = normalize_columns(customer_df)
-
-    for _, row in customer_df.iterrows():
-        Customer.objects.update_or_create(
-            customer_id=row['customer_id'],
-            defaults={
-                'first_name': row.get('first_name', ''),
-                'last_name': row.get('last_name', ''),
-                'phone_number': row.get('phone_number', ''),
-                'monthly_salary': row.get('monthly_salary', 0),
-                'approved_limit': row.get('approved_limit', 0),
-                'current_debt': row.get('current_debt', 0),
-            }
-        )
-
-    # Load loan data
-    loan_df = pd.read_excel('/app/data/loan_data.xlsx')
-    loan_df = normalize_columns(loan_df)
-
-    for _, row in loan_df.iterrows():
-        Loan.objects.update_or_create(
-            loan_id=row['loan_id'],
-            defaults={
-                'customer_id': row['customer_id'],
-                'loan_amount': row.get('loan_amount', 0),
-                'tenure': row.get('tenure', 0),
-                'interest_rate': row.get('interest_rate', 0),
-                'monthly_repayment': row.get('monthly_payment', 0),
-                'emis_paid_on_time': row.get('emis_paid_on_time', 0),
-                'start_date': pd.to_datetime(row.get('date_of_approval')).date(),
-                'end_date': pd.to_datetime(row.get('end_date')).date(),
-            }
-        )
-
-    return "Data Ingestion Completed"
+def finalize_ingestion(loan_results, customer_results):
+    call_command('fix_sequences')
+    loans = sum_counts(loan_results)
+    summaries = 0
+    if loans['inserted'] or loans['updated']:
+        summaries = rebuild_loan_summaries()
+    return {
+        "customers": sum_counts(customer_results),
+        "loans": loans,
+        "loan_summaries": summaries,
+    }
+
+
+@shared_task
+def ingest_data_parallel(customer_path='/app/data/customer_data.xlsx',
+                         loan_path='/app/data/loan_data.xlsx',
+                         shard_size=DEFAULT_SHARD_SIZE,
+                         chunk_size=DEFAULT_CHUNK_SIZE,
+                         incremental=False):
+    """
+    Split both files into row-range shards and load them across the worker
+    pool: all customer shards in parallel, then all loan shards, then a
+    finalizer that fixes sequences and rebuilds loan summaries.
+
+    Returns the task ids of every shard and of the finalizer; pass the
+    result to ingestion_progress() to follow the run.
+    """
+    run_id = uuid.uuid4().hex
+
+    def shards(kind, path):
+        if not path:
+            return []
+        return [
+            (f'ingest-{run_id}-{kind}-{index}', (kind, path, start, stop, chunk_size, incremental, skip_keys))
+            for index, (start, stop, skip_keys) in enumerate(
+                plan_keyed_shards(path, shard_size, KEY_COLUMNS[kind], chunk_size)
+            )
+        ]
+
+    customer_shards = shards('customers', customer_path)
+    loan_shards = shards('loans', loan_path)
+    finalize_id = f'ingest-{run_id}-finalize'
+
+    start_loans = start_loan_shards.s(loan_shards, finalize_id)
+    customer_tasks = [ingest_shard.si(*args).set(task_id=task_id) for task_id, args in customer_shards]
+    if customer_tasks:
+        chord(customer_tasks)(start_loans)
+    else:
+        start_loans.apply_async(args=([],))
+
+    return {
+        "run_id": run_id,
+        "customer_shards": [task_id for task_id, _ in customer_shards],
+        "loan_shards": [task_id for task_id, _ in loan_shards],
+        "finalize": finalize_id,
+    }
+
+
+def ingestion_progress(run):
+    """Per-shard state and progress of a run started by ingest_data_parallel, read from the result backend."""
+    def shard_state(task_id):
+        result = AsyncResult(task_id)
+        info = result.info if isinstance(result.info, dict) else {}
+        return {"task_id": task_id, "state": result.state, "rows": info.get('rows'), "total": info.get('total')}
+
+    finalize = AsyncResult(run['finalize'])
+    return {
+        "customer_shards": [shard_state(task_id) for task_id in run['customer_shards']],
+        "loan_shards": [shard_state(task_id) for task_id in run['loan_shards']],
+        "state": finalize.state,
+        "result": finalize.result if finalize.successful() else None,
+    }
@@ -0,0 +1,13 @@
+"""
+Test helpers shared by the apps' test suites. Not imported by application code.
+"""
+from .models import Customer
+
+
+def make_customer(phone_number, **fields):
+    """Create a test customer; keyword arguments override the defaults."""
+    fields = {
+        'first_name': "Test", 'last_name': "Customer", 'age': 30,
+        'monthly_salary': 80000, 'approved_limit': 3000000, **fields,
+    }
+    return Customer.objects.create(phone_number=phone_number, **fields)
@@ -1,7 +1,32 @@
+import csv
+import json
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+from core.cache import credit_key
+from customers.ingestion import (
+    count_rows, ingest_customer_file, ingest_customers, ingest_loan_file, ingest_loans,
+    plan_keyed_shards, plan_shards, read_chunks,
+)
 from customers.models import Customer
+from customers.serializers import CustomerSerializer
+from customers.tasks import ingest_shard
+from customers.testing import make_customer
+from customers.views import PHONE_NUMBER_CONSTRAINT
+from loans.models import CustomerLoanSummary, Loan, LoanSchedule
+from loans.schedules import unpack_balances
+from loans.summary import rebuild_loan_summaries
+
 
 class CustomerTests(APITestCase):
     def test_register_customer(self):
@@ -17,6 +42,78 @@ class CustomerTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertIn('approved_limit', response.data)
         self.assertTrue(Customer.objects.filter(phone_number="9123456789").exists())
+        customer = Customer.objects.get(phone_number="9123456789")
+        self.assertEqual(response.json(), CustomerSerializer(customer).data)
+
+    def test_register_customer_duplicate_phone(self):
+        url = reverse('register-customer')
+        data = {
+            "first_name": "Test",
+            "last_name": "User",
+            "age": 30,
+            "monthly_income": 60000,
+            "phone_number": "9123456700"
+        }
+        self.assertEqual(self.client.post(url, data, format='json').status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("already exists", response.data["error"])
+        self.assertEqual(Customer.objects.filter(phone_number="9123456700").count(), 1)
+
+    def test_register_customer_other_integrity_error(self):
+        url = reverse('register-customer')
+        data = {
+            "first_name": "Test",
+            "last_name": "User",
+            "age": 30,
+            "monthly_income": 60000,
+            "phone_number": "9123456733"
+        }
+        self.assertEqual(self.client.post(url, data, format='json').status_code, status.HTTP_201_CREATED)
+
+        def violation(constraint_name):
+            cause = Exception("violates constraint")
+            cause.diag = SimpleNamespace(constraint_name=constraint_name)
+            exc = IntegrityError("violates constraint")
+            exc.__cause__ = cause
+            return exc
+
+        # Only the phone number constraint is reported as a duplicate, even
+        # when a customer with that phone number happens to exist
+        for constraint_name, expected in (
+            ('customer_salary_non_negative', status.HTTP_500_INTERNAL_SERVER_ERROR),
+            (PHONE_NUMBER_CONSTRAINT, status.HTTP_400_BAD_REQUEST),
+        ):
+            with self.subTest(constraint_name), \
+                    mock.patch.object(Customer.objects, 'create', side_effect=violation(constraint_name)):
+                response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, expected)
+
+    def test_register_customer_idempotency_key(self):
+        url = reverse('register-customer')
+        data = {
+            "first_name": "Test",
+            "last_name": "User",
+            "age": 30,
+            "monthly_income": 60000,
+            "phone_number": "9123456711"
+        }
+        first = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='signup-1')
+        retry = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='signup-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data['customer_id'], first.data['customer_id'])
+
+    def test_register_customer_negative_income(self):
+        url = reverse('register-customer')
+        data = {
+            "first_name": "Test",
+            "last_name": "User",
+            "age": 30,
+            "monthly_income": -100,
+            "phone_number": "9123456722"
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_register_customer_missing_income(self):
         """Test registration with missing monthly_income"""
@@ -30,3 +127,220 @@ class CustomerTests(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("monthly_income", response.data.get("error", ""))
+
+
+class ExportCustomersTests(APITestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('exports', is_staff=True))
+        self.customers = [
+            make_customer(
+                f"98765430{i:02d}", last_name=f"Customer {i}", age=30 + i,
+                monthly_salary=50000, approved_limit=1800000,
+            )
+            for i in range(3)
+        ]
+
+    def test_ndjson_by_default(self):
+        response = self.client.get(reverse('export-customers'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('customers.ndjson', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['customer_id'] for row in rows], [c.customer_id for c in self.customers])
+        self.assertEqual(rows[0]['last_name'], "Customer 0")
+
+    def test_csv_resumes_after_id(self):
+        response = self.client.get(
+            reverse('export-customers'), {'format': 'csv', 'after': self.customers[0].customer_id}
+        )
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([int(row['customer_id']) for row in rows], [c.customer_id for c in self.customers[1:]])
+        self.assertEqual(rows[0]['approved_limit'], '1800000')
+
+        response = self.client.get(reverse('export-customers'), {'after': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('export-customers')).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_login(User.objects.create_user('partner'))
+        self.assertEqual(self.client.get(reverse('export-customers')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class IngestionTests(TestCase):
+    def setUp(self):
+        self.customer_df = pd.read_excel(settings.BASE_DIR / 'data' / 'customer_data.xlsx')
+        self.loan_df = pd.read_excel(settings.BASE_DIR / 'data' / 'loan_data.xlsx')
+
+    def test_ingest_is_idempotent(self):
+        loan_count = self.loan_df['Loan ID'].nunique()
+        customers = ingest_customers(self.customer_df.copy())
+        loans = ingest_loans(self.loan_df.copy())
+        self.assertEqual(customers, {'inserted': 300, 'updated': 0, 'unchanged': 0, 'rejected': 0})
+        self.assertEqual(loans, {'inserted': loan_count, 'updated': 0, 'unchanged': 0, 'rejected': 0})
+
+        customers = ingest_customers(self.customer_df.copy())
+        self.assertEqual(customers, {'inserted': 0, 'updated': 300, 'unchanged': 0, 'rejected': 0})
+
+        self.assertEqual(Customer.objects.count(), 300)
+        self.assertEqual(Loan.objects.count(), loan_count)
+
+        first = self.customer_df.iloc[0]
+        customer = Customer.objects.get(pk=first['Customer ID'])
+        self.assertEqual(customer.phone_number, str(first['Phone Number']))
+        self.assertEqual(customer.approved_limit, first['Approved Limit'])
+
+    def test_incremental_skips_unchanged_rows(self):
+        ingest_customers(self.customer_df.copy())
+        changed = self.customer_df.copy()
+        changed.loc[0, 'Monthly Salary'] += 1000
+        extra = changed.iloc[[0]].copy()
+        extra['Customer ID'] = 1000
+        extra['Phone Number'] = 9000000000
+        changed = pd.concat([changed, extra])
+
+        counts = ingest_customers(changed, incremental=True)
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 299, 'rejected': 0})
+        customer_id = self.customer_df.loc[0, 'Customer ID']
+        self.assertEqual(
+            Customer.objects.get(pk=customer_id).monthly_salary,
+            self.customer_df.loc[0, 'Monthly Salary'] + 1000
+        )
+
+    def test_rows_violating_constraints_are_rejected(self):
+        ingest_customers(self.customer_df)
+        loans = self.loan_df.drop_duplicates('Loan ID').head(5).copy()
+        loans['Tenure'] = loans['Tenure'].astype('float64')
+        loans.iloc[1, loans.columns.get_loc('Tenure')] = None
+        blank = loans.iloc[1]['Loan ID']
+
+        with self.assertLogs('customers.ingestion', 'WARNING'):
+            counts = ingest_loans(loans)
+        self.assertEqual(counts, {'inserted': 4, 'updated': 0, 'unchanged': 0, 'rejected': 1})
+        self.assertFalse(Loan.objects.filter(pk=blank).exists())
+        self.assertEqual(LoanSchedule.objects.count(), 4)
+
+    def test_repeated_loan_ids_keep_last_row(self):
+        ingest_customers(self.customer_df)
+        ingest_loans(self.loan_df.copy())
+
+        last = self.loan_df.drop_duplicates('Loan ID', keep='last').set_index('Loan ID')
+        loan_id = self.loan_df[self.loan_df['Loan ID'].duplicated()]['Loan ID'].iloc[0]
+        loan = Loan.objects.get(pk=loan_id)
+        self.assertEqual(loan.customer_id, last.loc[loan_id, 'Customer ID'])
+        self.assertEqual(loan.monthly_repayment, last.loc[loan_id, 'Monthly payment'])
+
+    def test_reassigned_loan_moves_between_summaries(self):
+        ingest_customers(self.customer_df)
+        loans = self.loan_df.drop_duplicates('Loan ID', keep='last')
+        ingest_loans(loans.copy())
+        rebuild_loan_summaries()
+
+        old_customer, new_customer = loans['Customer ID'].value_counts().index[:2]
+        moved = loans[loans['Customer ID'] == old_customer].iloc[[0]].copy()
+        before = {
+            summary.customer_id: summary.loan_count
+            for summary in CustomerLoanSummary.objects.filter(customer_id__in=[old_customer, new_customer])
+        }
+        cache.set(credit_key(old_customer), 'stale')
+
+        moved['Customer ID'] = new_customer
+        ingest_loans(moved.copy())
+        rebuild_loan_summaries()
+
+        self.assertEqual(Loan.objects.get(pk=moved.iloc[0]['Loan ID']).customer_id, new_customer)
+        summaries = CustomerLoanSummary.objects.in_bulk([old_customer, new_customer])
+        self.assertEqual(summaries[old_customer].loan_count, before[old_customer] - 1)
+        self.assertEqual(summaries[new_customer].loan_count, before[new_customer] + 1)
+        self.assertIsNone(cache.get(credit_key(old_customer)))
+
+    def test_ingest_generates_schedules(self):
+        ingest_customers(self.customer_df)
+        ingest_loans(self.loan_df.copy())
+        self.assertEqual(LoanSchedule.objects.count(), Loan.objects.count())
+
+        schedule = LoanSchedule.objects.select_related('loan').first()
+        balances = unpack_balances(schedule.balances)
+        self.assertEqual(len(balances), schedule.loan.tenure)
+        self.assertEqual(balances[-1], 0)
+        self.assertEqual(schedule.installments_paid, schedule.loan.emis_paid_on_time)
+
+        # Unchanged rows keep their recorded payments on an incremental reload
+        LoanSchedule.objects.filter(pk=schedule.pk).update(installments_paid=0)
+        ingest_loans(self.loan_df.copy(), incremental=True)
+        self.assertEqual(LoanSchedule.objects.get(pk=schedule.pk).installments_paid, 0)
+
+    def test_chunked_csv_matches_excel(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            customer_csv = Path(tmp) / 'customers.csv'
+            loan_csv = Path(tmp) / 'loans.csv'
+            self.customer_df.to_csv(customer_csv, index=False)
+            self.loan_df.to_csv(loan_csv, index=False)
+
+            self.assertEqual(ingest_customer_file(customer_csv, chunk_size=64)['inserted'], 300)
+            ingest_loan_file(loan_csv, chunk_size=100)
+
+        ingested = {loan.loan_id: loan.monthly_repayment for loan in Loan.objects.all()}
+        expected = self.loan_df.drop_duplicates('Loan ID', keep='last')
+        self.assertEqual(ingested, dict(zip(expected['Loan ID'], expected['Monthly payment'])))
+
+    def test_read_excel_in_chunks(self):
+        path = settings.BASE_DIR / 'data' / 'customer_data.xlsx'
+        sizes = [len(chunk) for chunk in read_chunks(path, chunk_size=128)]
+        self.assertEqual(sizes, [128, 128, 44])
+
+    def test_unsupported_file_type(self):
+        with self.assertRaises(ValueError):
+            next(read_chunks('customers.json'))
+
+    def test_shards_cover_every_row_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            loan_csv = Path(tmp) / 'loans.csv'
+            self.loan_df.to_csv(loan_csv, index=False)
+            loan_xlsx = settings.BASE_DIR / 'data' / 'loan_data.xlsx'
+
+            for path in (loan_csv, loan_xlsx):
+                shards = plan_shards(path, 250)
+                self.assertEqual(shards[0], (0, 250))
+                self.assertEqual(shards[-1][1], count_rows(path))
+                loan_ids = [
+                    loan_id
+                    for start, stop in shards
+                    for chunk in read_chunks(path, 100, start, stop)
+                    for loan_id in chunk['Loan ID']
+                ]
+                self.assertEqual(loan_ids, list(self.loan_df['Loan ID']))
+
+    def test_ingest_shards(self):
+        path = settings.BASE_DIR / 'data' / 'customer_data.xlsx'
+        results = [ingest_shard('customers', str(path), start, stop) for start, stop in plan_shards(path, 120)]
+        self.assertEqual(sum(result['inserted'] for result in results), 300)
+        self.assertEqual(Customer.objects.count(), 300)
+
+    def test_repeated_keys_are_written_by_one_shard(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            loan_csv = Path(tmp) / 'loans.csv'
+            self.loan_df.to_csv(loan_csv, index=False)
+            shards = plan_keyed_shards(loan_csv, 250, 'loan_id')
+
+            owners = {}
+            for index, (start, stop, skip_keys) in enumerate(shards):
+                for chunk in read_chunks(loan_csv, 100, start, stop):
+                    for loan_id in chunk['Loan ID']:
+                        if loan_id not in skip_keys:
+                            owners.setdefault(loan_id, set()).add(index)
+            self.assertEqual(set(owners), set(self.loan_df['Loan ID']))
+            self.assertTrue(all(len(shard_indexes) == 1 for shard_indexes in owners.values()))
+            self.assertTrue(any(skip_keys for _, _, skip_keys in shards))
+
+            ingest_customers(self.customer_df.copy())
+            for start, stop, skip_keys in reversed(shards):
+                ingest_shard('loans', str(loan_csv), start, stop, skip_keys=skip_keys)
+            sharded = dict(Loan.objects.values_list('loan_id', 'source_hash'))
+
+            Loan.objects.all().delete()
+            ingest_loan_file(loan_csv)
+            self.assertEqual(sharded, dict(Loan.objects.values_list('loan_id', 'source_hash')))
+
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import RegisterCustomerView
+from .views import ExportCustomersView, RegisterCustomerView
 
 urlpatterns = [
     path('register/', RegisterCustomerView.as_view(), name='register-customer'),
+    path('export/', ExportCustomersView.as_view(), name='export-customers'),
 ]
@@ -1,11 +1,24 @@
-from django.db import connection
+from core.cache import customer_key, read_through
+from .models import Customer
 
-def reset_customer_id_sequence():
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT setval(
-                pg_get_serial_sequence('"customers_customer"', 'customer_id'),
-                COALESCE((SELECT MAX(customer_id) FROM "customers_customer"), 1),
-                true
-            );
-        """)
+def get_customer(customer_id):
+    """Customer by primary key via the read-through cache. Raises Customer.DoesNotExist."""
+    return read_through('customer', customer_key(customer_id), lambda: Customer.objects.get(pk=customer_id))
+
+
+def customer_response(customer):
+    """
+    The CustomerSerializer fields as a plain dict, without instantiating the
+    serializer. Values are coerced as the serializer fields would, since a
+    freshly created instance still holds the raw request values.
+    """
+    return {
+        "customer_id": customer.customer_id,
+        "first_name": str(customer.first_name),
+        "last_name": str(customer.last_name),
+        "age": None if customer.age is None else int(customer.age),
+        "phone_number": str(customer.phone_number),
+        "monthly_salary": int(customer.monthly_salary),
+        "approved_limit": int(customer.approved_limit),
+        "current_debt": float(customer.current_debt),
+    }
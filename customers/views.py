@@ -1,13 +1,29 @@
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from core.exports import export_response
+from core.idempotency import idempotent
+from core.renderers import CSVRenderer, NDJSONRenderer
 from .models import Customer
-from .serializers import CustomerSerializer
-from .utils import reset_customer_id_sequence 
+from .utils import customer_response
 import math
 
+# Name PostgreSQL gives the unique=True constraint on Customer.phone_number
+PHONE_NUMBER_CONSTRAINT = 'customers_customer_phone_number_key'
+
+
+def _is_duplicate_phone(exc, phone_number):
+    diag = getattr(exc.__cause__, 'diag', None)
+    if diag is not None:
+        return diag.constraint_name == PHONE_NUMBER_CONSTRAINT
+    # Backends without constraint diagnostics (SQLite in development)
+    return Customer.objects.filter(phone_number=phone_number).exists()
+
+
 class RegisterCustomerView(APIView):
+    @idempotent('register')
     def post(self, request):
         data = request.data
 
@@ -23,32 +39,57 @@ class RegisterCustomerView(APIView):
             monthly_income = int(data.get('monthly_income'))
         except ValueError:
             return Response({"error": "monthly_income must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
-
-        if Customer.objects.filter(phone_number=data.get('phone_number')).exists():
-            return Response(
-                {"error": "Customer with this phone number already exists."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        reset_customer_id_sequence()
+        if monthly_income <= 0:
+            return Response({"error": "monthly_income must be greater than 0"}, status=status.HTTP_400_BAD_REQUEST)
 
         approved_limit = math.ceil((36 * monthly_income) / 100000) * 100000
 
+        # Rely on the unique constraint instead of a check-then-insert, so
+        # concurrent signups with the same phone number cannot both succeed
         try:
-            customer = Customer.objects.create(
-                first_name=data.get('first_name'),
-                last_name=data.get('last_name'),
-                age=data.get('age'),
-                phone_number=data.get('phone_number'),
-                monthly_salary=monthly_income,
-                approved_limit=approved_limit,
-                current_debt=0
-            )
+            with transaction.atomic():
+                customer = Customer.objects.create(
+                    first_name=data.get('first_name'),
+                    last_name=data.get('last_name'),
+                    age=data.get('age'),
+                    phone_number=data.get('phone_number'),
+                    monthly_salary=monthly_income,
+                    approved_limit=approved_limit,
+                    current_debt=0
+                )
         except IntegrityError as e:
+            if _is_duplicate_phone(e, data.get('phone_number')):
+                return Response(
+                    {"error": "Customer with this phone number already exists."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             return Response(
                 {"error": f"Database integrity error: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        serializer = CustomerSerializer(customer)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(customer_response(customer), status=status.HTTP_201_CREATED)
+
+
+class ExportCustomersView(APIView):
+    """
+    Streams every customer, ordered by customer_id, as NDJSON (default) or
+    CSV (?format=csv or Accept: text/csv). ?after= resumes after a customer_id.
+    """
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    # Bulk personal and financial data: staff only
+    permission_classes = [IsAdminUser]
+    fields = [
+        'customer_id', 'first_name', 'last_name', 'age', 'phone_number',
+        'monthly_salary', 'approved_limit', 'current_debt',
+    ]
+
+    def get(self, request):
+        customers = Customer.objects.order_by('customer_id')
+        after = request.query_params.get('after')
+        if after:
+            try:
+                customers = customers.filter(customer_id__gt=int(after))
+            except ValueError:
+                return Response({"error": "after must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(request, customers, self.fields, 'customers')
@@ -0,0 +1,82 @@
+"""
+Vectorized EMI and amortization kernels.
+
+These mirror loans.utils.calculate_emi over NumPy arrays so batch jobs
+(repricing, portfolio reports, bulk ingestion) can price many loans at once.
+"""
+from dataclasses import dataclass
+import numpy as np
+
+
+def calculate_emi_array(principal, annual_interest_rate, tenure_months):
+    """
+    Array version of calculate_emi. Inputs broadcast against each other;
+    EMIs are rounded to 2 decimals except for zero-rate loans, which
+    (like the scalar function) return the unrounded principal / n.
+    """
+    principal, annual_interest_rate, tenure_months = np.broadcast_arrays(
+        np.asarray(principal, dtype=np.float64),
+        np.asarray(annual_interest_rate, dtype=np.float64),
+        np.asarray(tenure_months, dtype=np.float64),
+    )
+    r = (annual_interest_rate / 100) / 12
+    n = tenure_months
+    growth = np.power(1 + r, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emi = np.round(principal * r * growth / (growth - 1), 2)
+        flat = principal / n
+    return np.where(r == 0, flat, emi)
+
+
+@dataclass(frozen=True)
+class AmortizationSchedule:
+    """
+    Month-by-month schedules, one row per loan and one column per month.
+    Columns past a loan's tenure are zero.
+    """
+    emi: np.ndarray
+    payment: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    balance: np.ndarray
+
+
+def amortization_schedule(principal, annual_interest_rate, tenure_months):
+    """
+    Amortization schedules for arrays of loans. The last installment absorbs
+    the rounding of the EMI so every schedule closes at a zero balance.
+    """
+    principal, annual_interest_rate, tenure_months = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(principal, dtype=np.float64)),
+        np.atleast_1d(np.asarray(annual_interest_rate, dtype=np.float64)),
+        np.atleast_1d(np.asarray(tenure_months, dtype=np.int64)),
+    )
+    emi = calculate_emi_array(principal, annual_interest_rate, tenure_months)
+    months = np.arange(1, int(tenure_months.max(initial=0)) + 1, dtype=np.float64)
+
+    r = ((annual_interest_rate / 100) / 12)[:, None]
+    p = principal[:, None]
+    e = emi[:, None]
+    n = tenure_months[:, None]
+
+    # Closed form outstanding balance after k installments
+    growth = np.power(1 + r, months)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        balance = np.where(r == 0, p - e * months, p * growth - e * (growth - 1) / r)
+    active = months <= n
+    balance = np.where(months < n, balance, 0.0)
+    balance = np.where(active, balance, 0.0)
+
+    opening = np.concatenate([p, balance[:, :-1]], axis=1)
+    interest = np.where(active, opening * r, 0.0)
+    payment = np.where(months < n, e, opening + interest)
+    payment = np.where(active, payment, 0.0)
+    principal_paid = payment - interest
+
+    return AmortizationSchedule(
+        emi=emi,
+        payment=payment,
+        interest=interest,
+        principal=principal_paid,
+        balance=balance,
+    )
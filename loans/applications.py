@@ -0,0 +1,273 @@
+"""
+Queued loan applications.
+
+create-loan with `Prefer: respond-async` stores a LoanApplication and
+answers 202 instead of deciding in the request. Workers then decide
+pending applications in batches with process_applications(): one
+SKIP LOCKED query claims up to LOANS_APPLICATION_BATCH_SIZE of the oldest,
+the customers and their loan summaries are loaded (summaries locked) in
+bulk, each application is decided in submission order against its
+customer's summary as updated by the approvals before it, and the new
+loans, their schedules, the summaries and the outcomes are written back in
+bulk. Concurrent workers claim disjoint batches. If a bulk write fails,
+the batch is redone one application at a time and any application that
+still cannot be written is marked failed, so it cannot block the queue.
+
+Once decided, an application with a callback_url is POSTed to it (see
+deliver_callback), with retries. Callback hosts must match
+LOANS_APPLICATION_CALLBACK_HOSTS, so clients cannot point the worker at
+internal services.
+"""
+import json
+import logging
+import urllib.error
+import urllib.request
+from datetime import datetime
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.http.request import validate_host
+from django.urls import reverse
+from django.utils import timezone
+from core import metrics
+from core.cache import invalidate_customers
+from customers.models import Customer
+from .models import CustomerLoanSummary, Loan, LoanApplication
+from .quotes import load_quote
+from .schedules import save_schedules, schedules_for_loans
+from .services import approved_loan, create_loan, decide_loan
+from .summary import add_loan_to_summary, lock_customer_summaries
+from .utils import validate_loan_terms
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ['loan_count', 'total_tenure', 'on_time_emis', 'total_loan_amount', 'total_emi', 'loans_per_year']
+
+
+def submit_application(customer, loan_amount, interest_rate, tenure, quote='', callback_url=''):
+    """Store a pending application and queue a worker run once it commits."""
+    application = LoanApplication.objects.create(
+        customer=customer,
+        loan_amount=loan_amount,
+        interest_rate=interest_rate,
+        tenure=tenure,
+        quote=quote or '',
+        callback_url=callback_url or '',
+    )
+    metrics.incr('loans.applications.submitted')
+    transaction.on_commit(_enqueue_processing)
+    return application
+
+
+def _enqueue_processing():
+    from .tasks import process_loan_applications
+
+    try:
+        process_loan_applications.delay()
+    except Exception:
+        # Left pending; the periodic sweep picks it up
+        metrics.incr('loans.applications.enqueue_errors')
+
+
+def application_response(application):
+    return {
+        "application_id": application.application_id,
+        "customer_id": application.customer_id,
+        "status": application.status,
+        "loan_id": application.loan_id,
+        "loan_approved": None if application.status == LoanApplication.PENDING
+        else application.status == LoanApplication.APPROVED,
+        "message": application.message,
+        "monthly_installment": application.monthly_installment,
+        "status_url": reverse('loan-application', args=[application.application_id]),
+    }
+
+
+def _invalid_reason(application):
+    # The request serializers already enforce these; rows written any other
+    # way must not reach the Loan CHECK constraints
+    if application.interest_rate < 0:
+        return "interest_rate must not be negative"
+    return validate_loan_terms(application.loan_amount, application.tenure)
+
+
+def _record(application, decided_at, status, message, monthly_installment=None, loan=None):
+    application.status = status
+    application.message = message[:100]
+    application.monthly_installment = monthly_installment
+    application.loan = loan
+    application.decided_at = decided_at
+
+
+def _decide_in_bulk(applications, customers, now):
+    """Decide every application against in-memory summaries and write the results in bulk."""
+    summaries = lock_customer_summaries(list(customers))
+    year = datetime.now().year
+    start_date = datetime.today().date()
+
+    approved = []
+    for application in applications:
+        reason = _invalid_reason(application)
+        if reason:
+            _record(application, now, LoanApplication.FAILED, reason)
+            continue
+        customer = customers[application.customer_id]
+        summary = summaries[application.customer_id]
+        quote = None
+        if application.quote:
+            quote = load_quote(
+                application.quote, customer.pk,
+                application.loan_amount, application.interest_rate, application.tenure,
+            )
+        decision = decide_loan(
+            customer, summary, year,
+            application.loan_amount, application.interest_rate, application.tenure, quote,
+        )
+        if decision.approved:
+            loan = approved_loan(customer, application.loan_amount, application.tenure, decision, start_date)
+            # Later applications from the same customer see this loan under the EMI cap
+            add_loan_to_summary(summary, loan)
+            approved.append((application, loan))
+            _record(application, now, LoanApplication.APPROVED, "Loan approved", decision.monthly_installment)
+        else:
+            _record(application, now, LoanApplication.REJECTED, decision.reason, decision.monthly_installment)
+
+    # bulk_create skips the Loan signals, so summaries and caches are updated here
+    loans = Loan.objects.bulk_create([loan for _, loan in approved])
+    for application, loan in approved:
+        application.loan = loan
+    save_schedules(schedules_for_loans(loans))
+
+    changed = sorted({loan.customer_id for loan in loans})
+    for customer_id in changed:
+        summaries[customer_id].updated_at = now
+    CustomerLoanSummary.objects.bulk_update(
+        [summaries[customer_id] for customer_id in changed], SUMMARY_FIELDS + ['updated_at']
+    )
+    invalidate_customers(changed)
+
+
+def _decide_one_by_one(applications, customers, now):
+    """
+    Fallback when a bulk write fails: each application goes through
+    create_loan in its own savepoint, and one that still fails is marked
+    failed instead of holding up the rest of the batch.
+    """
+    for application in applications:
+        reason = _invalid_reason(application)
+        if reason:
+            _record(application, now, LoanApplication.FAILED, reason)
+            continue
+        try:
+            loan, decision = create_loan(
+                customers[application.customer_id],
+                application.loan_amount, application.interest_rate, application.tenure,
+                application.quote or None,
+            )
+        except DatabaseError as exc:
+            _record(application, now, LoanApplication.FAILED, f"Could not record the loan: {exc}")
+            continue
+        if loan is None:
+            _record(application, now, LoanApplication.REJECTED, decision.reason, decision.monthly_installment)
+        else:
+            _record(application, now, LoanApplication.APPROVED, "Loan approved", decision.monthly_installment, loan)
+
+
+def process_applications(batch_size=None):
+    """
+    Decide one batch of the oldest pending applications and return them.
+    Applications with invalid terms, or whose loan cannot be written, are
+    marked failed so they never block the applications behind them.
+    """
+    batch_size = batch_size or settings.LOANS_APPLICATION_BATCH_SIZE
+    with transaction.atomic(), metrics.timed('loans.applications.batch'):
+        applications = list(
+            LoanApplication.objects.select_for_update(skip_locked=True)
+            .filter(status=LoanApplication.PENDING)
+            .order_by('application_id')[:batch_size]
+        )
+        if not applications:
+            return []
+
+        customers = Customer.objects.in_bulk({application.customer_id for application in applications})
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                _decide_in_bulk(applications, customers, now)
+        except DatabaseError:
+            logger.exception("Bulk loan application batch failed; deciding one by one")
+            metrics.incr('loans.applications.bulk_failures')
+            _decide_one_by_one(applications, customers, now)
+
+        LoanApplication.objects.bulk_update(
+            applications, ['status', 'loan', 'message', 'monthly_installment', 'decided_at']
+        )
+        callbacks = [application.pk for application in applications if application.callback_url]
+        if callbacks:
+            transaction.on_commit(lambda: _enqueue_callbacks(callbacks))
+
+    for status in (LoanApplication.APPROVED, LoanApplication.REJECTED, LoanApplication.FAILED):
+        metrics.incr(
+            f'loans.applications.{status}',
+            sum(1 for application in applications if application.status == status),
+        )
+    return applications
+
+
+def _enqueue_callbacks(application_ids):
+    from .tasks import send_application_callback
+
+    for application_id in application_ids:
+        try:
+            send_application_callback.delay(application_id)
+        except Exception:
+            metrics.incr('loans.applications.callback_errors')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect could point the request at a host outside the allowlist
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def callback_allowed(url):
+    """Whether url's host matches LOANS_APPLICATION_CALLBACK_HOSTS (ALLOWED_HOSTS-style patterns)."""
+    parts = urlsplit(url)
+    return parts.scheme in ('http', 'https') and bool(parts.hostname) and validate_host(
+        parts.hostname, settings.LOANS_APPLICATION_CALLBACK_HOSTS
+    )
+
+
+def deliver_callback(application_id):
+    """
+    POST the decided application to its callback_url. Network errors and
+    5xx responses raise URLError/HTTPError so the caller can retry; any
+    other error response, or a host no longer allowed, gives up.
+    """
+    application = LoanApplication.objects.get(pk=application_id)
+    if not application.callback_url or application.callback_delivered_at:
+        return False
+    if not callback_allowed(application.callback_url):
+        metrics.incr('loans.applications.callbacks_refused')
+        return False
+    request = urllib.request.Request(
+        application.callback_url,
+        data=json.dumps(application_response(application)).encode(),
+        method='POST',
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        with _opener.open(request, timeout=settings.LOANS_APPLICATION_CALLBACK_TIMEOUT) as response:
+            response.read()
+    except urllib.error.HTTPError as exc:
+        exc.close()
+        if exc.code >= 500:
+            raise
+        metrics.incr('loans.applications.callbacks_rejected')
+        return False
+    LoanApplication.objects.filter(pk=application_id).update(callback_delivered_at=timezone.now())
+    metrics.incr('loans.applications.callbacks_delivered')
+    return True
@@ -1,5 +1,31 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+def invalidate_credit_cache(sender, instance, **kwargs):
+    from core.cache import invalidate_customers
+
+    previous = instance.previous_customer_id
+    invalidate_customers([instance.customer_id] if previous is None else [previous, instance.customer_id])
+
+
+def invalidate_loan_cache(sender, instance, **kwargs):
+    from core.cache import invalidate_loans
+
+    invalidate_loans([instance.pk])
+
 
 class CustomersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'loans'
\ No newline at end of file
+    name = 'loans'
+
+    def ready(self):
+        from .models import Loan
+        from .summary import loan_deleted, loan_saved
+
+        post_save.connect(loan_saved, sender=Loan)
+        post_delete.connect(loan_deleted, sender=Loan)
+        post_save.connect(invalidate_credit_cache, sender=Loan)
+        post_delete.connect(invalidate_credit_cache, sender=Loan)
+        post_save.connect(invalidate_loan_cache, sender=Loan)
+        post_delete.connect(invalidate_loan_cache, sender=Loan)
@@ -0,0 +1,129 @@
+"""
+Async variants of the eligibility, create-loan and view-loan endpoints for
+ASGI deployments (see core/asgi.py). They return the same bodies as the DRF
+views in loans/views.py, but read through Django's async ORM so one process
+can keep many requests in flight while waiting on the database.
+
+create-loan requests carrying an Idempotency-Key or Prefer: respond-async
+are handed to the DRF view, so those headers behave exactly as they do
+under WSGI.
+"""
+import json
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+from core.idempotency import IDEMPOTENCY_HEADER
+from customers.models import Customer
+from .models import Loan
+from .quotes import issue_quote
+from .serializers import CheckEligibilityRequestSerializer, CreateLoanRequestSerializer
+from .services import create_loan
+from .snapshots import afresh_credit_scores
+from .views import CreateLoanView
+from .utils import (
+    aget_credit_factors, eligibility_response, evaluate_loan, loan_detail_queryset, loan_detail_response,
+    score_credit_factors, validate_loan_terms,
+)
+
+
+def _validated_loan_request(request, serializer_class):
+    """Return (data, None) or (None, error response) for a loan request body."""
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError as exc:
+        return None, JsonResponse({"detail": f"JSON parse error - {exc}"}, status=400)
+
+    serializer = serializer_class(data=payload)
+    if not serializer.is_valid():
+        return None, JsonResponse(serializer.errors, status=400)
+    data = serializer.validated_data
+
+    error = validate_loan_terms(data['loan_amount'], data['tenure'])
+    if error:
+        return None, JsonResponse({"error": error}, status=400)
+    return data, None
+
+
+class AsyncCheckEligibilityView(View):
+    async def post(self, request):
+        data, error_response = _validated_loan_request(request, CheckEligibilityRequestSerializer)
+        if error_response:
+            return error_response
+
+        try:
+            customer = await Customer.objects.aget(pk=data['customer_id'])
+        except Customer.DoesNotExist:
+            return JsonResponse({"error": "Customer not found"}, status=404)
+
+        year = datetime.now().year
+        credit = None
+        if settings.LOANS_ELIGIBILITY_FROM_SNAPSHOT:
+            credit = (await afresh_credit_scores([customer], year)).get(customer.pk)
+        if credit is None:
+            credit = score_credit_factors(await aget_credit_factors(customer, year), customer.approved_limit)
+        decision = evaluate_loan(
+            customer, credit, data['loan_amount'], data['interest_rate'], data['tenure']
+        )
+        quote = None
+        if decision.approved:
+            quote = issue_quote(
+                customer, credit.factors, year,
+                data['loan_amount'], data['interest_rate'], data['tenure'], decision
+            )
+        return JsonResponse(eligibility_response(customer.customer_id, data['tenure'], decision, quote))
+
+
+_create_loan_view = CreateLoanView.as_view()
+
+
+def _create_loan_sync(request):
+    return _create_loan_view(request).render()
+
+
+class AsyncCreateLoanView(View):
+    async def post(self, request):
+        if IDEMPOTENCY_HEADER in request.META or 'respond-async' in request.headers.get('Prefer', ''):
+            # Stored responses and queued applications live in the DRF view;
+            # it runs in a worker thread, as create_loan does below
+            return await sync_to_async(_create_loan_sync)(request)
+
+        data, error_response = _validated_loan_request(request, CreateLoanRequestSerializer)
+        if error_response:
+            return error_response
+
+        try:
+            customer = await Customer.objects.aget(pk=data['customer_id'])
+        except Customer.DoesNotExist:
+            return JsonResponse({"error": "Customer not found"}, status=404)
+
+        # The locked insert needs a transaction, which the async ORM cannot hold
+        loan, decision = await sync_to_async(create_loan)(
+            customer, data['loan_amount'], data['interest_rate'], data['tenure'], data.get('quote')
+        )
+        if loan is None:
+            return JsonResponse({
+                "loan_id": None,
+                "customer_id": customer.customer_id,
+                "loan_approved": False,
+                "message": decision.reason,
+                "monthly_installment": decision.monthly_installment
+            })
+
+        return JsonResponse({
+            "loan_id": loan.loan_id,
+            "customer_id": customer.customer_id,
+            "loan_approved": True,
+            "message": "Loan approved",
+            "monthly_installment": decision.monthly_installment
+        }, status=201)
+
+
+class AsyncViewLoanDetail(View):
+    async def get(self, request, loan_id):
+        try:
+            loan = await loan_detail_queryset().aget(pk=loan_id)
+        except Loan.DoesNotExist:
+            return JsonResponse({"detail": "No Loan matches the given query."}, status=404)
+        return JsonResponse(loan_detail_response(loan))
@@ -0,0 +1,337 @@
+"""
+Load generation and latency reporting for the public API.
+
+Traffic is a list of request specs ({"name", "method", "path", "body"}),
+either read from a JSONL file or generated from the customers and loans
+already in the database. Specs are replayed in-process through Django's
+test client (which also lets us count SQL queries per request) or over
+HTTP against a running deployment, from a pool of worker threads.
+run_render_benchmark() times response rendering alone, without a database.
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from rest_framework.renderers import JSONRenderer
+from core.renderers import FastJSONRenderer, orjson
+from customers.models import Customer
+from customers.serializers import CustomerSerializer
+from customers.utils import customer_response
+from loans.models import Loan
+from loans.schedules import loan_end_date, save_schedules, schedules_for_loans
+from loans.summary import rebuild_loan_summaries
+from loans.utils import calculate_emi
+
+DEFAULT_MIX = {
+    'check-eligibility': 50,
+    'view-loan': 20,
+    'view-customer-loans': 10,
+    'create-loan': 10,
+    'register': 10,
+}
+
+
+def _phone_prefix():
+    # 13-digit numbers never collide with real 10-digit phone numbers.
+    return f"0{int(time.time() * 1000) % 10 ** 6:06d}"
+
+
+def seed_data(customers, loans_per_customer, rng, batch_size=5000):
+    """Insert synthetic customers with loans and rebuild their summaries."""
+    prefix = _phone_prefix()
+    created = 0
+    with transaction.atomic():
+        for start in range(0, customers, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, customers)):
+                salary = rng.randrange(20000, 200000, 1000)
+                batch.append(Customer(
+                    first_name='Bench',
+                    last_name=str(i),
+                    age=rng.randint(21, 65),
+                    phone_number=f"{prefix}{i:06d}",
+                    monthly_salary=salary,
+                    approved_limit=round(36 * salary, -5),
+                ))
+            batch = Customer.objects.bulk_create(batch)
+
+            loans = []
+            for customer in batch:
+                for _ in range(loans_per_customer):
+                    amount = rng.randrange(50000, 1000000, 10000)
+                    rate = round(rng.uniform(8, 18), 2)
+                    tenure = rng.choice([6, 12, 24, 36, 60])
+                    start_date = date.today() - timedelta(days=rng.randint(0, 3650))
+                    loans.append(Loan(
+                        customer=customer,
+                        loan_amount=amount,
+                        interest_rate=rate,
+                        tenure=tenure,
+                        monthly_repayment=calculate_emi(amount, rate, tenure),
+                        emis_paid_on_time=rng.randint(0, tenure),
+                        start_date=start_date,
+                        end_date=loan_end_date(start_date, tenure),
+                    ))
+            loans = Loan.objects.bulk_create(loans, batch_size=batch_size)
+            save_schedules(schedules_for_loans(loans))
+            created += len(batch)
+    rebuild_loan_summaries()
+    return created
+
+
+def load_traffic(path):
+    """Read request specs from a JSONL file, skipping lines without a path."""
+    traffic = []
+    with open(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            spec = json.loads(line)
+            if 'path' not in spec:
+                continue
+            traffic.append({
+                'name': spec.get('name', spec['path']),
+                'method': spec.get('method', 'POST' if spec.get('body') is not None else 'GET').upper(),
+                'path': spec['path'],
+                'body': spec.get('body'),
+            })
+    return traffic
+
+
+def generate_traffic(count, rng, mix=None, sample_size=1000):
+    """Build a random request mix against existing customers and loans."""
+    mix = mix or DEFAULT_MIX
+    customer_ids = list(Customer.objects.order_by('?').values_list('customer_id', flat=True)[:sample_size])
+    loan_ids = list(Loan.objects.order_by('?').values_list('loan_id', flat=True)[:sample_size])
+    if not customer_ids:
+        raise ValueError("No customers to generate traffic against; seed data first.")
+
+    names = [name for name in mix if name != 'view-loan' or loan_ids]
+    weights = [mix[name] for name in names]
+    prefix = _phone_prefix()
+    traffic = []
+    for i, name in enumerate(rng.choices(names, weights=weights, k=count)):
+        if name in ('check-eligibility', 'create-loan'):
+            traffic.append({
+                'name': name,
+                'method': 'POST',
+                'path': f'/api/loans/{name}/',
+                'body': {
+                    'customer_id': rng.choice(customer_ids),
+                    'loan_amount': rng.randrange(50000, 1000000, 10000),
+                    'interest_rate': round(rng.uniform(8, 18), 2),
+                    'tenure': rng.choice([6, 12, 24, 36, 60]),
+                },
+            })
+        elif name == 'view-loan':
+            traffic.append({
+                'name': name, 'method': 'GET', 'path': f'/api/loans/view-loan/{rng.choice(loan_ids)}/', 'body': None,
+            })
+        elif name == 'view-customer-loans':
+            traffic.append({
+                'name': name, 'method': 'GET',
+                'path': f'/api/loans/view-loans/{rng.choice(customer_ids)}/', 'body': None,
+            })
+        else:
+            traffic.append({
+                'name': name,
+                'method': 'POST',
+                'path': '/api/customers/register/',
+                'body': {
+                    'first_name': 'Bench',
+                    'last_name': str(i),
+                    'age': rng.randint(21, 65),
+                    'monthly_income': rng.randrange(20000, 200000, 1000),
+                    'phone_number': f"{prefix}{i:06d}",
+                },
+            })
+    return traffic
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _allowed_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def _in_process_sender():
+    local = threading.local()
+
+    def send(spec):
+        if not hasattr(local, 'client'):
+            local.client = Client(SERVER_NAME=_allowed_host())
+        counter = _QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            if spec['method'] == 'GET':
+                response = local.client.get(spec['path'])
+            else:
+                response = local.client.generic(
+                    spec['method'], spec['path'], json.dumps(spec['body'] or {}),
+                    content_type='application/json',
+                )
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, counter.count
+
+    return send
+
+
+def _http_sender(target, timeout):
+    base = target.rstrip('/')
+
+    def send(spec):
+        data = None if spec['body'] is None else json.dumps(spec['body']).encode()
+        request = urllib.request.Request(
+            base + spec['path'], data=data, method=spec['method'],
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                code = response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            code = exc.code
+        except (urllib.error.URLError, TimeoutError):
+            code = 0
+        return code, time.perf_counter() - start, None
+
+    return send
+
+
+def _summarize(samples, duration):
+    latencies = np.array([s[1] for s in samples]) * 1000
+    queries = [s[2] for s in samples if s[2] is not None]
+    statuses = defaultdict(int)
+    for code, _, _ in samples:
+        statuses[str(code)] += 1
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for code, _, _ in samples if code == 0 or code >= 500),
+        'status_codes': dict(statuses),
+        'rps': round(len(samples) / duration, 2) if duration else 0.0,
+        'mean_ms': round(float(latencies.mean()), 3) if len(latencies) else 0.0,
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(latencies.max()), 3) if len(latencies) else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def run_benchmark(traffic, concurrency=1, target=None, timeout=30):
+    """
+    Replay traffic and return latency/throughput statistics overall and per
+    endpoint. Query counts are only available in-process (target=None).
+    With concurrency 1 requests run on the calling thread.
+    """
+    send = _http_sender(target, timeout) if target else _in_process_sender()
+    results = [None] * len(traffic)
+
+    def worker(offset):
+        try:
+            for index in range(offset, len(traffic), concurrency):
+                results[index] = send(traffic[index])
+        finally:
+            if not target and concurrency > 1:
+                connection.close()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker(0)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(worker, offset) for offset in range(concurrency)]:
+                future.result()
+    duration = time.perf_counter() - start
+
+    by_endpoint = defaultdict(list)
+    for spec, sample in zip(traffic, results):
+        by_endpoint[spec['name']].append(sample)
+    return {
+        'target': target or 'in-process',
+        'concurrency': concurrency,
+        'duration_s': round(duration, 3),
+        'overall': _summarize(results, duration),
+        'endpoints': {name: _summarize(samples, duration) for name, samples in sorted(by_endpoint.items())},
+    }
+
+
+def _sample_payloads():
+    loan = {
+        "loan_id": 1, "loan_amount": 200000.0, "interest_rate": 10.5, "monthly_installment": 17583.18,
+        "tenure": 12, "repayments_left": 7,
+    }
+    return {
+        'check-eligibility': {
+            "customer_id": 301, "approval": True, "interest_rate": 10.0, "corrected_interest_rate": 12.0,
+            "tenure": 12, "monthly_installment": 17583.18, "quote": "x" * 160,
+        },
+        'view-loan': {
+            **loan, "customer": {
+                "customer_id": 301, "first_name": "Aaron", "last_name": "Garcia",
+                "phone_number": "9629317944", "age": 63,
+            },
+        },
+        'view-customer-loans': [dict(loan, loan_id=i) for i in range(100)],
+    }
+
+
+def _per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run_render_benchmark(iterations=2000):
+    """
+    CPU time per response of DRF's JSONRenderer against FastJSONRenderer on
+    the API's response shapes, and of CustomerSerializer against the plain
+    dict register now returns.
+    """
+    report = {'orjson': orjson is not None, 'iterations': iterations, 'render': {}}
+    default, fast = JSONRenderer(), FastJSONRenderer()
+    for name, payload in _sample_payloads().items():
+        default_us = _per_call_us(lambda: default.render(payload), iterations)
+        fast_us = _per_call_us(lambda: fast.render(payload), iterations)
+        report['render'][name] = {
+            'json_renderer_us': round(default_us, 2),
+            'fast_renderer_us': round(fast_us, 2),
+            'saved_us': round(default_us - fast_us, 2),
+            'speedup': round(default_us / fast_us, 2) if fast_us else None,
+        }
+
+    customer = Customer(
+        customer_id=301, first_name='Aaron', last_name='Garcia', age=63, phone_number='9629317944',
+        monthly_salary=50000, approved_limit=1800000, current_debt=0.0,
+    )
+    serializer_us = _per_call_us(lambda: CustomerSerializer(customer).data, iterations)
+    dict_us = _per_call_us(lambda: customer_response(customer), iterations)
+    report['register_body'] = {
+        'serializer_us': round(serializer_us, 2),
+        'plain_dict_us': round(dict_us, 2),
+        'saved_us': round(serializer_us - dict_us, 2),
+    }
+    return report
@@ -0,0 +1,73 @@
+import json
+import random
+from django.core.management.base import BaseCommand, CommandError
+from loans.benchmark import (
+    DEFAULT_MIX, generate_traffic, load_traffic, run_benchmark, run_render_benchmark, seed_data,
+)
+
+
+class Command(BaseCommand):
+    help = "Replay recorded or generated API traffic and report latency, throughput and queries per request as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-data', action='store_true',
+                            help="Insert synthetic customers and loans before running (writes to the database).")
+        parser.add_argument('--customers', type=int, default=1000, help="Customers to seed with --seed-data.")
+        parser.add_argument('--loans-per-customer', type=int, default=5, help="Loans per seeded customer.")
+        parser.add_argument('--traffic', help="JSONL file of {name, method, path, body} request specs to replay.")
+        parser.add_argument('--requests', type=int, default=1000, help="Number of requests to generate.")
+        parser.add_argument('--mix', help="Endpoint weights for generated traffic, e.g. check-eligibility=5,view-loan=1.")
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--target', help="Base URL of a running server; requests run in-process when omitted.")
+        parser.add_argument('--timeout', type=float, default=30, help="Per-request timeout for --target, in seconds.")
+        parser.add_argument('--random-seed', type=int, help="Seed for reproducible data and traffic.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--render', action='store_true',
+                            help="Only measure response rendering CPU time (no database or HTTP).")
+        parser.add_argument('--iterations', type=int, default=2000, help="Iterations per payload for --render.")
+
+    def handle(self, *args, **options):
+        if options['render']:
+            return self._write(run_render_benchmark(options['iterations']), options['output'])
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1")
+        rng = random.Random(options['random_seed'])
+
+        if options['seed_data']:
+            created = seed_data(options['customers'], options['loans_per_customer'], rng)
+            self.stderr.write(f"Seeded {created} customers.")
+
+        if options['traffic']:
+            traffic = load_traffic(options['traffic'])
+        else:
+            try:
+                traffic = generate_traffic(options['requests'], rng, self._parse_mix(options['mix']))
+            except ValueError as exc:
+                raise CommandError(str(exc))
+        if not traffic:
+            raise CommandError("No requests to replay.")
+
+        report = run_benchmark(traffic, options['concurrency'], options['target'], options['timeout'])
+        self._write(report, options['output'])
+
+    def _write(self, report, path):
+        output = json.dumps(report, indent=2)
+        if path:
+            with open(path, 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def _parse_mix(self, value):
+        if not value:
+            return None
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name not in DEFAULT_MIX:
+                raise CommandError(f"Unknown endpoint in --mix: {name}")
+            try:
+                mix[name] = float(weight)
+            except ValueError:
+                raise CommandError(f"Invalid weight in --mix: {part}")
+        return mix
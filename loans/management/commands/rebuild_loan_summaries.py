@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from loans.summary import rebuild_loan_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-customer loan summary table from the loans table."
+
+    def handle(self, *args, **options):
+        written = rebuild_loan_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} customer loan summaries."))
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractYear
+
+
+def populate_summaries(apps, schema_editor):
+    Loan = apps.get_model('loans', 'Loan')
+    CustomerLoanSummary = apps.get_model('loans', 'CustomerLoanSummary')
+
+    per_year = {}
+    year_rows = (
+        Loan.objects.annotate(year=ExtractYear('start_date'))
+        .values('customer_id', 'year')
+        .annotate(count=Count('loan_id'))
+        .order_by()
+    )
+    for row in year_rows:
+        per_year.setdefault(row['customer_id'], {})[str(row['year'])] = row['count']
+
+    rows = Loan.objects.values('customer_id').annotate(
+        loan_count=Count('loan_id'),
+        total_tenure=Sum('tenure'),
+        on_time_emis=Sum('emis_paid_on_time'),
+        total_loan_amount=Sum('loan_amount'),
+        total_emi=Sum('monthly_repayment'),
+    ).order_by()
+    CustomerLoanSummary.objects.bulk_create([
+        CustomerLoanSummary(loans_per_year=per_year.get(row['customer_id'], {}), **row)
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerLoanSummary',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='loan_summary', serialize=False, to='customers.customer')),
+                ('loan_count', models.IntegerField(default=0)),
+                ('total_tenure', models.IntegerField(default=0)),
+                ('on_time_emis', models.IntegerField(default=0)),
+                ('total_loan_amount', models.FloatField(default=0.0)),
+                ('total_emi', models.FloatField(default=0.0)),
+                ('loans_per_year', models.JSONField(default=dict, help_text='Loan count keyed by start year')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
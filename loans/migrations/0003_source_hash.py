@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_customerloansummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Fingerprint of the ingested source row', max_length=16),
+        ),
+    ]
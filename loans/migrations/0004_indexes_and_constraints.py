@@ -0,0 +1,113 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:47
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on PostgreSQL; a plain AddIndex elsewhere."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class AddCheckConstraintNotValid(migrations.AddConstraint):
+    """
+    On PostgreSQL, add the constraint NOT VALID (a brief lock, no scan) and
+    then VALIDATE it, which scans the table without blocking writes. Other
+    backends add it directly.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            return schema_editor.add_constraint(model, self.constraint)
+        quote = schema_editor.quote_name
+        schema_editor.execute(f'{self.constraint.create_sql(model, schema_editor)} NOT VALID')
+        schema_editor.execute(
+            f'ALTER TABLE {quote(model._meta.db_table)} VALIDATE CONSTRAINT {quote(self.constraint.name)}'
+        )
+
+
+def check_existing_loans(apps, schema_editor):
+    """
+    Clamp emis_paid_on_time into [0, tenure], the one rule existing rows can
+    be brought in line with safely, and refuse to continue if any loan still
+    has a non-positive amount or tenure or a negative rate or repayment.
+    """
+    Loan = apps.get_model('loans', 'Loan')
+    Loan.objects.filter(emis_paid_on_time__lt=0).update(emis_paid_on_time=0)
+    Loan.objects.filter(tenure__gt=0, emis_paid_on_time__gt=models.F('tenure')).update(
+        emis_paid_on_time=models.F('tenure')
+    )
+    invalid = list(
+        Loan.objects.filter(
+            models.Q(loan_amount__lte=0) | models.Q(tenure__lte=0)
+            | models.Q(interest_rate__lt=0) | models.Q(monthly_repayment__lt=0)
+        ).order_by('loan_id').values_list('loan_id', flat=True)[:50]
+    )
+    if invalid:
+        raise RuntimeError(
+            "Loans with a non-positive amount or tenure, or a negative interest rate or monthly "
+            "repayment, must be corrected or removed before these constraints can be added: "
+            f"loan_id {', '.join(map(str, invalid))}"
+        )
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds and constraint validation cannot run inside a
+    # transaction; each statement commits on its own instead
+    atomic = False
+
+    dependencies = [
+        ('customers', '0003_indexes_and_constraints'),
+        ('loans', '0003_source_hash'),
+    ]
+
+    operations = [
+        # First, so a table that cannot take the constraints fails before any change
+        migrations.RunPython(check_existing_loans, migrations.RunPython.noop, atomic=True),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'loan_id'], include=('loan_amount', 'interest_rate', 'monthly_repayment', 'tenure', 'emis_paid_on_time'), name='loan_customer_loan_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'start_date'], name='loan_customer_start_idx'),
+        ),
+        migrations.AlterField(
+            model_name='loan',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='customers.customer'),
+        ),
+        AddCheckConstraintNotValid(
+            model_name='loan',
+            constraint=models.CheckConstraint(condition=models.Q(('loan_amount__gt', 0)), name='loan_amount_positive'),
+        ),
+        AddCheckConstraintNotValid(
+            model_name='loan',
+            constraint=models.CheckConstraint(condition=models.Q(('tenure__gt', 0)), name='loan_tenure_positive'),
+        ),
+        AddCheckConstraintNotValid(
+            model_name='loan',
+            constraint=models.CheckConstraint(condition=models.Q(('interest_rate__gte', 0)), name='loan_interest_rate_non_negative'),
+        ),
+        AddCheckConstraintNotValid(
+            model_name='loan',
+            constraint=models.CheckConstraint(condition=models.Q(('monthly_repayment__gte', 0)), name='loan_monthly_repayment_non_negative'),
+        ),
+        AddCheckConstraintNotValid(
+            model_name='loan',
+            constraint=models.CheckConstraint(condition=models.Q(('emis_paid_on_time__gte', 0), ('emis_paid_on_time__lte', models.F('tenure'))), name='loan_emis_paid_within_tenure'),
+        ),
+    ]
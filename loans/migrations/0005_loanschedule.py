@@ -0,0 +1,97 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:57
+
+import django.db.models.deletion
+import numpy as np
+from django.db import migrations, models
+
+
+# Frozen copies of the loans.schedules / loans.amortization helpers as of
+# this migration, so later changes to those modules cannot change what it writes
+
+def calculate_emi_array(principal, annual_interest_rate, tenure_months):
+    r = (annual_interest_rate / 100) / 12
+    growth = np.power(1 + r, tenure_months)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emi = np.round(principal * r * growth / (growth - 1), 2)
+        flat = principal / tenure_months
+    return np.where(r == 0, flat, emi)
+
+
+def schedule_balances(loan_amounts, interest_rates, tenures):
+    """Closing balance after each installment, one array per loan in input order."""
+    loan_amounts = np.asarray(loan_amounts, dtype=np.float64)
+    interest_rates = np.asarray(interest_rates, dtype=np.float64)
+    tenures = np.asarray(tenures, dtype=np.int64)
+    balances = [np.zeros(0)] * len(tenures)
+    for tenure in np.unique(tenures):
+        if tenure <= 0:
+            continue
+        rows = np.flatnonzero(tenures == tenure)
+        p = loan_amounts[rows][:, None]
+        rate = interest_rates[rows][:, None]
+        r = (rate / 100) / 12
+        e = calculate_emi_array(p, rate, tenure)
+        months = np.arange(1, tenure + 1, dtype=np.float64)
+        growth = np.power(1 + r, months)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            balance = np.where(r == 0, p - e * months, p * growth - e * (growth - 1) / r)
+        balance[:, -1] = 0.0
+        for row, row_balance in zip(rows, balance):
+            balances[row] = row_balance
+    return balances
+
+
+def pack_balances(balances):
+    return np.asarray(balances, dtype='<f8').tobytes()
+
+
+def outstanding_after(loan_amount, balances, installments_paid):
+    if installments_paid <= 0:
+        return float(loan_amount)
+    return float(balances[installments_paid - 1])
+
+
+def populate_schedules(apps, schema_editor):
+    Loan = apps.get_model('loans', 'Loan')
+    LoanSchedule = apps.get_model('loans', 'LoanSchedule')
+
+    rows = Loan.objects.values_list(
+        'loan_id', 'loan_amount', 'interest_rate', 'tenure', 'emis_paid_on_time'
+    ).order_by('loan_id')
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(loan_id__gt=last_id)[:10000])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        loan_ids, amounts, rates, tenures, paid = zip(*chunk)
+        balances = schedule_balances(amounts, rates, tenures)
+        LoanSchedule.objects.bulk_create([
+            LoanSchedule(
+                loan_id=loan_id,
+                balances=pack_balances(balance),
+                installments_paid=installments,
+                outstanding_principal=outstanding_after(amount, balance, installments),
+            )
+            for loan_id, amount, balance, installments in zip(loan_ids, amounts, balances, paid)
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_indexes_and_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanSchedule',
+            fields=[
+                ('loan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='schedule', serialize=False, to='loans.loan')),
+                ('balances', models.BinaryField(help_text='Closing balance after each installment, packed little-endian float64')),
+                ('installments_paid', models.IntegerField(default=0)),
+                ('outstanding_principal', models.FloatField()),
+            ],
+        ),
+        migrations.RunPython(populate_schedules, migrations.RunPython.noop),
+    ]
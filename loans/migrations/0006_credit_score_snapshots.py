@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_indexes_and_constraints'),
+        ('loans', '0005_loanschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreSnapshotRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(help_text='Year the current-year loan count was taken for')),
+                ('started_at', models.DateTimeField()),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('customer_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CreditScoreSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField()),
+                ('loan_count', models.IntegerField()),
+                ('current_year_loans', models.IntegerField()),
+                ('total_tenure', models.IntegerField()),
+                ('on_time_emis', models.IntegerField()),
+                ('total_loan_amount', models.FloatField()),
+                ('total_emi', models.FloatField()),
+                ('approved_limit', models.IntegerField()),
+                ('on_time_penalty', models.IntegerField()),
+                ('loan_count_penalty', models.IntegerField()),
+                ('current_year_penalty', models.IntegerField()),
+                ('over_approved_limit', models.BooleanField()),
+                ('summary_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='score_snapshots', to='customers.customer')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='loans.scoresnapshotrun')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('customer', 'run'), name='score_snapshot_customer_run_uniq')],
+            },
+        ),
+    ]
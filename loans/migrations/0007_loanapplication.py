@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_indexes_and_constraints'),
+        ('loans', '0006_credit_score_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanApplication',
+            fields=[
+                ('application_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('loan_amount', models.FloatField()),
+                ('interest_rate', models.FloatField()),
+                ('tenure', models.IntegerField(help_text='Tenure in months')),
+                ('quote', models.TextField(blank=True, default='')),
+                ('callback_url', models.URLField(blank=True, default='', max_length=500)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='pending', max_length=10)),
+                ('message', models.CharField(blank=True, default='', max_length=100)),
+                ('monthly_installment', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('decided_at', models.DateTimeField(blank=True, null=True)),
+                ('callback_delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='loan_applications', to='customers.customer')),
+                ('loan', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='application', to='loans.loan')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['application_id'], name='loan_application_pending_idx')],
+            },
+        ),
+    ]
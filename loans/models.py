@@ -3,7 +3,8 @@ from customers.models import Customer
 
 class Loan(models.Model):
     loan_id = models.AutoField(primary_key=True)
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans')
+    # Indexed through the composite indexes below, which all lead with customer_id
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans', db_index=False)
     loan_amount = models.FloatField()
     tenure = models.IntegerField(help_text="Tenure in months")
     interest_rate = models.FloatField()
@@ -11,6 +12,170 @@ class Loan(models.Model):
     emis_paid_on_time = models.IntegerField(default=0)
     start_date = models.DateField()
     end_date = models.DateField()
+    source_hash = models.CharField(
+        max_length=16, blank=True, default='', editable=False,
+        help_text="Fingerprint of the ingested source row"
+    )
+
+    class Meta:
+        indexes = [
+            # Keyset pagination by customer and the per-customer totals
+            # (EMI sum, scoring factors) as index-only scans
+            models.Index(
+                fields=['customer', 'loan_id'],
+                include=['loan_amount', 'interest_rate', 'monthly_repayment', 'tenure', 'emis_paid_on_time'],
+                name='loan_customer_loan_idx',
+            ),
+            # Loans per customer within a start date range (current-year count)
+            models.Index(fields=['customer', 'start_date'], name='loan_customer_start_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(loan_amount__gt=0), name='loan_amount_positive'),
+            models.CheckConstraint(condition=models.Q(tenure__gt=0), name='loan_tenure_positive'),
+            models.CheckConstraint(condition=models.Q(interest_rate__gte=0), name='loan_interest_rate_non_negative'),
+            models.CheckConstraint(
+                condition=models.Q(monthly_repayment__gte=0), name='loan_monthly_repayment_non_negative'
+            ),
+            models.CheckConstraint(
+                condition=models.Q(emis_paid_on_time__gte=0, emis_paid_on_time__lte=models.F('tenure')),
+                name='loan_emis_paid_within_tenure',
+            ),
+        ]
 
     def __str__(self):
         return f"Loan {self.loan_id} - Customer {self.customer_id}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The post_save handlers refresh this customer too if the loan moves
+        instance._loaded_customer_id = instance.__dict__.get('customer_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_customer_id = self.customer_id
+
+    @property
+    def previous_customer_id(self):
+        """The customer this loan belonged to when loaded, if a save has since moved it."""
+        previous = self.__dict__.get('_loaded_customer_id')
+        return previous if previous is not None and previous != self.customer_id else None
+
+
+class CustomerLoanSummary(models.Model):
+    """
+    Per-customer loan totals, maintained as loans are written so scoring
+    reads one row instead of aggregating the customer's loan history.
+    """
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name='loan_summary'
+    )
+    loan_count = models.IntegerField(default=0)
+    total_tenure = models.IntegerField(default=0)
+    on_time_emis = models.IntegerField(default=0)
+    total_loan_amount = models.FloatField(default=0.0)
+    total_emi = models.FloatField(default=0.0)
+    loans_per_year = models.JSONField(default=dict, help_text="Loan count keyed by start year")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Loan summary - Customer {self.customer_id}"
+
+
+class LoanSchedule(models.Model):
+    """
+    A loan's amortization schedule, generated once when the loan is written,
+    and its repayment progress. See loans/schedules.py.
+    """
+    loan = models.OneToOneField(Loan, on_delete=models.CASCADE, primary_key=True, related_name='schedule')
+    balances = models.BinaryField(help_text="Closing balance after each installment, packed little-endian float64")
+    installments_paid = models.IntegerField(default=0)
+    outstanding_principal = models.FloatField()
+
+    def __str__(self):
+        return f"Schedule - Loan {self.loan_id}"
+
+
+class ScoreSnapshotRun(models.Model):
+    """One nightly recomputation of every customer's credit score."""
+    year = models.IntegerField(help_text="Year the current-year loan count was taken for")
+    started_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+    customer_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Score snapshot {self.pk} ({self.started_at:%Y-%m-%d})"
+
+
+class CreditScoreSnapshot(models.Model):
+    """
+    A customer's credit score and the factors behind it as of a snapshot
+    run. summary_updated_at records which version of the customer's loan
+    summary was scored, so readers can tell whether it has changed since.
+    """
+    run = models.ForeignKey(ScoreSnapshotRun, on_delete=models.CASCADE, related_name='scores')
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='score_snapshots', db_index=False)
+    score = models.IntegerField()
+    loan_count = models.IntegerField()
+    current_year_loans = models.IntegerField()
+    total_tenure = models.IntegerField()
+    on_time_emis = models.IntegerField()
+    total_loan_amount = models.FloatField()
+    total_emi = models.FloatField()
+    approved_limit = models.IntegerField()
+    on_time_penalty = models.IntegerField()
+    loan_count_penalty = models.IntegerField()
+    current_year_penalty = models.IntegerField()
+    over_approved_limit = models.BooleanField()
+    summary_updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Also the lookup index for a customer's latest snapshot
+            models.UniqueConstraint(fields=['customer', 'run'], name='score_snapshot_customer_run_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Score {self.score} - Customer {self.customer_id} (run {self.run_id})"
+
+
+class LoanApplication(models.Model):
+    """
+    A create-loan request submitted for queued processing. Workers decide
+    pending applications in batches (see loans/applications.py) and record
+    the outcome here for status polling and the optional callback.
+    """
+    PENDING = 'pending'
+    APPROVED = 'approved'
+    REJECTED = 'rejected'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (APPROVED, 'Approved'), (REJECTED, 'Rejected'), (FAILED, 'Failed')]
+
+    application_id = models.BigAutoField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loan_applications', db_index=False)
+    loan_amount = models.FloatField()
+    interest_rate = models.FloatField()
+    tenure = models.IntegerField(help_text="Tenure in months")
+    quote = models.TextField(blank=True, default='')
+    callback_url = models.URLField(max_length=500, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    loan = models.OneToOneField(
+        Loan, on_delete=models.SET_NULL, null=True, blank=True, related_name='application'
+    )
+    message = models.CharField(max_length=100, blank=True, default='')
+    monthly_installment = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    decided_at = models.DateTimeField(null=True, blank=True)
+    callback_delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest pending applications; decided rows drop out of the index
+            models.Index(
+                fields=['application_id'], condition=models.Q(status='pending'), name='loan_application_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Application {self.application_id} - Customer {self.customer_id} ({self.status})"
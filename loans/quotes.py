@@ -0,0 +1,61 @@
+"""
+Signed eligibility quotes.
+
+An approved check-eligibility response carries a quote: the request terms,
+the decision, and a fingerprint of every input the decision was derived
+from (salary, approved limit, loan summary and year), signed with
+SECRET_KEY. create-loan accepts the quote back; if the terms match and the
+customer's locked summary still has the same fingerprint, the decision is
+reused instead of re-scoring. Anything else (bad signature, expired,
+different terms or changed state) falls back to a full evaluation, so a
+quote can only ever save work, never change an outcome.
+"""
+import hashlib
+from dataclasses import astuple
+from django.conf import settings
+from django.core import signing
+from core import metrics
+from .utils import LoanDecision
+
+SALT = 'loans.eligibility-quote'
+
+
+def credit_state(customer, factors, year):
+    """Fingerprint of the customer state a loan decision depends on."""
+    state = (customer.pk, customer.monthly_salary, customer.approved_limit, year, *astuple(factors))
+    return hashlib.blake2b(repr(state).encode(), digest_size=8).hexdigest()
+
+
+def issue_quote(customer, factors, year, loan_amount, interest_rate, tenure, decision):
+    return signing.dumps({
+        'customer_id': customer.pk,
+        'terms': [loan_amount, interest_rate, tenure],
+        'state': credit_state(customer, factors, year),
+        'rate': decision.corrected_interest_rate,
+        'emi': decision.monthly_installment,
+    }, salt=SALT, compress=True)
+
+
+def load_quote(token, customer_id, loan_amount, interest_rate, tenure):
+    """Return the quote's payload if it is valid and for these terms, else None."""
+    try:
+        quote = signing.loads(token, salt=SALT, max_age=settings.LOANS_QUOTE_TTL)
+    except signing.SignatureExpired:
+        metrics.incr('loans.quote.expired')
+        return None
+    except signing.BadSignature:
+        metrics.incr('loans.quote.invalid')
+        return None
+    if quote['customer_id'] != customer_id or quote['terms'] != [loan_amount, interest_rate, tenure]:
+        metrics.incr('loans.quote.mismatched')
+        return None
+    return quote
+
+
+def redeem_quote(quote, customer, factors, year, interest_rate):
+    """The quoted decision, or None when the customer's state has changed."""
+    if quote['state'] != credit_state(customer, factors, year):
+        metrics.incr('loans.quote.stale')
+        return None
+    metrics.incr('loans.quote.redeemed')
+    return LoanDecision(True, interest_rate, quote['rate'], quote['emi'])
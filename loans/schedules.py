@@ -0,0 +1,191 @@
+"""
+Stored amortization schedules and repayment tracking.
+
+Each loan's schedule is generated once, when the loan is created or
+ingested, and stored as the packed closing balance after every installment
+(little-endian float64, 8 bytes per month). Payments move the loan's
+installment counter and outstanding principal forward without recomputing
+the schedule, and portfolio reports read the stored balances.
+"""
+from datetime import date
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import F
+from core.cache import invalidate_customers
+from .amortization import amortization_schedule
+from .models import Loan, LoanSchedule
+from .summary import lock_customer_summary
+
+BALANCE_DTYPE = '<f8'
+
+
+class PaymentError(Exception):
+    pass
+
+
+def pack_balances(balances):
+    return np.asarray(balances, dtype=BALANCE_DTYPE).tobytes()
+
+
+def unpack_balances(data):
+    return np.frombuffer(bytes(data), dtype=BALANCE_DTYPE)
+
+
+def loan_end_date(start_date, tenure):
+    """Date of the last installment: tenure calendar months after the start."""
+    return start_date + relativedelta(months=tenure)
+
+
+def schedule_balances(loan_amounts, interest_rates, tenures):
+    """
+    Closing balances per installment for many loans, one array per loan
+    in input order. Loans are amortized in groups of equal tenure so no
+    group pays for the longest tenure in the batch.
+    """
+    loan_amounts = np.asarray(loan_amounts, dtype=np.float64)
+    interest_rates = np.asarray(interest_rates, dtype=np.float64)
+    tenures = np.asarray(tenures, dtype=np.int64)
+    balances = [None] * len(tenures)
+    for tenure in np.unique(tenures):
+        rows = np.flatnonzero(tenures == tenure)
+        if tenure <= 0:
+            for row in rows:
+                balances[row] = np.zeros(0)
+            continue
+        schedule = amortization_schedule(loan_amounts[rows], interest_rates[rows], tenure)
+        for row, balance in zip(rows, schedule.balance):
+            balances[row] = balance
+    return balances
+
+
+def outstanding_after(loan_amount, balances, installments_paid):
+    if installments_paid <= 0:
+        return float(loan_amount)
+    return float(balances[installments_paid - 1])
+
+
+def build_schedules(loan_ids, loan_amounts, interest_rates, tenures, installments_paid):
+    """Unsaved LoanSchedule rows for the given loans."""
+    balances = schedule_balances(loan_amounts, interest_rates, tenures)
+    return [
+        LoanSchedule(
+            loan_id=int(loan_id),
+            balances=pack_balances(balance),
+            installments_paid=int(paid),
+            outstanding_principal=outstanding_after(amount, balance, paid),
+        )
+        for loan_id, amount, balance, paid in zip(loan_ids, loan_amounts, balances, installments_paid)
+    ]
+
+
+def save_schedules(schedules, batch_size=1000):
+    """Insert schedules, replacing any existing schedule for the same loan."""
+    LoanSchedule.objects.bulk_create(
+        schedules,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['loan'],
+        update_fields=['balances', 'installments_paid', 'outstanding_principal'],
+    )
+
+
+def schedules_for_loans(loans):
+    """
+    Schedules for loan instances. Installments paid start at the loan's
+    on-time EMI count, the only repayment history the source data has.
+    """
+    loans = list(loans)
+    return build_schedules(
+        [loan.loan_id for loan in loans],
+        [loan.loan_amount for loan in loans],
+        [loan.interest_rate for loan in loans],
+        [loan.tenure for loan in loans],
+        [loan.emis_paid_on_time for loan in loans],
+    )
+
+
+def get_schedule(loan_id, lock=False):
+    """The loan's schedule, generating it first for loans that predate schedules."""
+    queryset = LoanSchedule.objects.select_related('loan')
+    if lock:
+        queryset = queryset.select_for_update()
+    try:
+        return queryset.get(pk=loan_id)
+    except LoanSchedule.DoesNotExist:
+        loan = Loan.objects.get(pk=loan_id)
+        schedule, = schedules_for_loans([loan])
+        LoanSchedule.objects.bulk_create([schedule], ignore_conflicts=True)
+        return queryset.get(pk=loan_id)
+
+
+def record_payment(loan_id, installments=1, on_time=True):
+    """
+    Record installments paid against a loan, moving its outstanding
+    principal along the stored schedule. On-time payments also count
+    towards the loan's (and the customer summary's) EMIs paid on time.
+    Raises Loan.DoesNotExist or PaymentError.
+    """
+    if installments <= 0:
+        raise PaymentError("installments must be greater than 0")
+
+    with transaction.atomic():
+        customer_id = Loan.objects.values_list('customer_id', flat=True).get(pk=loan_id)
+        # Same lock order as create_loan: customer summary first, then the loan
+        summary = lock_customer_summary(customer_id)
+        schedule = get_schedule(loan_id, lock=True)
+        loan = schedule.loan
+
+        remaining = loan.tenure - schedule.installments_paid
+        if installments > remaining:
+            raise PaymentError(f"Only {remaining} installments remain on this loan")
+
+        schedule.installments_paid += installments
+        schedule.outstanding_principal = outstanding_after(
+            loan.loan_amount, unpack_balances(schedule.balances), schedule.installments_paid
+        )
+        schedule.save(update_fields=['installments_paid', 'outstanding_principal'])
+
+        if on_time:
+            on_time_emis = min(installments, loan.tenure - loan.emis_paid_on_time)
+            Loan.objects.filter(pk=loan_id).update(emis_paid_on_time=F('emis_paid_on_time') + on_time_emis)
+            loan.emis_paid_on_time += on_time_emis
+            summary.on_time_emis += on_time_emis
+            summary.save(update_fields=['on_time_emis', 'updated_at'])
+            invalidate_customers([customer_id])
+    return schedule
+
+
+def _months_between(start, end):
+    return (end.year - start.year) * 12 + (end.month - start.month)
+
+
+def portfolio_outstanding(first_month, months):
+    """
+    Scheduled outstanding balance of the whole book at the end of each of
+    `months` calendar months starting at first_month, read from the stored
+    schedules. A loan counts at its full amount in its start month and
+    drops to its closing balance after each installment falls due.
+    """
+    first_month = date(first_month.year, first_month.month, 1)
+    after_last = first_month + relativedelta(months=months)
+    totals = np.zeros(months)
+
+    rows = (
+        Loan.objects.filter(start_date__lt=after_last, end_date__gte=first_month)
+        .values_list('start_date', 'loan_amount', 'schedule__balances')
+        .iterator(chunk_size=10000)
+    )
+    for start_date, loan_amount, data in rows:
+        if data is None:
+            continue
+        balances = np.concatenate([[loan_amount], unpack_balances(data)])
+        # Installments due by the end of each month in the window
+        due = _months_between(start_date, first_month) + np.arange(months)
+        valid = (due >= 0) & (due < len(balances))
+        totals[valid] += balances[due[valid]]
+
+    return [
+        {"month": (first_month + relativedelta(months=i)).strftime('%Y-%m'), "outstanding": round(float(total), 2)}
+        for i, total in enumerate(totals)
+    ]
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .applications import callback_allowed
 from .models import Loan
 
 class LoanSerializer(serializers.ModelSerializer):
@@ -9,7 +10,8 @@ class LoanSerializer(serializers.ModelSerializer):
 class CheckEligibilityRequestSerializer(serializers.Serializer):
     customer_id = serializers.IntegerField()
     loan_amount = serializers.FloatField()
-    interest_rate = serializers.FloatField()
+    # Loan.interest_rate has a non-negative CHECK constraint
+    interest_rate = serializers.FloatField(min_value=0)
     tenure = serializers.IntegerField()
 
 class CheckEligibilityResponseSerializer(serializers.Serializer):
@@ -24,8 +26,17 @@ class CheckEligibilityResponseSerializer(serializers.Serializer):
 class CreateLoanRequestSerializer(serializers.Serializer):
     customer_id = serializers.IntegerField()
     loan_amount = serializers.FloatField()
-    interest_rate = serializers.FloatField()
+    # Loan.interest_rate has a non-negative CHECK constraint
+    interest_rate = serializers.FloatField(min_value=0)
     tenure = serializers.IntegerField()
+    quote = serializers.CharField(required=False)
+    # Only used with Prefer: respond-async
+    callback_url = serializers.URLField(required=False, max_length=500)
+
+    def validate_callback_url(self, value):
+        if not callback_allowed(value):
+            raise serializers.ValidationError("callback_url host is not in LOANS_APPLICATION_CALLBACK_HOSTS")
+        return value
 
 class CreateLoanResponseSerializer(serializers.Serializer):
     loan_id = serializers.IntegerField(allow_null=True)
@@ -33,3 +44,8 @@ class CreateLoanResponseSerializer(serializers.Serializer):
     loan_approved = serializers.BooleanField()
     message = serializers.CharField()
     monthly_installment = serializers.FloatField()
+
+
+class RecordPaymentRequestSerializer(serializers.Serializer):
+    installments = serializers.IntegerField(default=1, min_value=1)
+    on_time = serializers.BooleanField(default=True)
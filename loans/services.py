@@ -0,0 +1,98 @@
+import random
+import time
+from datetime import datetime
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from core import metrics
+from .models import Loan
+from .quotes import load_quote, redeem_quote
+from .schedules import loan_end_date, save_schedules, schedules_for_loans
+from .summary import add_loan_to_summary, lock_customer_summary
+from .utils import credit_factors_from_summary, evaluate_loan, score_credit_factors
+
+# SQLSTATE raised by PostgreSQL when lock_timeout expires
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+def _is_lock_timeout(exc):
+    cause = exc.__cause__
+    return LOCK_NOT_AVAILABLE in (getattr(cause, 'pgcode', None), getattr(cause, 'sqlstate', None))
+
+
+def _set_lock_timeout(milliseconds):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f'{milliseconds}ms'])
+
+
+def decide_loan(customer, summary, year, loan_amount, interest_rate, tenure, quote=None):
+    """
+    LoanDecision for a request, scored from the customer's (locked) loan
+    summary. A loaded quote's decision is reused if the state it was issued
+    for is unchanged.
+    """
+    factors = credit_factors_from_summary(summary, year)
+    decision = redeem_quote(quote, customer, factors, year, interest_rate) if quote else None
+    if decision is None:
+        credit = score_credit_factors(factors, customer.approved_limit)
+        decision = evaluate_loan(customer, credit, loan_amount, interest_rate, tenure)
+    return decision
+
+
+def approved_loan(customer, loan_amount, tenure, decision, start_date):
+    """Unsaved Loan for an approved decision."""
+    return Loan(
+        customer=customer,
+        loan_amount=loan_amount,
+        tenure=tenure,
+        interest_rate=decision.corrected_interest_rate,
+        monthly_repayment=decision.monthly_installment,
+        emis_paid_on_time=0,
+        start_date=start_date,
+        end_date=loan_end_date(start_date, tenure),
+    )
+
+
+def _create_loan_locked(customer, loan_amount, interest_rate, tenure, quote):
+    with transaction.atomic():
+        _set_lock_timeout(settings.LOANS_CREATE_LOCK_TIMEOUT_MS)
+        with metrics.timed('loans.create_loan.lock_wait'):
+            summary = lock_customer_summary(customer.pk)
+
+        # Score from the locked row so the EMI cap sees every committed loan
+        decision = decide_loan(customer, summary, datetime.now().year, loan_amount, interest_rate, tenure, quote)
+        if not decision.approved:
+            return None, decision
+
+        loan = approved_loan(customer, loan_amount, tenure, decision, datetime.today().date())
+        # The summary is already locked here, so fold the loan in directly
+        # instead of letting the post_save handler lock it a second time
+        loan._summary_applied = True
+        loan.save(force_insert=True)
+        add_loan_to_summary(summary, loan)
+        summary.save()
+        save_schedules(schedules_for_loans([loan]))
+        return loan, decision
+
+
+def create_loan(customer, loan_amount, interest_rate, tenure, quote=None):
+    """
+    Score the request and, if approved, insert the loan while holding the
+    customer's summary row lock, so concurrent requests for the same
+    customer cannot both pass the EMI cap. A signed eligibility quote for
+    the same terms is reused instead of re-scoring when the locked summary
+    shows the customer's state is unchanged. Lock timeouts are retried with
+    jittered exponential backoff. Returns (loan or None, LoanDecision).
+    """
+    if quote:
+        quote = load_quote(quote, customer.pk, loan_amount, interest_rate, tenure)
+    retries = settings.LOANS_CREATE_LOCK_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            return _create_loan_locked(customer, loan_amount, interest_rate, tenure, quote)
+        except OperationalError as exc:
+            if not _is_lock_timeout(exc) or attempt == retries:
+                metrics.incr('loans.create_loan.lock_failures')
+                raise
+            metrics.incr('loans.create_loan.lock_retries')
+            time.sleep(settings.LOANS_CREATE_LOCK_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
@@ -0,0 +1,197 @@
+"""
+Portfolio-wide credit score snapshots.
+
+run_score_snapshot() scores every customer in customer id chunks: one
+query for the customers, one for their loan summaries (plus a grouped
+aggregate for the rare customer with loans but no summary), the scoring
+rules applied to whole NumPy columns, and a bulk insert. Each run is a
+new version; older runs are pruned once a run completes.
+
+When LOANS_ELIGIBILITY_FROM_SNAPSHOT is enabled the eligibility endpoints
+take a customer's score from the latest snapshot instead of recomputing
+it, provided the snapshot is younger than CREDIT_SNAPSHOT_MAX_AGE, was
+taken for the current year, and the customer's loan summary and approved
+limit have not changed since.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from customers.models import Customer
+from .models import CreditScoreSnapshot, CustomerLoanSummary, Loan, ScoreSnapshotRun
+from .utils import CreditFactors, CreditScore, credit_factor_aggregates
+
+FACTOR_FIELDS = ['loan_count', 'current_year_loans', 'total_tenure', 'on_time_emis', 'total_loan_amount', 'total_emi']
+
+
+def score_credit_factors_array(loan_count, current_year_loans, total_tenure, on_time_emis,
+                               total_loan_amount, approved_limit):
+    """Array version of score_credit_factors; returns the score and each deduction."""
+    loan_count = np.asarray(loan_count, dtype=np.int64)
+    total_tenure = np.asarray(total_tenure, dtype=np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(total_tenure > 0, np.asarray(on_time_emis) / total_tenure, 0)
+    on_time_penalty = np.where(loan_count > 0, np.trunc((1 - ratio) * 40), 0).astype(np.int64)
+    loan_count_penalty = np.where(loan_count > 5, 10, 0)
+    current_year_penalty = np.where(np.asarray(current_year_loans) > 2, 10, 0)
+    over_approved_limit = np.asarray(total_loan_amount) > np.asarray(approved_limit)
+
+    score = 100 - on_time_penalty - loan_count_penalty - current_year_penalty
+    score = np.where(over_approved_limit, 0, np.maximum(score, 0))
+    return {
+        'score': score,
+        'on_time_penalty': on_time_penalty,
+        'loan_count_penalty': loan_count_penalty,
+        'current_year_penalty': current_year_penalty,
+        'over_approved_limit': over_approved_limit,
+    }
+
+
+def _chunk_factors(customer_ids, year):
+    """Factor columns (plus summary_updated_at) for a sorted chunk of customer ids."""
+    index = {customer_id: i for i, customer_id in enumerate(customer_ids)}
+    columns = {field: np.zeros(len(customer_ids)) for field in FACTOR_FIELDS}
+    summary_updated_at = [None] * len(customer_ids)
+
+    summaries = CustomerLoanSummary.objects.filter(
+        customer_id__gte=customer_ids[0], customer_id__lte=customer_ids[-1]
+    ).values_list(
+        'customer_id', 'loan_count', 'total_tenure', 'on_time_emis',
+        'total_loan_amount', 'total_emi', 'loans_per_year', 'updated_at',
+    )
+    missing = set(customer_ids)
+    for customer_id, count, tenure, on_time, amount, emi, per_year, updated_at in summaries:
+        i = index.get(customer_id)
+        if i is None:
+            continue
+        columns['loan_count'][i] = count
+        columns['current_year_loans'][i] = per_year.get(str(year), 0)
+        columns['total_tenure'][i] = tenure
+        columns['on_time_emis'][i] = on_time
+        columns['total_loan_amount'][i] = amount
+        columns['total_emi'][i] = emi
+        summary_updated_at[i] = updated_at
+        missing.discard(customer_id)
+
+    if missing:
+        rows = (
+            Loan.objects.filter(customer_id__in=missing)
+            .values('customer_id')
+            .annotate(**credit_factor_aggregates(year))
+            .order_by()
+        )
+        for row in rows:
+            i = index[row['customer_id']]
+            for field in FACTOR_FIELDS:
+                columns[field][i] = row[field] or 0
+    return columns, summary_updated_at
+
+
+def run_score_snapshot(chunk_size=None, year=None):
+    """Score every customer into a new ScoreSnapshotRun and return the run."""
+    chunk_size = chunk_size or settings.CREDIT_SNAPSHOT_CHUNK_SIZE
+    year = year or datetime.now().year
+    run = ScoreSnapshotRun.objects.create(year=year, started_at=timezone.now())
+
+    customers = Customer.objects.order_by('customer_id').values_list('customer_id', 'approved_limit')
+    last_id = 0
+    while True:
+        chunk = list(customers.filter(customer_id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        customer_ids, approved_limits = (list(column) for column in zip(*chunk))
+        last_id = customer_ids[-1]
+
+        columns, summary_updated_at = _chunk_factors(customer_ids, year)
+        scores = score_credit_factors_array(
+            columns['loan_count'], columns['current_year_loans'], columns['total_tenure'],
+            columns['on_time_emis'], columns['total_loan_amount'], approved_limits,
+        )
+        CreditScoreSnapshot.objects.bulk_create([
+            CreditScoreSnapshot(
+                run=run,
+                customer_id=customer_id,
+                approved_limit=approved_limits[i],
+                summary_updated_at=summary_updated_at[i],
+                loan_count=int(columns['loan_count'][i]),
+                current_year_loans=int(columns['current_year_loans'][i]),
+                total_tenure=int(columns['total_tenure'][i]),
+                on_time_emis=int(columns['on_time_emis'][i]),
+                total_loan_amount=float(columns['total_loan_amount'][i]),
+                total_emi=float(columns['total_emi'][i]),
+                score=int(scores['score'][i]),
+                on_time_penalty=int(scores['on_time_penalty'][i]),
+                loan_count_penalty=int(scores['loan_count_penalty'][i]),
+                current_year_penalty=int(scores['current_year_penalty'][i]),
+                over_approved_limit=bool(scores['over_approved_limit'][i]),
+            )
+            for i, customer_id in enumerate(customer_ids)
+        ], batch_size=5000)
+        run.customer_count += len(customer_ids)
+
+    run.completed_at = timezone.now()
+    run.save(update_fields=['completed_at', 'customer_count'])
+    prune_score_snapshots(settings.CREDIT_SNAPSHOT_KEEP_RUNS)
+    return run
+
+
+def prune_score_snapshots(keep):
+    """Delete all but the `keep` most recent completed runs (and any older unfinished ones)."""
+    completed = ScoreSnapshotRun.objects.filter(completed_at__isnull=False).order_by('-pk')
+    kept = list(completed.values_list('pk', flat=True)[:keep])
+    if not kept:
+        return 0
+    stale = ScoreSnapshotRun.objects.filter(pk__lt=min(kept)).exclude(pk__in=kept)
+    CreditScoreSnapshot.objects.filter(run__in=stale).delete()
+    deleted, _ = stale.delete()
+    return deleted
+
+
+def _fresh_snapshots(customer_ids, year):
+    cutoff = timezone.now() - timedelta(seconds=settings.CREDIT_SNAPSHOT_MAX_AGE)
+    return (
+        CreditScoreSnapshot.objects.filter(
+            customer_id__in=customer_ids, run__year=year, run__completed_at__gte=cutoff,
+        )
+        .filter(
+            Q(summary_updated_at=F('customer__loan_summary__updated_at'))
+            | Q(summary_updated_at__isnull=True, customer__loan_summary__isnull=True)
+        )
+        .order_by('customer_id', '-run_id')
+    )
+
+
+def _credit_score(snapshot):
+    return CreditScore(
+        score=snapshot.score,
+        factors=CreditFactors(**{field: getattr(snapshot, field) for field in FACTOR_FIELDS}),
+        on_time_penalty=snapshot.on_time_penalty,
+        loan_count_penalty=snapshot.loan_count_penalty,
+        current_year_penalty=snapshot.current_year_penalty,
+        over_approved_limit=snapshot.over_approved_limit,
+    )
+
+
+def _latest_scores(snapshots, customers):
+    approved_limits = {customer.pk: customer.approved_limit for customer in customers}
+    scores = {}
+    for snapshot in snapshots:
+        if snapshot.customer_id not in scores and snapshot.approved_limit == approved_limits[snapshot.customer_id]:
+            scores[snapshot.customer_id] = _credit_score(snapshot)
+    return scores
+
+
+def fresh_credit_scores(customers, year=None):
+    """CreditScore per customer id for the customers whose latest snapshot is still valid."""
+    customers = list(customers)
+    year = year or datetime.now().year
+    return _latest_scores(_fresh_snapshots([c.pk for c in customers], year), customers)
+
+
+async def afresh_credit_scores(customers, year=None):
+    """Async ORM counterpart of fresh_credit_scores."""
+    customers = list(customers)
+    year = year or datetime.now().year
+    snapshots = [s async for s in _fresh_snapshots([c.pk for c in customers], year)]
+    return _latest_scores(snapshots, customers)
@@ -0,0 +1,173 @@
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import ExtractYear
+from loans.models import CustomerLoanSummary, Loan
+
+
+def _summary_totals():
+    return {
+        'loan_count': Count('loan_id'),
+        'total_tenure': Sum('tenure'),
+        'on_time_emis': Sum('emis_paid_on_time'),
+        'total_loan_amount': Sum('loan_amount'),
+        'total_emi': Sum('monthly_repayment'),
+    }
+
+
+def _summary_from_row(customer_id, row, loans_per_year):
+    return CustomerLoanSummary(
+        customer_id=customer_id,
+        loan_count=row['loan_count'] or 0,
+        total_tenure=row['total_tenure'] or 0,
+        on_time_emis=row['on_time_emis'] or 0,
+        total_loan_amount=row['total_loan_amount'] or 0.0,
+        total_emi=row['total_emi'] or 0.0,
+        loans_per_year=loans_per_year,
+    )
+
+
+def _loans_per_year(loans):
+    per_year = {}
+    rows = (
+        loans.annotate(year=ExtractYear('start_date'))
+        .values('customer_id', 'year')
+        .annotate(count=Count('loan_id'))
+        .order_by()
+    )
+    for row in rows:
+        per_year.setdefault(row['customer_id'], {})[str(row['year'])] = row['count']
+    return per_year
+
+
+def _recompute_summary(customer_id):
+    # Caller holds the summary row lock (or has just created the row)
+    loans = Loan.objects.filter(customer_id=customer_id)
+    row = loans.aggregate(**_summary_totals())
+    summary = _summary_from_row(customer_id, row, _loans_per_year(loans).get(customer_id, {}))
+    summary.save(force_update=True)
+    return summary
+
+
+def refresh_customer_summary(customer_id):
+    """
+    Recompute one customer's summary from their loans. The summary row is
+    locked before the loans are aggregated, so an increment from
+    apply_loan_created or record_payment cannot be overwritten by a stale total.
+    """
+    with transaction.atomic():
+        CustomerLoanSummary.objects.select_for_update().get_or_create(customer_id=customer_id)
+        return _recompute_summary(customer_id)
+
+
+def lock_customer_summary(customer_id):
+    """
+    Return the customer's summary row locked FOR UPDATE until the end of
+    the current transaction, creating it first if needed. Other customers'
+    rows are unaffected.
+    """
+    summary, created = (
+        CustomerLoanSummary.objects.select_for_update()
+        .get_or_create(customer_id=customer_id)
+    )
+    if created:
+        # The new row is already ours; fill it from any existing loans
+        return _recompute_summary(customer_id)
+    return summary
+
+
+def lock_customer_summaries(customer_ids):
+    """
+    lock_customer_summary for many customers: {customer_id: summary}, with
+    existing rows locked in one query in customer id order.
+    """
+    customer_ids = sorted(set(customer_ids))
+    summaries = {
+        summary.customer_id: summary
+        for summary in CustomerLoanSummary.objects.select_for_update()
+        .filter(customer_id__in=customer_ids).order_by('customer_id')
+    }
+    for customer_id in customer_ids:
+        if customer_id not in summaries:
+            summaries[customer_id] = lock_customer_summary(customer_id)
+    return summaries
+
+
+def add_loan_to_summary(summary, loan):
+    """Fold a new loan into a summary in memory; the caller saves it."""
+    year = str(loan.start_date.year)
+    summary.loan_count += 1
+    summary.total_tenure += loan.tenure
+    summary.on_time_emis += loan.emis_paid_on_time
+    summary.total_loan_amount += loan.loan_amount
+    summary.total_emi += loan.monthly_repayment
+    summary.loans_per_year[year] = summary.loans_per_year.get(year, 0) + 1
+
+
+def apply_loan_created(loan):
+    """
+    Fold a newly created loan into its customer's summary. The summary
+    row is locked for the rest of the enclosing transaction so concurrent
+    creates for the same customer apply one after the other.
+    """
+    with transaction.atomic():
+        summary, created = (
+            CustomerLoanSummary.objects.select_for_update()
+            .get_or_create(customer_id=loan.customer_id)
+        )
+        if created:
+            # No summary yet: the customer may have loans that predate it
+            return _recompute_summary(loan.customer_id)
+
+        add_loan_to_summary(summary, loan)
+        summary.save()
+        return summary
+
+
+def rebuild_loan_summaries(chunk_size=10000):
+    """
+    Rebuild every summary from the loan table, a range of customer ids at
+    a time. Used after bulk writes that bypass model signals (ingestion).
+    Returns the number of summaries written.
+    """
+    written = 0
+    with transaction.atomic():
+        CustomerLoanSummary.objects.all().delete()
+        bounds = Loan.objects.aggregate(low=Min('customer_id'), high=Max('customer_id'))
+        if bounds['low'] is None:
+            return written
+
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            loans = Loan.objects.filter(customer_id__gte=start, customer_id__lt=start + chunk_size)
+            per_year = _loans_per_year(loans)
+            rows = loans.values('customer_id').annotate(**_summary_totals()).order_by()
+            summaries = [
+                _summary_from_row(row['customer_id'], row, per_year.get(row['customer_id'], {}))
+                for row in rows
+            ]
+            CustomerLoanSummary.objects.bulk_create(summaries, batch_size=1000)
+            written += len(summaries)
+    return written
+
+
+def loan_saved(sender, instance, created, raw=False, **kwargs):
+    if created and instance.__dict__.pop('_summary_applied', False):
+        # create_loan folds the loan into the summary it already holds locked
+        return
+    if created and not raw:
+        apply_loan_created(instance)
+        return
+    previous = instance.previous_customer_id
+    if previous is None:
+        refresh_customer_summary(instance.customer_id)
+        return
+    # The loan moved to another customer: both summaries change. Lock them in
+    # customer id order, like lock_customer_summaries, to avoid deadlocks
+    with transaction.atomic():
+        for customer_id in sorted([previous, instance.customer_id]):
+            refresh_customer_summary(customer_id)
+
+
+def loan_deleted(sender, instance, **kwargs):
+    # Skip when the summary is already gone, e.g. the customer is being deleted
+    if CustomerLoanSummary.objects.filter(customer_id=instance.customer_id).exists():
+        refresh_customer_summary(instance.customer_id)
@@ -0,0 +1,35 @@
+import urllib.error
+from celery import shared_task
+from django.conf import settings
+from .applications import deliver_callback, process_applications
+from .snapshots import run_score_snapshot
+
+
+@shared_task
+def snapshot_credit_scores(chunk_size=None):
+    """Nightly: score every customer into a new snapshot run (see loans/snapshots.py)."""
+    run = run_score_snapshot(chunk_size)
+    return {"run": run.pk, "customers": run.customer_count}
+
+
+@shared_task
+def process_loan_applications(batch_size=None):
+    """Decide pending loan applications batch by batch until none are left."""
+    batch_size = batch_size or settings.LOANS_APPLICATION_BATCH_SIZE
+    decided = batches = 0
+    while True:
+        batch = process_applications(batch_size)
+        decided += len(batch)
+        batches += bool(batch)
+        if len(batch) < batch_size:
+            return {"decided": decided, "batches": batches}
+
+
+@shared_task(
+    autoretry_for=(urllib.error.URLError, TimeoutError),
+    retry_backoff=10,
+    retry_kwargs={'max_retries': 6},
+)
+def send_application_callback(application_id):
+    """POST a decided application to its callback URL, retrying with backoff."""
+    return deliver_callback(application_id)
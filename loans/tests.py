@@ -1,20 +1,70 @@
-from datetime import date, timedelta
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+from io import StringIO
+from unittest import mock, skipUnless
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from core import metrics
+from core.cache import credit_key
+from core.middleware import QueryBudgetExceeded
+from core.renderers import FastJSONRenderer, NDJSONRenderer
 from customers.models import Customer
-from loans.models import Loan
+from customers.testing import make_customer
+from loans.applications import deliver_callback, process_applications
+from loans.models import (
+    CreditScoreSnapshot, CustomerLoanSummary, Loan, LoanApplication, LoanSchedule, ScoreSnapshotRun,
+)
+from loans import services
+from loans.quotes import load_quote
+from loans.summary import lock_customer_summary, rebuild_loan_summaries, refresh_customer_summary
+from loans.tasks import process_loan_applications
+from loans.amortization import amortization_schedule, calculate_emi_array
+from loans.schedules import unpack_balances
+from loans.snapshots import fresh_credit_scores, run_score_snapshot, score_credit_factors_array
+from loans.utils import (
+    CreditFactors, calculate_credit_breakdown, calculate_credit_score, calculate_emi, credit_factor_aggregates,
+    score_credit_factors,
+)
+
+
+def assert_same_eligibility(test, body, expected, application):
+    """
+    Compare two eligibility bodies apart from their quotes, which are
+    timestamped to the second, and check each quote is valid for the terms.
+    """
+    body, expected = dict(body), dict(expected)
+    quotes = [body.pop('quote', None), expected.pop('quote', None)]
+    test.assertEqual(body, expected)
+    test.assertEqual(quotes[0] is None, quotes[1] is None)
+    for quote in filter(None, quotes):
+        test.assertIsNotNone(load_quote(
+            quote, application['customer_id'],
+            application['loan_amount'], application['interest_rate'], application['tenure'],
+        ))
+
 
 class LoanTests(APITestCase):
     def setUp(self):
-        self.customer = Customer.objects.create(
-            first_name="John",
-            last_name="Doe",
-            age=35,
-            phone_number="9876543210",
-            monthly_salary=80000,
-            approved_limit=3000000
-        )
+        self.customer = make_customer("9876543210", age=35)
 
     def test_check_eligibility(self):
         url = reverse('check-eligibility')
@@ -65,6 +115,23 @@ class LoanTests(APITestCase):
         self.assertIn(response.status_code, [status.HTTP_400_BAD_REQUEST, status.HTTP_200_OK])
         self.assertIn("error", response.data)
 
+    def test_negative_interest_rate_is_rejected(self):
+        data = {"customer_id": self.customer.customer_id, "loan_amount": 100000, "interest_rate": -5, "tenure": 12}
+        for url in (reverse('check-eligibility'), reverse('create-loan'), reverse('async-create-loan')):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+            self.assertIn("interest_rate", response.json())
+
+        response = self.client.post(reverse('create-loan'), data, format='json', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Loan.objects.exists())
+        self.assertFalse(LoanApplication.objects.exists())
+
+        response = self.client.post(reverse('check-eligibility-batch'), [data], format='json')
+        result, = response.json()["results"]
+        self.assertEqual(result["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertIn("interest_rate", result["response"])
+
     def test_view_loans(self):
         Loan.objects.create(
             customer=self.customer,
@@ -80,7 +147,1096 @@ class LoanTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(len(response.data), 0)
 
+    def test_view_loan_is_one_query_then_cached(self):
+        cache.clear()
+        loan = Loan.objects.create(
+            customer=self.customer,
+            loan_amount=100000,
+            tenure=12,
+            interest_rate=10,
+            monthly_repayment=8791.59,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=365)
+        )
+        url = reverse('view-loan', args=[loan.loan_id])
+        with self.assertNumQueries(1):
+            first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.data['customer']['first_name'], self.customer.first_name)
+
+        loan.interest_rate = 11
+        loan.save()
+        self.assertEqual(self.client.get(url).data['interest_rate'], 11)
+
+        self.customer.first_name = "Renamed"
+        self.customer.save()
+        self.assertEqual(self.client.get(url).data['customer']['first_name'], "Renamed")
+
+        response = self.client.get(reverse('view-loan', args=[99999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, {"detail": "No Loan matches the given query."})
+
     def test_view_loans_invalid_customer(self):
         url = reverse('view-customer-loans', args=[9999])  # invalid customer
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_check_eligibility_batch_matches_single(self):
+        applications = [
+            {"customer_id": self.customer.customer_id, "loan_amount": 100000, "interest_rate": 10, "tenure": 12},
+            {"customer_id": self.customer.customer_id, "loan_amount": 5000000, "interest_rate": 12, "tenure": 12},
+            {"customer_id": 99999, "loan_amount": 100000, "interest_rate": 10, "tenure": 12},
+            {"customer_id": self.customer.customer_id, "loan_amount": -1, "interest_rate": 10, "tenure": 12},
+        ]
+        response = self.client.post(reverse('check-eligibility-batch'), applications, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        results = response.data['results']
+        self.assertEqual(len(results), len(applications))
+        for application, result in zip(applications, results):
+            single = self.client.post(reverse('check-eligibility'), application, format='json')
+            self.assertEqual(result['status'], single.status_code)
+            assert_same_eligibility(self, result['response'], single.data, application)
+
+    def test_check_eligibility_batch_ndjson(self):
+        body = "\n".join([
+            '{"customer_id": %d, "loan_amount": 100000, "interest_rate": 10, "tenure": 12}' % self.customer.customer_id,
+            '{"customer_id": "abc"}',
+        ])
+        response = self.client.post(
+            reverse('check-eligibility-batch'), body, content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['status'], status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][1]['status'], status.HTTP_400_BAD_REQUEST)
+
+    def test_check_eligibility_is_cached(self):
+        cache.clear()
+        url = reverse('check-eligibility')
+        data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 100000,
+            "interest_rate": 10,
+            "tenure": 12
+        }
+        first = self.client.post(url, data, format='json')
+        with self.assertNumQueries(0):
+            second = self.client.post(url, data, format='json')
+        self.assertEqual(first.data, second.data)
+
+        self.client.force_login(User.objects.create_user('metrics', is_staff=True))
+        stats = self.client.get(reverse('cache-stats')).data
+        self.assertGreaterEqual(stats['customer']['hits'], 1)
+        self.assertGreaterEqual(stats['credit']['hits'], 1)
+
+    def test_create_loan_invalidates_cached_credit(self):
+        cache.clear()
+        url = reverse('check-eligibility')
+        data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 400000,
+            "interest_rate": 10,
+            "tenure": 12
+        }
+        self.assertTrue(self.client.post(url, data, format='json').data['approval'])
+        self.client.post(reverse('create-loan'), data, format='json')
+
+        # The first loan's EMI now counts against the 50% salary cap
+        response = self.client.post(url, data, format='json')
+        self.assertFalse(response.data['approval'])
+        self.assertEqual(response.data['reason'], "EMI exceeds 50% of monthly salary")
+
+    def test_create_loan_idempotency_key(self):
+        url = reverse('create-loan')
+        data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 100000,
+            "interest_rate": 10,
+            "tenure": 12
+        }
+        first = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='loan-key-1')
+        retry = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='loan-key-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 1)
+
+        data["loan_amount"] = 200000
+        reused = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='loan-key-1')
+        self.assertEqual(reused.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_idempotency_store_failure_keeps_the_response(self):
+        metrics.reset()
+        data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 100000,
+            "interest_rate": 10,
+            "tenure": 12
+        }
+        with mock.patch('core.idempotency.cache.set', side_effect=ConnectionError("redis down")), \
+                self.assertLogs('core.idempotency', 'WARNING'):
+            response = self.client.post(reverse('create-loan'), data, format='json', HTTP_IDEMPOTENCY_KEY='loan-key-2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 1)
+        self.assertEqual(metrics.snapshot()['counters']['idempotency.errors'], 1)
+
+    def test_view_loans_cursor_pagination(self):
+        for tenure in range(1, 6):
+            Loan.objects.create(
+                customer=self.customer,
+                loan_amount=100000,
+                tenure=tenure,
+                interest_rate=10,
+                monthly_repayment=1000,
+                emis_paid_on_time=1,
+                start_date=date.today(),
+                end_date=date.today() + timedelta(days=30 * tenure)
+            )
+        url = reverse('view-customer-loans', args=[self.customer.customer_id])
+
+        loan_ids, cursor = [], None
+        while True:
+            params = {"limit": 2, "fields": "loan_id,repayments_left"}
+            if cursor:
+                params["cursor"] = cursor
+            with self.assertNumQueries(1):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(all(set(row) == {"loan_id", "repayments_left"} for row in response.data))
+            loan_ids += [row["loan_id"] for row in response.data]
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        expected = list(Loan.objects.filter(customer=self.customer).order_by('loan_id'))
+        self.assertEqual(loan_ids, [loan.loan_id for loan in expected])
+        response = self.client.get(url, {"limit": 1})
+        self.assertEqual(response.data[0]["repayments_left"], expected[0].tenure - 1)
+        self.assertIn('rel="next"', response["Link"])
+
+    def test_view_loans_invalid_params(self):
+        url = reverse('view-customer-loans', args=[self.customer.customer_id])
+        self.assertEqual(self.client.get(url, {"fields": "loan_id,ssn"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"limit": 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"cursor": "abc"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CreditScoreTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer("9876500000", age=40, monthly_salary=100000, approved_limit=1000000)
+
+    def add_loan(self, loan_amount=100000, tenure=10, emis_paid_on_time=10, start_date=None):
+        start_date = start_date or date.today()
+        return Loan.objects.create(
+            customer=self.customer,
+            loan_amount=loan_amount,
+            tenure=tenure,
+            interest_rate=10,
+            monthly_repayment=1000,
+            emis_paid_on_time=emis_paid_on_time,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=tenure * 30)
+        )
+
+    def test_no_loans_scores_full(self):
+        self.assertEqual(calculate_credit_score(self.customer), 100)
+
+    def test_breakdown_factors(self):
+        last_year = date.today().replace(year=date.today().year - 1)
+        for _ in range(3):
+            self.add_loan(emis_paid_on_time=5)
+        for _ in range(3):
+            self.add_loan(start_date=last_year)
+
+        with self.assertNumQueries(1):
+            credit = calculate_credit_breakdown(self.customer)
+
+        self.assertEqual(credit.factors.loan_count, 6)
+        self.assertEqual(credit.factors.current_year_loans, 3)
+        self.assertEqual(credit.factors.total_emi, 6000)
+        self.assertEqual(credit.on_time_penalty, 10)
+        self.assertEqual(credit.loan_count_penalty, 10)
+        self.assertEqual(credit.current_year_penalty, 10)
+        self.assertEqual(credit.score, 70)
+
+    def test_volume_over_approved_limit(self):
+        self.add_loan(loan_amount=2000000)
+        credit = calculate_credit_breakdown(self.customer)
+        self.assertTrue(credit.over_approved_limit)
+        self.assertEqual(credit.score, 0)
+
+    def test_summary_tracks_loan_writes(self):
+        loan = self.add_loan(loan_amount=100000, tenure=10, emis_paid_on_time=4)
+        self.add_loan(loan_amount=50000, tenure=5, emis_paid_on_time=5)
+
+        summary = CustomerLoanSummary.objects.get(customer=self.customer)
+        self.assertEqual(summary.loan_count, 2)
+        self.assertEqual(summary.total_tenure, 15)
+        self.assertEqual(summary.on_time_emis, 9)
+        self.assertEqual(summary.total_loan_amount, 150000)
+        self.assertEqual(summary.loans_per_year, {str(date.today().year): 2})
+
+        loan.emis_paid_on_time = 10
+        loan.save()
+        self.assertEqual(CustomerLoanSummary.objects.get(customer=self.customer).on_time_emis, 15)
+
+        loan.delete()
+        self.assertEqual(CustomerLoanSummary.objects.get(customer=self.customer).loan_count, 1)
+
+        self.customer.delete()
+        self.assertFalse(CustomerLoanSummary.objects.exists())
+
+    def test_reassigned_loan_moves_between_summaries(self):
+        other = make_customer("9876500001")
+        loan = self.add_loan(loan_amount=100000, tenure=10)
+        self.add_loan(loan_amount=50000, tenure=6, emis_paid_on_time=6)
+        cache.set(credit_key(self.customer.pk), 'stale')
+
+        # As an admin edit would: load the loan, point it at another customer, save
+        loan = Loan.objects.get(pk=loan.pk)
+        loan.customer = other
+        loan.save()
+
+        summary = CustomerLoanSummary.objects.get(customer=self.customer)
+        self.assertEqual((summary.loan_count, summary.total_loan_amount, summary.total_tenure), (1, 50000, 6))
+        summary = CustomerLoanSummary.objects.get(customer=other)
+        self.assertEqual((summary.loan_count, summary.total_loan_amount, summary.total_tenure), (1, 100000, 10))
+        self.assertIsNone(cache.get(credit_key(self.customer.pk)))
+
+        # Saving again does not touch the first customer's summary any more
+        with CaptureQueriesContext(connection) as context:
+            loan.save()
+        self.assertFalse(any(
+            f'"customer_id" = {self.customer.pk}' in query['sql'] for query in context.captured_queries
+        ))
+
+    def test_refresh_locks_summary_before_aggregating(self):
+        self.add_loan(loan_amount=100000, tenure=10, emis_paid_on_time=4)
+        with CaptureQueriesContext(connection) as context:
+            summary = refresh_customer_summary(self.customer.pk)
+        self.assertEqual(summary.loan_count, 1)
+        queries = [query['sql'] for query in context.captured_queries if 'savepoint' not in query['sql'].lower()]
+        self.assertIn('loans_customerloansummary', queries[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', queries[0])
+
+    def test_create_loan_reads_summary_once(self):
+        self.add_loan(loan_amount=100000, tenure=10, emis_paid_on_time=4)
+        with CaptureQueriesContext(connection) as context:
+            loan, _ = services.create_loan(self.customer, 10000, 14, 12)
+        self.assertIsNotNone(loan)
+        reads = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'loans_customerloansummary' in query['sql']
+        ]
+        self.assertEqual(len(reads), 1)
+        summary = CustomerLoanSummary.objects.get(customer=self.customer)
+        self.assertEqual((summary.loan_count, summary.total_tenure), (2, 22))
+
+    def test_rebuild_matches_incremental(self):
+        for _ in range(3):
+            self.add_loan()
+        expected = calculate_credit_breakdown(self.customer)
+
+        CustomerLoanSummary.objects.all().delete()
+        self.assertEqual(calculate_credit_breakdown(self.customer), expected)
+
+        self.assertEqual(rebuild_loan_summaries(), 1)
+        self.assertEqual(calculate_credit_breakdown(self.customer), expected)
+
+
+class AmortizationTests(SimpleTestCase):
+    def test_emi_array_matches_scalar(self):
+        principal = [100000, 250000.5, 5000000, 1200]
+        rate = [10, 13.37, 0.01, 0]
+        tenure = [12, 36, 240, 7]
+        emis = calculate_emi_array(principal, rate, tenure)
+        for i, emi in enumerate(emis):
+            self.assertEqual(emi, calculate_emi(principal[i], rate[i], tenure[i]))
+
+    def test_schedule_closes_at_zero(self):
+        schedule = amortization_schedule([100000, 1200], [10, 0], [12, 3])
+        self.assertEqual(schedule.balance.shape, (2, 12))
+        np.testing.assert_allclose(schedule.principal.sum(axis=1), [100000, 1200])
+        self.assertEqual(schedule.balance[0, 11], 0)
+        self.assertEqual(schedule.payment[1, 3:].sum(), 0)
+        self.assertEqual(schedule.payment[0, 0], schedule.emi[0])
+
+
+class CreateLoanLockingTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer("9876511111")
+
+    def lock_timeout(self):
+        cause = Exception("canceling statement due to lock timeout")
+        cause.pgcode = services.LOCK_NOT_AVAILABLE
+        exc = OperationalError("lock timeout")
+        exc.__cause__ = cause
+        return exc
+
+    def test_emi_cap_sees_committed_loans(self):
+        loan, decision = services.create_loan(self.customer, 400000, 10, 12)
+        self.assertIsNotNone(loan)
+        loan, decision = services.create_loan(self.customer, 400000, 10, 12)
+        self.assertIsNone(loan)
+        self.assertEqual(decision.reason, "EMI exceeds 50% of monthly salary")
+        self.assertIn('loans.create_loan.lock_wait', metrics.snapshot()['timers'])
+
+    @override_settings(LOANS_CREATE_LOCK_BACKOFF=0)
+    def test_lock_timeout_is_retried(self):
+        summary = lock_customer_summary(self.customer.pk)
+        with mock.patch.object(
+            services, 'lock_customer_summary', side_effect=[self.lock_timeout(), summary]
+        ) as lock:
+            loan, _ = services.create_loan(self.customer, 100000, 10, 12)
+        self.assertIsNotNone(loan)
+        self.assertEqual(lock.call_count, 2)
+
+    @override_settings(LOANS_CREATE_LOCK_BACKOFF=0, LOANS_CREATE_LOCK_RETRIES=1)
+    def test_lock_timeout_gives_up(self):
+        with mock.patch.object(services, 'lock_customer_summary', side_effect=self.lock_timeout()):
+            with self.assertRaises(OperationalError):
+                services.create_loan(self.customer, 100000, 10, 12)
+        self.assertFalse(Loan.objects.exists())
+
+
+class AsyncLoanViewTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer("9876522222")
+        self.data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 100000,
+            "interest_rate": 10,
+            "tenure": 12
+        }
+
+    async def test_check_eligibility_matches_sync(self):
+        response = await self.async_client.post(
+            reverse('async-check-eligibility'), self.data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = await self.async_client.post(
+            reverse('check-eligibility'), self.data, content_type='application/json'
+        )
+        assert_same_eligibility(self, response.json(), expected.json(), self.data)
+
+    async def test_create_and_view_loan(self):
+        response = await self.async_client.post(
+            reverse('async-create-loan'), self.data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        loan_id = response.json()['loan_id']
+
+        response = await self.async_client.get(reverse('async-view-loan', args=[loan_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['customer']['customer_id'], self.customer.customer_id)
+
+    async def test_invalid_requests(self):
+        response = await self.async_client.post(
+            reverse('async-check-eligibility'), dict(self.data, customer_id=99999),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.post(
+            reverse('async-create-loan'), dict(self.data, tenure=0), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.async_client.get(reverse('async-view-loan', args=[99999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_create_loan_honours_idempotency_key(self):
+        responses = [
+            await self.async_client.post(
+                reverse('async-create-loan'), self.data, content_type='application/json',
+                headers={'Idempotency-Key': 'async-loan-1'},
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+        self.assertEqual(responses[1].json(), responses[0].json())
+        self.assertEqual(await Loan.objects.filter(customer=self.customer).acount(), 1)
+
+    async def test_create_loan_honours_respond_async(self):
+        response = await self.async_client.post(
+            reverse('async-create-loan'), self.data, content_type='application/json',
+            headers={'Prefer': 'respond-async'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Location'], response.json()['status_url'])
+        self.assertFalse(await Loan.objects.aexists())
+
+    def test_asgi_entry_point_closes_connections_per_request(self):
+        # core.asgi sets its default before settings load, so check it in a fresh process
+        env = {k: v for k, v in os.environ.items() if k not in ('DB_CONN_MAX_AGE', 'DB_POOL')}
+        env['DJANGO_SETTINGS_MODULE'] = 'core.settings'
+        script = "import core.asgi; from django.conf import settings; print(settings.DATABASES['default']['CONN_MAX_AGE'])"
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(result.stdout.strip(), '0')
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_seeds_and_reports_latency(self):
+        cache.clear()
+        out = StringIO()
+        call_command(
+            'benchmark', '--seed-data', '--customers', '20', '--loans-per-customer', '2',
+            '--requests', '50', '--random-seed', '1', stdout=out, stderr=StringIO()
+        )
+        report = json.loads(out.getvalue())
+
+        registered = report['endpoints']['register']['status_codes'].get('201', 0)
+        self.assertEqual(Customer.objects.count(), 20 + registered)
+        self.assertEqual(CustomerLoanSummary.objects.count(), 20)
+        self.assertEqual(report['overall']['requests'], 50)
+        self.assertEqual(report['overall']['errors'], 0)
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'queries_per_request'):
+            self.assertIn(key, report['overall'])
+        self.assertGreater(report['endpoints']['check-eligibility']['queries_per_request'], 0)
+
+
+class EligibilityQuoteTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.customer = make_customer("9876555555")
+        self.data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 100000,
+            "interest_rate": 10,
+            "tenure": 12
+        }
+
+    def quote(self, data=None):
+        response = self.client.post(reverse('check-eligibility'), data or self.data, format='json')
+        return response.data.get('quote')
+
+    def test_create_loan_redeems_quote(self):
+        quote = self.quote()
+        with mock.patch('loans.services.score_credit_factors') as score:
+            response = self.client.post(reverse('create-loan'), {**self.data, "quote": quote}, format='json')
+        score.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['monthly_installment'], 8791.59)
+        self.assertEqual(metrics.snapshot()['counters']['loans.quote.redeemed'], 1)
+
+    def test_quote_not_issued_when_declined(self):
+        self.assertIsNone(self.quote({**self.data, "loan_amount": 5000000}))
+
+    def test_stale_quote_is_re_evaluated(self):
+        quote = self.quote()
+        self.client.post(reverse('create-loan'), self.data, format='json')
+
+        response = self.client.post(reverse('create-loan'), {**self.data, "quote": quote}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(metrics.snapshot()['counters']['loans.quote.stale'], 1)
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 2)
+
+    def test_quote_for_other_terms_is_ignored(self):
+        quote = self.quote()
+        response = self.client.post(
+            reverse('create-loan'), {**self.data, "loan_amount": 200000, "quote": quote}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['monthly_installment'], calculate_emi(200000, 10, 12))
+        self.assertEqual(metrics.snapshot()['counters']['loans.quote.mismatched'], 1)
+
+    def test_tampered_quote_is_ignored(self):
+        quote = self.quote()
+        response = self.client.post(reverse('create-loan'), {**self.data, "quote": quote[:-2] + "xx"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(metrics.snapshot()['counters']['loans.quote.invalid'], 1)
+
+    @override_settings(LOANS_QUOTE_TTL=0)
+    def test_expired_quote_is_ignored(self):
+        quote = self.quote()
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 5):
+            response = self.client.post(reverse('create-loan'), {**self.data, "quote": quote}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(metrics.snapshot()['counters']['loans.quote.expired'], 1)
+
+
+class LoanScheduleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = make_customer("9876566666")
+        response = self.client.post(reverse('create-loan'), {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 100000,
+            "interest_rate": 10,
+            "tenure": 12
+        }, format='json')
+        self.loan = Loan.objects.get(pk=response.data['loan_id'])
+        self.expected = amortization_schedule(100000, 10, 12).balance[0]
+
+    def pay(self, loan_id, **data):
+        return self.client.post(reverse('record-payment', args=[loan_id]), data, format='json')
+
+    def test_create_loan_stores_schedule(self):
+        self.assertEqual(self.loan.end_date, self.loan.start_date + relativedelta(months=12))
+        schedule = self.loan.schedule
+        np.testing.assert_array_equal(unpack_balances(schedule.balances), self.expected)
+        self.assertEqual(schedule.installments_paid, 0)
+        self.assertEqual(schedule.outstanding_principal, 100000)
+
+    def test_record_payment(self):
+        response = self.pay(self.loan.loan_id, installments=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['installments_paid'], 2)
+        self.assertEqual(response.data['emis_paid_on_time'], 2)
+        self.assertEqual(response.data['repayments_left'], 10)
+        self.assertEqual(response.data['outstanding_principal'], round(self.expected[1], 2))
+        self.assertEqual(CustomerLoanSummary.objects.get(customer=self.customer).on_time_emis, 2)
+
+        response = self.pay(self.loan.loan_id, on_time=False)
+        self.assertEqual(response.data['installments_paid'], 3)
+        self.assertEqual(response.data['emis_paid_on_time'], 2)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.emis_paid_on_time, 2)
+
+    def test_record_payment_updates_credit_score(self):
+        before = calculate_credit_breakdown(self.customer)
+        self.pay(self.loan.loan_id, installments=12)
+        self.assertEqual(LoanSchedule.objects.get(pk=self.loan.pk).outstanding_principal, 0)
+        after = calculate_credit_breakdown(self.customer)
+        self.assertGreater(after.score, before.score)
+
+    def test_record_payment_rejects_overpayment(self):
+        response = self.pay(self.loan.loan_id, installments=13)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], "Only 12 installments remain on this loan")
+
+    def test_record_payment_unknown_loan(self):
+        response = self.pay(999999)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_record_payment_builds_missing_schedule(self):
+        self.loan.schedule.delete()
+        response = self.pay(self.loan.loan_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['outstanding_principal'], round(self.expected[0], 2))
+
+    def test_portfolio_outstanding(self):
+        start = self.loan.start_date
+        response = self.client.get(
+            reverse('portfolio-outstanding'), {"from": start.strftime('%Y-%m'), "months": 14}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        outstanding = [row['outstanding'] for row in response.data['results']]
+        self.assertEqual(outstanding[0], 100000)
+        self.assertEqual(outstanding[1:12], [round(b, 2) for b in self.expected[:11]])
+        self.assertEqual(outstanding[12:], [0, 0])
+
+        response = self.client.get(reverse('portfolio-outstanding'), {"from": "2025-13"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ScoreSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customers = []
+        for i, (on_time, count) in enumerate([(12, 1), (3, 2), (0, 7), (0, 0)]):
+            customer = make_customer(f"98765700{i:02d}")
+            for _ in range(count):
+                Loan.objects.create(
+                    customer=customer, loan_amount=100000, tenure=12, interest_rate=10,
+                    monthly_repayment=8791.59, emis_paid_on_time=on_time,
+                    start_date=date.today(), end_date=date.today() + timedelta(days=365)
+                )
+            self.customers.append(customer)
+        # A customer with loans but no summary row is scored from the loan table
+        CustomerLoanSummary.objects.filter(customer=self.customers[1]).delete()
+
+    def test_vectorized_scoring_matches_scalar(self):
+        rng = np.random.default_rng(7)
+        tenure = rng.integers(0, 100, 500)
+        factors = dict(
+            loan_count=rng.integers(0, 10, 500),
+            current_year_loans=rng.integers(0, 5, 500),
+            total_tenure=tenure,
+            on_time_emis=(tenure * rng.random(500)).astype(int),
+            total_loan_amount=rng.uniform(0, 5e6, 500),
+        )
+        approved = rng.integers(0, 5e6, 500)
+        scores = score_credit_factors_array(approved_limit=approved, **factors)
+        for i in range(500):
+            expected = score_credit_factors(
+                CreditFactors(**{k: v[i].item() for k, v in factors.items()}), approved[i]
+            )
+            self.assertEqual(scores['score'][i], expected.score)
+            self.assertEqual(scores['on_time_penalty'][i], expected.on_time_penalty)
+
+    def test_snapshot_matches_inline_scores(self):
+        run = run_score_snapshot(chunk_size=3)
+        self.assertIsNotNone(run.completed_at)
+        self.assertEqual(run.customer_count, 4)
+        for customer in self.customers:
+            snapshot = CreditScoreSnapshot.objects.get(run=run, customer=customer)
+            self.assertEqual(snapshot.score, calculate_credit_score(customer))
+
+    def test_prunes_old_runs(self):
+        for _ in range(4):
+            run_score_snapshot()
+        self.assertEqual(ScoreSnapshotRun.objects.count(), settings.CREDIT_SNAPSHOT_KEEP_RUNS)
+        self.assertEqual(CreditScoreSnapshot.objects.count(), 4 * settings.CREDIT_SNAPSHOT_KEEP_RUNS)
+
+    @override_settings(LOANS_ELIGIBILITY_FROM_SNAPSHOT=True)
+    def test_eligibility_serves_fresh_snapshot(self):
+        customer = self.customers[0]
+        run_score_snapshot()
+        self.assertIn(customer.pk, fresh_credit_scores([customer]))
+
+        data = {"customer_id": customer.pk, "loan_amount": 100000, "interest_rate": 10, "tenure": 12}
+        with mock.patch('loans.utils.calculate_credit_breakdown') as calculate:
+            response = self.client.post(reverse('check-eligibility'), data, content_type='application/json')
+        calculate.assert_not_called()
+        self.assertTrue(response.json()['approval'])
+
+        # A new loan changes the summary, so the snapshot no longer applies
+        self.client.post(reverse('create-loan'), data, content_type='application/json')
+        self.assertEqual(fresh_credit_scores([customer]), {})
+
+    @override_settings(LOANS_ELIGIBILITY_FROM_SNAPSHOT=True, CREDIT_SNAPSHOT_MAX_AGE=0)
+    def test_expired_snapshot_is_not_served(self):
+        run_score_snapshot()
+        self.assertEqual(fresh_credit_scores(self.customers), {})
+
+    @override_settings(LOANS_ELIGIBILITY_FROM_SNAPSHOT=True)
+    def test_changed_approved_limit_is_not_served(self):
+        run_score_snapshot()
+        customer = self.customers[3]
+        customer.approved_limit = 100
+        self.assertEqual(fresh_credit_scores([customer]), {})
+        self.assertIn(self.customers[2].pk, fresh_credit_scores([self.customers[2]]))
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.customer = make_customer("9876544444")
+        self.data = {
+            "customer_id": self.customer.customer_id,
+            "loan_amount": 100000,
+            "interest_rate": 10,
+            "tenure": 12
+        }
+
+    def test_server_timing_header(self):
+        response = self.client.post(reverse('check-eligibility'), self.data, format='json')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries", cache;desc="0 hits, 2 misses", app;dur=')
+
+        response = self.client.post(reverse('check-eligibility'), self.data, format='json')
+        self.assertIn('db;dur=0.00;desc="0 queries", cache;desc="2 hits, 0 misses"', response['Server-Timing'])
+
+    def test_prometheus_metrics(self):
+        self.client.post(reverse('check-eligibility'), self.data, format='json')
+        self.client.force_login(User.objects.create_user('metrics', is_staff=True))
+        response = self.client.get(reverse('prometheus-metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('# TYPE credit_http_requests_total counter', body)
+        self.assertIn('credit_http_requests_total{view="check-eligibility",status="200"} 1', body)
+        self.assertIn('credit_http_request_duration_seconds_count{view="check-eligibility"} 1', body)
+        self.assertIn('credit_cache_lookups_total{view="check-eligibility",result="miss"} 2', body)
+        self.assertIn('credit_cache_customer_misses_total 1', body)
+
+    def test_database_stats(self):
+        self.client.force_login(User.objects.create_user('metrics', is_staff=True))
+        response = self.client.get(reverse('db-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('pooled', response.data['default'])
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoints_need_staff_or_token(self):
+        for name in ('prometheus-metrics', 'cache-stats', 'db-stats'):
+            with self.subTest(name):
+                self.assertEqual(self.client.get(reverse(name)).status_code, status.HTTP_403_FORBIDDEN)
+                response = self.client.get(reverse(name), HTTP_AUTHORIZATION='Bearer wrong')
+                self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+                response = self.client.get(reverse(name), HTTP_AUTHORIZATION='Bearer scrape-secret')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.force_login(User.objects.create_user('customer-user'))
+        self.assertEqual(self.client.get(reverse('prometheus-metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(QUERY_BUDGETS={'check-eligibility': 0})
+    def test_query_budget_raises_in_tests(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.post(reverse('check-eligibility'), self.data, format='json')
+        self.assertEqual(metrics.snapshot()['counters']['view.check-eligibility.budget_exceeded'], 1)
+
+    @override_settings(QUERY_BUDGETS={'check-eligibility': 0}, QUERY_BUDGET_RAISE=False)
+    def test_query_budget_logs_when_not_raising(self):
+        with self.assertLogs('core.middleware', 'WARNING'):
+            response = self.client.post(reverse('check-eligibility'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RendererTests(APITestCase):
+    payload = {
+        "customer_id": 1,
+        "approval": True,
+        "interest_rate": 10.5,
+        "amount": Decimal("1200.50"),
+        "start_date": date(2024, 1, 31),
+        "name": "Zoë \u2028 \u2029",
+        "loans": [{"loan_id": 1, "repayments_left": None}],
+    }
+
+    def test_matches_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+        self.assertIn(b'\\u2028', FastJSONRenderer().render(self.payload))
+
+    def test_indent(self):
+        for accepted in ('application/json; indent=2', 'application/json; indent=4'):
+            self.assertEqual(
+                FastJSONRenderer().render(self.payload, accepted),
+                JSONRenderer().render(self.payload, accepted),
+            )
+
+    def test_floats_datetimes_and_wide_integers_match_json_renderer(self):
+        payloads = [
+            {"rates": [1e16, 1.5e-7, 0.00001, -2.5e-300, 1e22, 0.0001, 123.456]},
+            {"at": datetime(2024, 1, 31, 9, 30, 15, 123456, tzinfo=dt_timezone.utc), "on": date(2024, 1, 31)},
+            {"big": 2 ** 70, "negative": -(2 ** 64)},
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertIn(b'"2024-01-31T09:30:15.123456Z"', FastJSONRenderer().render(payloads[1]))
+        self.assertEqual(NDJSONRenderer().render(payloads[0]), JSONRenderer().render(payloads[0]) + b'\n')
+
+    def test_nan_renders_as_null(self):
+        # JSONRenderer refuses NaN; orjson writes null, which the docstring documents
+        self.assertEqual(FastJSONRenderer().render({"rate": float('nan')}), b'{"rate":null}')
+
+    def test_content_negotiation(self):
+        loan = Loan.objects.create(
+            customer=make_customer("9876545555", monthly_salary=50000, approved_limit=1800000),
+            loan_amount=100000, interest_rate=10, tenure=12, monthly_repayment=8792,
+            emis_paid_on_time=0, start_date=date.today(), end_date=date.today() + relativedelta(months=12),
+        )
+        url = reverse('view-loan', args=[loan.loan_id])
+
+        response = self.client.get(url, {'format': 'json'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)['loan_id'], loan.loan_id)
+
+        response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_render_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark', '--render', '--iterations', '5', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['render']), {'check-eligibility', 'view-loan', 'view-customer-loans'})
+        self.assertIn('plain_dict_us', report['register_body'])
+
+
+class ExportLoansTests(APITestCase):
+    def setUp(self):
+        metrics.reset()
+        self.staff = User.objects.create_user('exports', is_staff=True)
+        self.client.force_login(self.staff)
+        customer = make_customer("9876546666", monthly_salary=50000, approved_limit=1800000)
+        self.loans = [
+            Loan.objects.create(
+                customer=customer, loan_amount=100000, interest_rate=10, tenure=12, monthly_repayment=8792,
+                emis_paid_on_time=i, start_date=date(2020 + i, 6, 1), end_date=date(2021 + i, 6, 1),
+            )
+            for i in range(4)
+        ]
+
+    def _rows(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_streams_all_loans_in_one_query(self):
+        response = self.client.get(reverse('export-loans'))
+        with self.assertNumQueries(1):
+            rows = self._rows(response)
+        self.assertEqual([row['loan_id'] for row in rows], [loan.loan_id for loan in self.loans])
+        self.assertEqual(rows[1]['start_date'], '2021-06-01')
+        self.assertEqual(metrics.snapshot()['counters']['export.loans.rows'], 4)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('export-loans'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual([row['loan_id'] for row in rows], [loan.loan_id for loan in self.loans])
+
+    def test_start_date_range(self):
+        response = self.client.get(reverse('export-loans'), {'start_from': '2021-01-01', 'start_to': '2022-06-01'})
+        self.assertEqual([row['loan_id'] for row in self._rows(response)], [l.loan_id for l in self.loans[1:3]])
+
+        response = self.client.get(reverse('export-loans'), {'start_from': '2021-13-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('start_from', json.loads(response.content)['error'])
+
+    def test_csv(self):
+        response = self.client.get(reverse('export-loans'), HTTP_ACCEPT='text/csv')
+        self.assertIn('loans.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'loan_id,customer_id,loan_amount,tenure,interest_rate,monthly_repayment,'
+                                   'emis_paid_on_time,start_date,end_date')
+        self.assertEqual(len(list(csv.reader(lines[1:]))), 4)
+
+        response = self.client.get(reverse('export-loans'), {'start_to': 'never'}, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(response.content.startswith(b'error\r\n'))
+
+
+class LoanApplicationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.customers = [
+            make_customer(f"98765477{i:02d}", monthly_salary=40000)
+            for i in range(5)
+        ]
+
+    def submit(self, customer, loan_amount=200000, **extra):
+        return self.client.post(reverse('create-loan'), {
+            "customer_id": customer.customer_id,
+            "loan_amount": loan_amount,
+            "interest_rate": 12,
+            "tenure": 12,
+            **extra,
+        }, format='json', HTTP_PREFER='respond-async')
+
+    def test_submit_returns_202_and_polls_pending(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.submit(self.customers[0])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Preference-Applied'], 'respond-async')
+        self.assertEqual(response['Location'], response.data['status_url'])
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Loan.objects.exists())
+
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertIsNone(response.data['loan_approved'])
+        self.assertEqual(self.client.get(reverse('loan-application', args=[0])).status_code, 404)
+
+    def test_replayed_submission_keeps_its_headers(self):
+        data = {"customer_id": self.customers[0].customer_id, "loan_amount": 200000, "interest_rate": 12, "tenure": 12}
+        first, retry = [
+            self.client.post(
+                reverse('create-loan'), data, format='json',
+                HTTP_PREFER='respond-async', HTTP_IDEMPOTENCY_KEY='application-1',
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(retry.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertEqual(retry['Preference-Applied'], 'respond-async')
+        self.assertEqual(LoanApplication.objects.count(), 1)
+
+    def test_batch_applies_emi_cap_in_submission_order(self):
+        # An EMI of about 17.8k each: the first fits under half the 40000 salary, the second does not
+        first = self.submit(self.customers[0]).data['application_id']
+        second = self.submit(self.customers[0]).data['application_id']
+        other = self.submit(self.customers[1]).data['application_id']
+
+        self.assertEqual(process_loan_applications(batch_size=2), {"decided": 3, "batches": 2})
+
+        first, second, other = (self.client.get(reverse('loan-application', args=[pk])).data
+                                for pk in (first, second, other))
+        self.assertEqual((first['status'], first['loan_approved']), ('approved', True))
+        self.assertEqual((second['status'], second['message']), ('rejected', "EMI exceeds 50% of monthly salary"))
+        self.assertEqual(other['status'], 'approved')
+
+        loan = Loan.objects.get(pk=first['loan_id'])
+        self.assertEqual(loan.monthly_repayment, first['monthly_installment'])
+        self.assertTrue(LoanSchedule.objects.filter(pk=loan.pk).exists())
+        summary = CustomerLoanSummary.objects.get(customer=self.customers[0])
+        self.assertEqual((summary.loan_count, summary.total_emi), (1, loan.monthly_repayment))
+        self.assertEqual(metrics.snapshot()['counters']['loans.applications.rejected'], 1)
+
+    def test_bad_application_does_not_block_the_batch(self):
+        bad = LoanApplication.objects.create(
+            customer=self.customers[0], loan_amount=100000, interest_rate=-5, tenure=12
+        )
+        good = self.submit(self.customers[1]).data['application_id']
+
+        process_applications(10)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.message), ('failed', "interest_rate must not be negative"))
+        self.assertIsNone(bad.loan_id)
+        self.assertEqual(LoanApplication.objects.get(pk=good).status, 'approved')
+        self.assertFalse(LoanApplication.objects.filter(status='pending').exists())
+
+    def test_failed_bulk_write_falls_back_to_one_by_one(self):
+        first = self.submit(self.customers[0]).data['application_id']
+        second = self.submit(self.customers[1]).data['application_id']
+
+        save = Loan.save
+
+        def failing_save(loan, *args, **kwargs):
+            if loan.customer_id == self.customers[0].pk:
+                raise IntegrityError("simulated constraint failure")
+            return save(loan, *args, **kwargs)
+
+        with mock.patch.object(Loan.objects, 'bulk_create', side_effect=IntegrityError("bulk insert failed")), \
+                mock.patch.object(Loan, 'save', autospec=True, side_effect=failing_save), \
+                self.assertLogs('loans.applications', 'ERROR'):
+            process_applications(10)
+
+        first, second = LoanApplication.objects.get(pk=first), LoanApplication.objects.get(pk=second)
+        self.assertEqual(first.status, 'failed')
+        self.assertIn("simulated", first.message)
+        self.assertEqual(second.status, 'approved')
+        self.assertEqual(Loan.objects.get(pk=second.loan_id).customer_id, self.customers[1].pk)
+        self.assertEqual(CustomerLoanSummary.objects.get(customer=self.customers[1]).loan_count, 1)
+        self.assertFalse(Loan.objects.filter(customer=self.customers[0]).exists())
+
+    def test_batch_query_count_does_not_grow_with_batch_size(self):
+        for customer in self.customers:
+            CustomerLoanSummary.objects.create(customer=customer)
+
+        def queries(count):
+            for i in range(count):
+                self.submit(self.customers[i % len(self.customers)], loan_amount=10000)
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(len(process_applications()), count)
+            return len(context)
+
+        self.assertEqual(queries(2), queries(20))
+
+    @override_settings(LOANS_APPLICATION_CALLBACK_HOSTS=['.partner.example'])
+    def test_callback(self):
+        response = self.submit(self.customers[0], callback_url='https://hooks.partner.example/loans')
+        application_id = response.data['application_id']
+        with mock.patch('loans.tasks.send_application_callback.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                process_applications()
+        delay.assert_called_once_with(application_id)
+
+        with mock.patch('loans.applications._opener.open') as urlopen:
+            self.assertTrue(deliver_callback(application_id))
+            self.assertFalse(deliver_callback(application_id))
+        request = urlopen.call_args.args[0]
+        self.assertEqual(request.full_url, 'https://hooks.partner.example/loans')
+        self.assertEqual(json.loads(request.data)['status'], 'approved')
+        self.assertEqual(urlopen.call_count, 1)
+        self.assertIsNotNone(LoanApplication.objects.get(pk=application_id).callback_delivered_at)
+
+    @override_settings(LOANS_APPLICATION_CALLBACK_HOSTS=['.partner.example'])
+    def test_callback_host_must_be_allowed(self):
+        for url in ('http://127.0.0.1/hook', 'http://redis:6379/', 'http://169.254.169.254/latest/meta-data/',
+                    'https://partner.example.evil.com/hook'):
+            response = self.submit(self.customers[0], callback_url=url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+            self.assertIn('callback_url', response.data)
+        self.assertFalse(LoanApplication.objects.exists())
+
+    @override_settings(LOANS_APPLICATION_CALLBACK_HOSTS=['.partner.example'])
+    def test_callback_retries_only_server_errors(self):
+        application_id = self.submit(
+            self.customers[0], callback_url='https://hooks.partner.example/loans'
+        ).data['application_id']
+        process_applications()
+
+        def http_error(code):
+            return urllib.error.HTTPError('https://hooks.partner.example/loans', code, 'error', {}, None)
+
+        with mock.patch('loans.applications._opener.open', side_effect=http_error(503)):
+            with self.assertRaises(urllib.error.HTTPError):
+                deliver_callback(application_id)
+        with mock.patch('loans.applications._opener.open', side_effect=http_error(404)):
+            self.assertFalse(deliver_callback(application_id))
+        self.assertEqual(metrics.snapshot()['counters']['loans.applications.callbacks_rejected'], 1)
+
+        with override_settings(LOANS_APPLICATION_CALLBACK_HOSTS=[]), \
+                mock.patch('loans.applications._opener.open') as urlopen:
+            self.assertFalse(deliver_callback(application_id))
+        urlopen.assert_not_called()
+
+
+class LoanConstraintTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer("9876533333")
+
+    def test_rejects_invalid_loans(self):
+        for overrides in ({"loan_amount": 0}, {"tenure": 0}, {"emis_paid_on_time": 13}):
+            values = dict(
+                customer=self.customer, loan_amount=100000, tenure=12, interest_rate=10,
+                monthly_repayment=8792, start_date=date.today(), end_date=date.today()
+            )
+            values.update(overrides)
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    Loan.objects.create(**values)
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN plans are PostgreSQL specific")
+class LoanIndexUsageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customers = Customer.objects.bulk_create([
+            Customer(
+                first_name="Index", last_name=str(i), phone_number=f"80000{i:05d}",
+                monthly_salary=50000, approved_limit=2000000
+            )
+            for i in range(200)
+        ])
+        Loan.objects.bulk_create([
+            Loan(
+                customer=customer, loan_amount=100000, tenure=12, interest_rate=10,
+                monthly_repayment=8792, emis_paid_on_time=6,
+                start_date=date(2015 + j, 1, 1), end_date=date(2016 + j, 1, 1)
+            )
+            for customer in customers
+            for j in range(10)
+        ])
+        cls.customer = customers[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE loans_loan')
+
+    def plan(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_scoring_aggregate_uses_customer_indexes(self):
+        queryset = (
+            Loan.objects.filter(customer=self.customer)
+            .values('customer_id')
+            .annotate(**credit_factor_aggregates(2020))
+        )
+        plan = self.plan(queryset)
+        self.assertRegex(plan, 'loan_customer_loan_idx|loan_customer_start_idx')
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_emi_sum_is_index_only(self):
+        queryset = Loan.objects.filter(customer=self.customer).values('customer_id').annotate(
+            total_emi=Sum('monthly_repayment')
+        )
+        self.assertIn('Index Only Scan using loan_customer_loan_idx', self.plan(queryset))
+
+    def test_current_year_count_uses_date_range(self):
+        queryset = Loan.objects.filter(
+            customer=self.customer, start_date__gte=date(2020, 1, 1), start_date__lt=date(2021, 1, 1)
+        ).values('loan_id')
+        self.assertIn('loan_customer_start_idx', self.plan(queryset))
+
+    def test_keyset_page_uses_customer_loan_index(self):
+        queryset = (
+            Loan.objects.filter(customer=self.customer, loan_id__gt=0)
+            .order_by('loan_id')
+            .values('loan_id', 'loan_amount', 'interest_rate')[:100]
+        )
+        self.assertIn('loan_customer_loan_idx', self.plan(queryset))
@@ -1,9 +1,24 @@
 from django.urls import path
-from .views import CheckEligibilityView, CreateLoanView, ViewCustomerLoans, ViewLoanDetail
+from django.views.decorators.csrf import csrf_exempt
+from .async_views import AsyncCheckEligibilityView, AsyncCreateLoanView, AsyncViewLoanDetail
+from .views import (
+    CheckEligibilityBatchView, CheckEligibilityView, CreateLoanView, ExportLoansView, LoanApplicationView,
+    PortfolioOutstandingView, RecordPaymentView, ViewCustomerLoans, ViewLoanDetail,
+)
 
 urlpatterns = [
     path('check-eligibility/', CheckEligibilityView.as_view(), name='check-eligibility'),
+    path('check-eligibility/batch/', CheckEligibilityBatchView.as_view(), name='check-eligibility-batch'),
     path('create-loan/', CreateLoanView.as_view(), name='create-loan'),
+    path('applications/<int:application_id>/', LoanApplicationView.as_view(), name='loan-application'),
     path('view-loan/<int:loan_id>/', ViewLoanDetail.as_view(), name='view-loan'),
     path('view-loans/<int:customer_id>/', ViewCustomerLoans.as_view(), name='view-customer-loans'),
+    path('record-payment/<int:loan_id>/', RecordPaymentView.as_view(), name='record-payment'),
+    path('portfolio/outstanding/', PortfolioOutstandingView.as_view(), name='portfolio-outstanding'),
+    path('export/', ExportLoansView.as_view(), name='export-loans'),
+
+    # Async variants for ASGI deployments
+    path('async/check-eligibility/', csrf_exempt(AsyncCheckEligibilityView.as_view()), name='async-check-eligibility'),
+    path('async/create-loan/', csrf_exempt(AsyncCreateLoanView.as_view()), name='async-create-loan'),
+    path('async/view-loan/<int:loan_id>/', AsyncViewLoanDetail.as_view(), name='async-view-loan'),
 ]
@@ -1,6 +1,11 @@
 import math
-from datetime import datetime
-from loans.models import Loan
+from dataclasses import dataclass
+from datetime import date, datetime
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.shortcuts import get_object_or_404
+from core.cache import credit_key, loan_key, read_through
+from loans.models import CustomerLoanSummary, Loan
 
 def calculate_emi(principal, annual_interest_rate, tenure_months):
     """
@@ -17,33 +22,288 @@ def calculate_emi(principal, annual_interest_rate, tenure_months):
     emi = principal * r * math.pow(1 + r, n) / (math.pow(1 + r, n) - 1)
     return round(emi, 2)
 
-def calculate_credit_score(customer):
-    score = 100
-    now = datetime.now()
 
-    loans = Loan.objects.filter(customer=customer)
+@dataclass(frozen=True)
+class CreditFactors:
+    """Aggregated loan history of a single customer."""
+    loan_count: int = 0
+    current_year_loans: int = 0
+    total_tenure: int = 0
+    on_time_emis: int = 0
+    total_loan_amount: float = 0.0
+    total_emi: float = 0.0
+
+    @property
+    def on_time_ratio(self):
+        if self.total_tenure > 0:
+            return self.on_time_emis / self.total_tenure
+        return 0
+
+
+@dataclass(frozen=True)
+class CreditScore:
+    """Credit score together with the factors and deductions that produced it."""
+    score: int
+    factors: CreditFactors
+    on_time_penalty: int = 0
+    loan_count_penalty: int = 0
+    current_year_penalty: int = 0
+    over_approved_limit: bool = False
+
+
+def credit_factor_aggregates(year):
+    """
+    Aggregate expressions for every scoring factor, so one query covers
+    a single customer (aggregate) or many (values('customer_id').annotate).
+    """
+    return {
+        'loan_count': Count('loan_id'),
+        # A plain date range (rather than start_date__year) so the
+        # (customer_id, start_date) index applies
+        'current_year_loans': Count(
+            'loan_id', filter=Q(start_date__gte=date(year, 1, 1), start_date__lt=date(year + 1, 1, 1))
+        ),
+        'total_tenure': Sum('tenure'),
+        'on_time_emis': Sum('emis_paid_on_time'),
+        'total_loan_amount': Sum('loan_amount'),
+        'total_emi': Sum('monthly_repayment'),
+    }
+
+
+def credit_factors_from_row(row):
+    """Build CreditFactors from an aggregate row, treating NULL sums as zero."""
+    return CreditFactors(
+        loan_count=row.get('loan_count') or 0,
+        current_year_loans=row.get('current_year_loans') or 0,
+        total_tenure=row.get('total_tenure') or 0,
+        on_time_emis=row.get('on_time_emis') or 0,
+        total_loan_amount=row.get('total_loan_amount') or 0.0,
+        total_emi=row.get('total_emi') or 0.0,
+    )
+
+
+def credit_factors_from_summary(summary, year):
+    return CreditFactors(
+        loan_count=summary.loan_count,
+        current_year_loans=summary.loans_per_year.get(str(year), 0),
+        total_tenure=summary.total_tenure,
+        on_time_emis=summary.on_time_emis,
+        total_loan_amount=summary.total_loan_amount,
+        total_emi=summary.total_emi,
+    )
+
+
+def get_credit_factors(customer, year=None):
+    """
+    Read the factors from the customer's loan summary, falling back to
+    aggregating the loan table when no summary row exists yet.
+    """
+    year = year or datetime.now().year
+    summary = CustomerLoanSummary.objects.filter(customer=customer).first()
+    if summary is not None:
+        return credit_factors_from_summary(summary, year)
+    row = Loan.objects.filter(customer=customer).aggregate(**credit_factor_aggregates(year))
+    return credit_factors_from_row(row)
+
+
+async def aget_credit_factors(customer, year=None):
+    """Async ORM counterpart of get_credit_factors."""
+    year = year or datetime.now().year
+    summary = await CustomerLoanSummary.objects.filter(customer=customer).afirst()
+    if summary is not None:
+        return credit_factors_from_summary(summary, year)
+    row = await Loan.objects.filter(customer=customer).aaggregate(**credit_factor_aggregates(year))
+    return credit_factors_from_row(row)
+
+
+def get_credit_factors_bulk(customer_ids, year=None):
+    """
+    Credit factors for many customers: one query for their summaries plus
+    one grouped aggregate for any customer without a summary row.
+    Customers without loans are returned with empty factors.
+    """
+    year = year or datetime.now().year
+    factors = {customer_id: CreditFactors() for customer_id in customer_ids}
+    missing = set(factors)
+    for summary in CustomerLoanSummary.objects.filter(customer_id__in=customer_ids):
+        factors[summary.customer_id] = credit_factors_from_summary(summary, year)
+        missing.discard(summary.customer_id)
+    if not missing:
+        return factors
+
+    rows = (
+        Loan.objects.filter(customer_id__in=missing)
+        .values('customer_id')
+        .annotate(**credit_factor_aggregates(year))
+        .order_by()
+    )
+    for row in rows:
+        factors[row['customer_id']] = credit_factors_from_row(row)
+    return factors
+
+
+def score_credit_factors(factors, approved_limit):
+    score = 100
 
     # 1. Past loans paid on time
-    on_time_ratio = 0
-    if loans.exists():
-        total_emis = sum([loan.tenure for loan in loans])
-        on_time_emis = sum([loan.emis_paid_on_time for loan in loans])
-        if total_emis > 0:
-            on_time_ratio = on_time_emis / total_emis
-        score -= int((1 - on_time_ratio) * 40)  # weight 40 points
+    on_time_penalty = 0
+    if factors.loan_count > 0:
+        on_time_penalty = int((1 - factors.on_time_ratio) * 40)  # weight 40 points
+    score -= on_time_penalty
 
     # 2. Number of loans taken in the past
-    if loans.count() > 5:
-        score -= 10
+    loan_count_penalty = 10 if factors.loan_count > 5 else 0
+    score -= loan_count_penalty
 
     # 3. Loan activity in current year
-    current_year_loans = loans.filter(start_date__year=now.year)
-    if current_year_loans.count() > 2:
-        score -= 10
+    current_year_penalty = 10 if factors.current_year_loans > 2 else 0
+    score -= current_year_penalty
 
     # 4. Loan approved volume
-    total_loan_amount = sum([loan.loan_amount for loan in loans])
-    if total_loan_amount > customer.approved_limit:
+    over_approved_limit = factors.total_loan_amount > approved_limit
+    if over_approved_limit:
         score = 0
 
-    return max(score, 0)
+    return CreditScore(
+        score=max(score, 0),
+        factors=factors,
+        on_time_penalty=on_time_penalty,
+        loan_count_penalty=loan_count_penalty,
+        current_year_penalty=current_year_penalty,
+        over_approved_limit=over_approved_limit,
+    )
+
+
+def calculate_credit_breakdown(customer):
+    return score_credit_factors(get_credit_factors(customer), customer.approved_limit)
+
+
+def load_credit_breakdown(customer):
+    """The customer's valid score snapshot when enabled, else calculate_credit_breakdown."""
+    if settings.LOANS_ELIGIBILITY_FROM_SNAPSHOT:
+        from .snapshots import fresh_credit_scores
+
+        credit = fresh_credit_scores([customer]).get(customer.pk)
+        if credit is not None:
+            return credit
+    return calculate_credit_breakdown(customer)
+
+
+def get_credit_breakdown(customer):
+    """load_credit_breakdown via the read-through cache, keyed per customer and year."""
+    return read_through(
+        'credit', credit_key(customer.pk), lambda: load_credit_breakdown(customer)
+    )
+
+
+def calculate_credit_score(customer):
+    return calculate_credit_breakdown(customer).score
+
+
+@dataclass(frozen=True)
+class LoanDecision:
+    """Outcome of evaluating a loan request against a customer's credit."""
+    approved: bool
+    interest_rate: float
+    corrected_interest_rate: float
+    monthly_installment: float
+    reason: str = ''
+
+
+def validate_loan_terms(loan_amount, tenure):
+    if loan_amount <= 0:
+        return "loan_amount must be greater than 0"
+    if tenure <= 0:
+        return "tenure must be greater than 0"
+    return None
+
+
+def corrected_interest_rate(credit_score, requested_interest):
+    """
+    Minimum interest rate allowed for the credit score band,
+    or None when the score is too low to lend at all.
+    """
+    if credit_score > 50:
+        return requested_interest
+    elif 30 < credit_score <= 50:
+        return max(requested_interest, 12)
+    elif 10 < credit_score <= 30:
+        return max(requested_interest, 16)
+    return None
+
+
+def evaluate_loan(customer, credit, loan_amount, interest_rate, tenure):
+    min_rate = corrected_interest_rate(credit.score, interest_rate)
+    if min_rate is None:
+        return LoanDecision(False, interest_rate, interest_rate, 0, "Credit score too low")
+
+    monthly_installment = calculate_emi(loan_amount, min_rate, tenure)
+
+    # Check EMI cap
+    if credit.factors.total_emi + monthly_installment > 0.5 * customer.monthly_salary:
+        return LoanDecision(
+            False, interest_rate, min_rate, monthly_installment,
+            "EMI exceeds 50% of monthly salary"
+        )
+
+    return LoanDecision(True, interest_rate, min_rate, monthly_installment)
+
+
+def eligibility_response(customer_id, tenure, decision, quote=None):
+    response_data = {
+        "customer_id": customer_id,
+        "approval": decision.approved,
+        "interest_rate": decision.interest_rate,
+        "corrected_interest_rate": decision.corrected_interest_rate,
+        "tenure": tenure,
+        "monthly_installment": decision.monthly_installment,
+    }
+    if decision.reason:
+        response_data["reason"] = decision.reason
+    if quote:
+        response_data["quote"] = quote
+    return response_data
+
+
+# Columns read for a loan detail response; everything else is deferred
+LOAN_DETAIL_FIELDS = [
+    'loan_id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure',
+    'customer__customer_id', 'customer__first_name', 'customer__last_name',
+    'customer__phone_number', 'customer__age',
+]
+
+
+def loan_detail_queryset():
+    """Loan joined to its customer in one query, reading only the response columns."""
+    return Loan.objects.select_related('customer').only(*LOAN_DETAIL_FIELDS)
+
+
+def loan_detail_response(loan):
+    customer = loan.customer
+    return {
+        "loan_id": loan.loan_id,
+        "customer": {
+            "customer_id": customer.customer_id,
+            "first_name": customer.first_name,
+            "last_name": customer.last_name,
+            "phone_number": customer.phone_number,
+            "age": customer.age
+        },
+        "loan_amount": loan.loan_amount,
+        "interest_rate": loan.interest_rate,
+        "monthly_installment": loan.monthly_repayment,
+        "tenure": loan.tenure
+    }
+
+
+def get_loan_detail(loan_id):
+    """
+    Loan detail response body, via the read-through cache when
+    LOANS_DETAIL_CACHE is on. Raises Http404 for unknown loans.
+    """
+    def load():
+        return loan_detail_response(get_object_or_404(loan_detail_queryset(), pk=loan_id))
+
+    if not settings.LOANS_DETAIL_CACHE:
+        return load()
+    return read_through('loan', loan_key(loan_id), load)
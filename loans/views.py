@@ -1,18 +1,32 @@
+from datetime import datetime
+from django.conf import settings
+from django.db.models import F
+from django.shortcuts import get_object_or_404
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.utils.urls import replace_query_param
+from core.exports import export_response
+from core.idempotency import idempotent
+from core.renderers import CSVRenderer, NDJSONRenderer
 from customers.models import Customer
+from customers.utils import get_customer
+from .applications import application_response, submit_application
+from .parsers import NDJSONParser
+from .quotes import issue_quote
+from .schedules import PaymentError, portfolio_outstanding, record_payment
+from .snapshots import fresh_credit_scores
+from .services import create_loan
 from .serializers import CheckEligibilityRequestSerializer, CheckEligibilityResponseSerializer
 from .serializers import CreateLoanRequestSerializer, CreateLoanResponseSerializer
-from .utils import calculate_emi, calculate_credit_score
-from loans.models import Loan
-from django.shortcuts import get_object_or_404
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from loans.models import Loan
-from customers.models import Customer
-from datetime import datetime, timedelta
+from .serializers import RecordPaymentRequestSerializer
+from .utils import (
+    eligibility_response, evaluate_loan, get_credit_breakdown,
+    get_credit_factors_bulk, get_loan_detail, score_credit_factors, validate_loan_terms,
+)
+from loans.models import Loan, LoanApplication
 
 class CheckEligibilityView(APIView):
     def get(self, request):
@@ -24,188 +38,312 @@ class CheckEligibilityView(APIView):
         data = serializer.validated_data
 
         # Validate loan_amount and tenure
-        if data['loan_amount'] <= 0:
+        error = validate_loan_terms(data['loan_amount'], data['tenure'])
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            customer = get_customer(data['customer_id'])
+        except Customer.DoesNotExist:
+            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        credit = get_credit_breakdown(customer)
+        decision = evaluate_loan(
+            customer, credit, data['loan_amount'], data['interest_rate'], data['tenure']
+        )
+        quote = None
+        if decision.approved:
+            quote = issue_quote(
+                customer, credit.factors, datetime.now().year,
+                data['loan_amount'], data['interest_rate'], data['tenure'], decision
+            )
+        return Response(
+            eligibility_response(customer.customer_id, data['tenure'], decision, quote),
+            status=status.HTTP_200_OK
+        )
+
+
+class CheckEligibilityBatchView(APIView):
+    """
+    Scores a list of applications in one call. Accepts a JSON array
+    (or {"applications": [...]}) or an NDJSON body, and returns one
+    {"status", "response"} entry per application, in order, with the
+    same body the single check-eligibility endpoint would return.
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        applications = request.data
+        if isinstance(applications, dict):
+            applications = applications.get('applications')
+        if not isinstance(applications, list):
             return Response(
-                {"error": "loan_amount must be greater than 0"},
+                {"error": "Expected a list of applications"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if data['tenure'] <= 0:
+        max_size = settings.LOANS_ELIGIBILITY_BATCH_MAX_SIZE
+        if len(applications) > max_size:
             return Response(
-                {"error": "tenure must be greater than 0"},
+                {"error": f"A batch may contain at most {max_size} applications"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            customer = Customer.objects.get(pk=data['customer_id'])
-        except Customer.DoesNotExist:
-            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        credit_score = calculate_credit_score(customer)
-        requested_interest = data['interest_rate']
-
-        # Determine minimum interest rate based on score
-        if credit_score > 50:
-            min_rate = requested_interest
-            approved = True
-        elif 30 < credit_score <= 50:
-            min_rate = max(requested_interest, 12)
-            approved = True
-        elif 10 < credit_score <= 30:
-            min_rate = max(requested_interest, 16)
-            approved = True
-        else:
-            return Response({
-                "customer_id": customer.customer_id,
-                "approval": False,
-                "interest_rate": requested_interest,
-                "corrected_interest_rate": requested_interest,
-                "tenure": data['tenure'],
-                "monthly_installment": 0,
-                "reason": "Credit score too low"
-            }, status=status.HTTP_200_OK)
+        results = [None] * len(applications)
+        valid = []
+        for index, application in enumerate(applications):
+            serializer = CheckEligibilityRequestSerializer(data=application)
+            if not serializer.is_valid():
+                results[index] = (status.HTTP_400_BAD_REQUEST, serializer.errors)
+                continue
+            data = serializer.validated_data
+            error = validate_loan_terms(data['loan_amount'], data['tenure'])
+            if error:
+                results[index] = (status.HTTP_400_BAD_REQUEST, {"error": error})
+                continue
+            valid.append((index, data))
 
-        # EMI calculation
-        monthly_installment = calculate_emi(data['loan_amount'], min_rate, data['tenure'])
+        # Load every referenced customer and their loan aggregates in bulk
+        customer_ids = {data['customer_id'] for _, data in valid}
+        customers = Customer.objects.in_bulk(customer_ids)
+        year = datetime.now().year
+        credits = {}
+        if settings.LOANS_ELIGIBILITY_FROM_SNAPSHOT:
+            credits = fresh_credit_scores(customers.values(), year)
+        factors = get_credit_factors_bulk([pk for pk in customers if pk not in credits], year)
 
-        # Check EMI cap
-        all_emis = sum(l.monthly_repayment for l in Loan.objects.filter(customer=customer))
-        if all_emis + monthly_installment > 0.5 * customer.monthly_salary:
-            return Response({
-                "customer_id": customer.customer_id,
-                "approval": False,
-                "interest_rate": requested_interest,
-                "corrected_interest_rate": min_rate,
-                "tenure": data['tenure'],
-                "monthly_installment": monthly_installment,
-                "reason": "EMI exceeds 50% of monthly salary"
-            }, status=status.HTTP_200_OK)
+        for index, data in valid:
+            customer = customers.get(data['customer_id'])
+            if customer is None:
+                results[index] = (status.HTTP_404_NOT_FOUND, {"error": "Customer not found"})
+                continue
+            if customer.pk not in credits:
+                credits[customer.pk] = score_credit_factors(factors[customer.pk], customer.approved_limit)
+            decision = evaluate_loan(
+                customer, credits[customer.pk],
+                data['loan_amount'], data['interest_rate'], data['tenure']
+            )
+            quote = None
+            if decision.approved:
+                quote = issue_quote(
+                    customer, credits[customer.pk].factors, year,
+                    data['loan_amount'], data['interest_rate'], data['tenure'], decision
+                )
+            results[index] = (
+                status.HTTP_200_OK,
+                eligibility_response(customer.customer_id, data['tenure'], decision, quote)
+            )
 
         return Response({
-            "customer_id": customer.customer_id,
-            "approval": approved,
-            "interest_rate": requested_interest,
-            "corrected_interest_rate": min_rate,
-            "tenure": data['tenure'],
-            "monthly_installment": monthly_installment
+            "results": [
+                {"status": item_status, "response": item_response}
+                for item_status, item_response in results
+            ]
         }, status=status.HTTP_200_OK)
 
 
 class CreateLoanView(APIView):
+    @idempotent('create-loan')
     def post(self, request):
         serializer = CreateLoanRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
         # Validate loan_amount and tenure
-        if data['loan_amount'] <= 0:
-            return Response(
-                {"error": "loan_amount must be greater than 0"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        if data['tenure'] <= 0:
-            return Response(
-                {"error": "tenure must be greater than 0"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        error = validate_loan_terms(data['loan_amount'], data['tenure'])
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            customer = Customer.objects.get(pk=data['customer_id'])
+            customer = get_customer(data['customer_id'])
         except Customer.DoesNotExist:
             return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # 1. Calculate credit score
-        credit_score = calculate_credit_score(customer)
-        requested_interest = data['interest_rate']
-
-        # Determine min interest rate
-        if credit_score > 50:
-            min_rate = requested_interest
-        elif 30 < credit_score <= 50:
-            min_rate = max(requested_interest, 12)
-        elif 10 < credit_score <= 30:
-            min_rate = max(requested_interest, 16)
-        else:
-            return Response({
-                "loan_id": None,
-                "customer_id": customer.customer_id,
-                "loan_approved": False,
-                "message": "Credit score too low",
-                "monthly_installment": 0
-            }, status=status.HTTP_200_OK)
-
-        # EMI calculation
-        monthly_installment = calculate_emi(data['loan_amount'], min_rate, data['tenure'])
+        if 'respond-async' in request.headers.get('Prefer', ''):
+            # Queue the application for a worker instead of deciding it here
+            application = submit_application(
+                customer, data['loan_amount'], data['interest_rate'], data['tenure'],
+                data.get('quote'), data.get('callback_url'),
+            )
+            body = application_response(application)
+            return Response(body, status=status.HTTP_202_ACCEPTED, headers={
+                "Location": body["status_url"], "Preference-Applied": "respond-async",
+            })
 
-        # Check EMI cap
-        all_emis = sum(l.monthly_repayment for l in Loan.objects.filter(customer=customer))
-        if all_emis + monthly_installment > 0.5 * customer.monthly_salary:
+        # Score, apply the score band / EMI cap and insert under the customer's lock
+        loan, decision = create_loan(
+            customer, data['loan_amount'], data['interest_rate'], data['tenure'], data.get('quote')
+        )
+        if loan is None:
             return Response({
                 "loan_id": None,
                 "customer_id": customer.customer_id,
                 "loan_approved": False,
-                "message": "EMI exceeds 50% of monthly salary",
-                "monthly_installment": monthly_installment
+                "message": decision.reason,
+                "monthly_installment": decision.monthly_installment
             }, status=status.HTTP_200_OK)
 
-        # 2. Create loan record
-        start_date = datetime.today().date()
-        end_date = start_date + timedelta(days=(data['tenure'] * 30))  # approx tenure in days
-        loan = Loan.objects.create(
-            customer=customer,
-            loan_amount=data['loan_amount'],
-            tenure=data['tenure'],
-            interest_rate=min_rate,
-            monthly_repayment=monthly_installment,
-            emis_paid_on_time=0,
-            start_date=start_date,
-            end_date=end_date,
-        )
-
         return Response({
             "loan_id": loan.loan_id,
             "customer_id": customer.customer_id,
             "loan_approved": True,
             "message": "Loan approved",
-            "monthly_installment": monthly_installment
+            "monthly_installment": decision.monthly_installment
         }, status=status.HTTP_201_CREATED)
 
 
+class LoanApplicationView(APIView):
+    """Status of a create-loan request queued with Prefer: respond-async."""
+
+    def get(self, request, application_id):
+        application = get_object_or_404(LoanApplication, pk=application_id)
+        return Response(application_response(application), status=status.HTTP_200_OK)
+
+
 class ViewLoanDetail(APIView):
     def get(self, request, loan_id):
-        loan = get_object_or_404(Loan, pk=loan_id)
-        customer = loan.customer
-
-        response_data = {
-            "loan_id": loan.loan_id,
-            "customer": {
-                "customer_id": customer.customer_id,
-                "first_name": customer.first_name,
-                "last_name": customer.last_name,
-                "phone_number": customer.phone_number,
-                "age": customer.age
-            },
-            "loan_amount": loan.loan_amount,
-            "interest_rate": loan.interest_rate,
-            "monthly_installment": loan.monthly_repayment,
-            "tenure": loan.tenure
-        }
-        return Response(response_data, status=status.HTTP_200_OK)
+        return Response(get_loan_detail(loan_id), status=status.HTTP_200_OK)
     
 
 class ViewCustomerLoans(APIView):
+    """
+    Lists a customer's loans ordered by loan_id, one page at a time.
+    ?limit= sets the page size, ?cursor= continues after the given loan_id
+    (the next cursor is returned in the X-Next-Cursor and Link headers) and
+    ?fields= selects a comma-separated subset of the response fields.
+    """
+    # Response field -> model field or SQL expression
+    fields = {
+        "loan_id": "loan_id",
+        "loan_amount": "loan_amount",
+        "interest_rate": "interest_rate",
+        "monthly_installment": F('monthly_repayment'),
+        "repayments_left": F('tenure') - F('emis_paid_on_time'),
+    }
+
     def get(self, request, customer_id):
-        customer = get_object_or_404(Customer, pk=customer_id)
-        loans = Loan.objects.filter(customer=customer)
-
-        response_data = []
-        for loan in loans:
-            repayments_left = loan.tenure - loan.emis_paid_on_time
-            response_data.append({
-                "loan_id": loan.loan_id,
-                "loan_amount": loan.loan_amount,
-                "interest_rate": loan.interest_rate,
-                "monthly_installment": loan.monthly_repayment,
-                "repayments_left": repayments_left
-            })
+        try:
+            limit = int(request.query_params.get('limit', settings.LOANS_PAGE_SIZE))
+            cursor = request.query_params.get('cursor')
+            cursor = int(cursor) if cursor else None
+        except ValueError:
+            return Response(
+                {"error": "limit and cursor must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= limit <= settings.LOANS_MAX_PAGE_SIZE:
+            return Response(
+                {"error": f"limit must be between 1 and {settings.LOANS_MAX_PAGE_SIZE}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        requested = request.query_params.get('fields')
+        fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else list(self.fields)
+        unknown = [f for f in fields if f not in self.fields]
+        if unknown or not fields:
+            return Response(
+                {"error": f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(self.fields)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Only the requested columns are selected; loan_id is always needed for the cursor
+        columns = [self.fields[f] for f in fields if isinstance(self.fields[f], str)]
+        expressions = {f: self.fields[f] for f in fields if not isinstance(self.fields[f], str)}
+        loans = Loan.objects.filter(customer_id=customer_id)
+        if cursor is not None:
+            loans = loans.filter(loan_id__gt=cursor)
+        rows = list(
+            loans.order_by('loan_id')
+            .values('loan_id', *[c for c in columns if c != 'loan_id'], **expressions)[:limit + 1]
+        )
+
+        if not rows and not Customer.objects.filter(pk=customer_id).exists():
+            return Response({"detail": "No Customer matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]['loan_id']
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+            headers = {"X-Next-Cursor": str(next_cursor), "Link": f'<{next_url}>; rel="next"'}
+
+        response_data = [{f: row[f] for f in fields} for row in rows]
+        return Response(response_data, status=status.HTTP_200_OK, headers=headers)
+
 
-        return Response(response_data, status=status.HTTP_200_OK)
+class RecordPaymentView(APIView):
+    @idempotent('record-payment')
+    def post(self, request, loan_id):
+        serializer = RecordPaymentRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            schedule = record_payment(loan_id, **serializer.validated_data)
+        except Loan.DoesNotExist:
+            return Response({"detail": "No Loan matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+        except PaymentError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        loan = schedule.loan
+        return Response({
+            "loan_id": loan.loan_id,
+            "installments_paid": schedule.installments_paid,
+            "emis_paid_on_time": loan.emis_paid_on_time,
+            "repayments_left": loan.tenure - schedule.installments_paid,
+            "outstanding_principal": round(schedule.outstanding_principal, 2),
+        }, status=status.HTTP_200_OK)
+
+
+class PortfolioOutstandingView(APIView):
+    """Scheduled outstanding balance of all loans for each month in ?from=YYYY-MM&months=N."""
+
+    def get(self, request):
+        try:
+            first_month = datetime.strptime(request.query_params.get('from', ''), '%Y-%m').date()
+        except ValueError:
+            return Response({"error": "from must be a month in YYYY-MM format"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            months = int(request.query_params.get('months', 12))
+        except ValueError:
+            months = 0
+        if not 1 <= months <= settings.LOANS_PORTFOLIO_MAX_MONTHS:
+            return Response(
+                {"error": f"months must be between 1 and {settings.LOANS_PORTFOLIO_MAX_MONTHS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({"results": portfolio_outstanding(first_month, months)}, status=status.HTTP_200_OK)
+
+
+class ExportLoansView(APIView):
+    """
+    Streams every loan, ordered by loan_id, as NDJSON (default) or CSV
+    (?format=csv or Accept: text/csv). ?start_from= and ?start_to=
+    (YYYY-MM-DD, inclusive) filter on start date; ?after= resumes after a
+    loan_id.
+    """
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    # Bulk personal and financial data: staff only
+    permission_classes = [IsAdminUser]
+    fields = [
+        'loan_id', 'customer_id', 'loan_amount', 'tenure', 'interest_rate', 'monthly_repayment',
+        'emis_paid_on_time', 'start_date', 'end_date',
+    ]
+
+    def get(self, request):
+        loans = Loan.objects.order_by('loan_id')
+        try:
+            for param, lookup in (('start_from', 'start_date__gte'), ('start_to', 'start_date__lte')):
+                value = request.query_params.get(param)
+                if value:
+                    loans = loans.filter(**{lookup: datetime.strptime(value, '%Y-%m-%d').date()})
+        except ValueError:
+            return Response(
+                {"error": "start_from and start_to must be dates in YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        after = request.query_params.get('after')
+        if after:
+            try:
+                loans = loans.filter(loan_id__gt=int(after))
+            except ValueError:
+                return Response({"error": "after must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(request, loans, self.fields, 'loans')